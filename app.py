@@ -1,530 +1,1805 @@
-from flask import Flask, render_template, request, jsonify, send_file
-import google.generativeai as genai
+import startup
+
+with startup.timed('import', 'flask'):
+    from flask import Flask, Request, Response, abort, render_template, request, jsonify, send_file, stream_with_context
+import asyncio
+import functools
+import logging
 import os
-import pdfplumber
-from docx import Document
+import gzip
+import hmac
 import io
 import json
-from datetime import datetime
+import sqlite3
+import tempfile
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
 from dotenv import load_dotenv
 
-# Load environment variables
+# Load environment variables (before the local modules below read their settings)
 load_dotenv()
 
+from chunking import iter_chunks, section_heading, split_into_clauses, split_into_sections
+from compaction import compact, fit_to_budget, prompt_token_budget
+from compare import compare_versions, render_changes
+from draft_store import DraftStore, diff_requirements, sections_touched
+from export import COMPRESSIBLE_FORMATS, EXPORT_MIMETYPES, iter_pdf, load_renderers, render_docx, render_txt
+from extraction import (
+    PageRangeError, extract_text_from_docx, extract_text_from_pdf, extract_text_from_txt, load_parsers,
+    parse_page_range
+)
+from extraction_cache import extraction_cache_from_env
+from gemini_client import UpstreamBusyError
+from job_queue import JobQueue, QueueFullError, check_job
+from metrics import COMPACTION_TOKENS_SAVED, NEAR_DUPLICATE_REUSES, REGISTRY, current_timer, stage, track_request
+from model_router import model_router_from_env
+from near_duplicate_index import clause_hashes, clause_headings, minhash_signature, near_duplicate_index_from_env
+from prompts import ANALYSIS_TEMPLATES, DRAFT_TEMPLATES, LEGAL_CONTEXT, PromptRegistry, estimate_tokens
+from result_cache import make_cache_key, result_cache_from_env
+from retrieval import ClauseIndex, ClauseIndexCache, build_question_context
+from sessions import SessionStore, summarize_history
+
+logging.basicConfig(
+    level=os.getenv('LOG_LEVEL', 'INFO').upper(),
+    format='%(asctime)s %(levelname)s %(name)s: %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Uploads above UPLOAD_SPOOL_KB are spooled to a temporary file instead of
+# memory; request bodies above MAX_UPLOAD_MB are rejected with HTTP 413
+UPLOAD_SPOOL_BYTES = int(os.getenv('UPLOAD_SPOOL_KB', '1024')) * 1024
+MAX_UPLOAD_BYTES = int(os.getenv('MAX_UPLOAD_MB', '32')) * 1024 * 1024
+
+class SpooledRequest(Request):
+    """Request whose file uploads stay in memory only up to UPLOAD_SPOOL_BYTES"""
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_BYTES, mode='rb+')
+
 app = Flask(__name__)
+app.request_class = SpooledRequest
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES
 
-# Configure Gemini
+# Gemini is configured when the SDK is first loaded (see LegalAssistant.load)
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
 if not GEMINI_API_KEY:
-    print("Warning: GEMINI_API_KEY not found in environment variables")
-genai.configure(api_key=GEMINI_API_KEY)
+    logger.warning("GEMINI_API_KEY not found in environment variables")
+
+# Default model; GEMINI_MODEL_ROUTES can pick others per task and input size
+# (see model_router.py). Single analysis prompts are cut on paragraph or
+# sentence boundaries to fit the token budget of the models they are routed to
+GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'gemini-2.5-flash')
+
+# Background analysis jobs: worker threads, maximum queued + running jobs,
+# default and largest per-job timeout and how long finished results are kept (seconds)
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '4'))
+JOB_QUEUE_DEPTH = int(os.getenv('JOB_QUEUE_DEPTH', '32'))
+JOB_TIMEOUT = int(os.getenv('JOB_TIMEOUT', '300'))
+JOB_MAX_TIMEOUT = int(os.getenv('JOB_MAX_TIMEOUT', '1800'))
+JOB_RESULT_TTL = int(os.getenv('JOB_RESULT_TTL', '3600'))
+
+# Batch analysis: model calls in flight per batch request, shared pool size
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', '4'))
+BATCH_MAX_WORKERS = int(os.getenv('BATCH_MAX_WORKERS', '16'))
+
+# Question-style analyses of long documents only send the clauses most
+# relevant to the question: at most RETRIEVAL_TOP_K clauses within
+# RETRIEVAL_TOKEN_BUDGET estimated tokens
+QUESTION_ANALYSES = {'legal_advice'}
+RETRIEVAL_TOKEN_BUDGET = int(os.getenv('RETRIEVAL_TOKEN_BUDGET', '3000'))
+RETRIEVAL_TOP_K = int(os.getenv('RETRIEVAL_TOP_K', '8'))
+RETRIEVAL_MAX_DOCUMENTS = int(os.getenv('RETRIEVAL_MAX_DOCUMENTS', '64'))
+# How a question is put in front of the document or its excerpts; the
+# document form is split back apart so every chunk of a long document keeps
+# the question
+QUESTION_PREFIX = "QUESTION:\n"
+DOCUMENT_PREFIX = "\n\nDOCUMENT:\n"
+EXCERPTS_PREFIX = "RELEVANT EXCERPTS FROM THE DOCUMENT (clause numbers refer to the full document):\n"
+# Room left per excerpt for its "[Clause N]" label and separator
+CLAUSE_LABEL_CHARS = 24
+
+# Document sessions keep extracted text, results and recent questions for
+# follow-ups: bounded by count, total size and idle time; follow-up prompts
+# carry at most SESSION_RESULTS_TOKENS of earlier findings and
+# SESSION_HISTORY_TOKENS of earlier questions and answers
+SESSION_MAX_ENTRIES = int(os.getenv('SESSION_MAX_ENTRIES', '1000'))
+SESSION_MAX_BYTES = int(os.getenv('SESSION_MAX_MB', '256')) * 1024 * 1024
+SESSION_TTL = int(os.getenv('SESSION_TTL', '3600'))
+SESSION_MAX_TURNS = int(os.getenv('SESSION_MAX_TURNS', '20'))
+SESSION_RESULTS_TOKENS = int(os.getenv('SESSION_RESULTS_TOKENS', '800'))
+SESSION_HISTORY_TOKENS = int(os.getenv('SESSION_HISTORY_TOKENS', '600'))
+
+# Add a Server-Timing header with per-stage timings to every instrumented
+# response (otherwise only when the request sends X-Request-Timing: 1)
+METRICS_TIMING_HEADER = os.getenv('METRICS_TIMING_HEADER', '').lower() in ('1', 'true', 'yes')
+
+# Token required by the /admin endpoints, which are disabled while it is unset
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+
+# Long documents are split into chunks as large as the prompt budget of the
+# models they are routed to allows (or ANALYSIS_CHUNK_SIZE characters when set)
+# and analyzed concurrently by up to ANALYSIS_MAX_WORKERS model calls per
+# request; documents needing more than ANALYSIS_MAX_CHUNKS chunks are rejected
+# with HTTP 413
+ANALYSIS_CHUNK_SIZE = int(os.getenv('ANALYSIS_CHUNK_SIZE', '0'))
+ANALYSIS_MAX_WORKERS = int(os.getenv('ANALYSIS_MAX_WORKERS', '8'))
+ANALYSIS_MAX_CHUNKS = int(os.getenv('ANALYSIS_MAX_CHUNKS', '32'))
+# Estimated tokens of the note added to every chunk's prompt
+MAP_OVERHEAD_TOKENS = 50
+# Estimated tokens of the reduce prompt's own instructions, on top of the
+# analysis template; the partial analyses are cut to fit the rest of the budget
+REDUCE_OVERHEAD_TOKENS = 150
+
+# Drafts are kept server-side so a requirements change can regenerate only
+# the touched sections; revisions touching more than DRAFT_REVISION_MAX_SHARE
+# of the sections regenerate the whole draft instead
+DRAFT_STORE_MAX_ENTRIES = int(os.getenv('DRAFT_STORE_MAX_ENTRIES', '500'))
+DRAFT_STORE_TTL = int(os.getenv('DRAFT_STORE_TTL', '86400'))
+DRAFT_REVISION_MAX_SHARE = float(os.getenv('DRAFT_REVISION_MAX_SHARE', '0.5'))
+
+# Plain-text downloads at least this large are gzipped for clients that accept it
+DOWNLOAD_GZIP_MIN_BYTES = int(os.getenv('DOWNLOAD_GZIP_MIN_KB', '4')) * 1024
+
+# Documents nearly identical to one analyzed before (e.g. the same template with
+# other names, dates and amounts) reuse the earlier analysis: 'note' returns it
+# with the differing clauses listed, 'reanalyze' sends only the differing
+# clauses with the earlier analysis to the model, 'off' always analyzes in full.
+# reanalyze falls back to a full analysis when more than
+# NEAR_DUPLICATE_MAX_CHANGED_SHARE of the clauses differ
+NEAR_DUPLICATE_MODES = ('note', 'reanalyze', 'off')
+NEAR_DUPLICATE_MODE = os.getenv('NEAR_DUPLICATE_MODE', 'reanalyze')
+NEAR_DUPLICATE_MAX_CHANGED_SHARE = float(os.getenv('NEAR_DUPLICATE_MAX_CHANGED_SHARE', '0.3'))
+
+BUSY_MESSAGE = "Error: The AI service is receiving too many requests right now. Please try again in a minute."
+
+class DocumentTooLongError(ValueError):
+    """A document needing more than ANALYSIS_MAX_CHUNKS chunks; it is rejected rather than analyzed in part"""
+    
+    def __init__(self, chunks):
+        super().__init__(
+            f"Document too long to analyze in full: it needs {chunks} parts and at most {ANALYSIS_MAX_CHUNKS} "
+            f"are analyzed. Select fewer pages with the pages field or split the document."
+        )
+        self.chunks = chunks
 
 class LegalAssistant:
+    # Created by load() on first use, because importing the Gemini SDK is slow
+    LAZY_ATTRIBUTES = ('model', 'client', 'model_available', 'prompts')
+    
     def __init__(self):
-        self.legal_context = """
-        You are an AI Legal Assistant specializing in:
-        - Contract review and analysis
-        - Legal document drafting
-        - Case law research
-        - Legal advice and guidance
-        - Document summarization
-        - Compliance checking
-        
-        Always provide accurate, clear, and professional legal information.
-        Note: This is for informational purposes only and not a substitute for professional legal advice.
-        
-        Provide responses in well-structured format with clear headings and bullet points.
-        """
-        
-        # Initialize the model
-        try:
-            self.model = genai.GenerativeModel('gemini-2.5-flash')
-            self.model_available = True
-        except Exception as e:
-            print(f"Error initializing Gemini model: {e}")
-            self.model_available = False
+        self.legal_context = LEGAL_CONTEXT
+        self.loaded = False
+        self._load_lock = threading.Lock()
     
-    def analyze_document(self, text, analysis_type):
-        """Analyze legal document based on type"""
-        if not self.model_available:
-            return "Error: Gemini model not available. Please check your API key."
-        
-        prompts = {
-            'contract_review': f"""
-            ACT AS AN EXPERT LEGAL ANALYST. Review this contract and provide a comprehensive analysis with the following sections:
-
-            ## CONTRACT REVIEW ANALYSIS
-            
-            ### 1. KEY TERMS AND CONDITIONS
-            - Identify and list all major terms
-            - Explain significant clauses
-            - Highlight financial terms and payment conditions
-            
-            ### 2. POTENTIAL RISKS AND RED FLAGS
-            - Unfavorable terms for either party
-            - Ambiguous language
-            - Missing standard clauses
-            - Potential legal conflicts
-            
-            ### 3. MISSING CLAUSES
-            - Essential clauses that should be included
-            - Industry-standard provisions
-            - Protective clauses for both parties
-            
-            ### 4. SUGGESTED IMPROVEMENTS
-            - Specific language recommendations
-            - Additional clauses to consider
-            - Negotiation points
+    def __getattr__(self, name):
+        if name in LegalAssistant.LAZY_ATTRIBUTES:
+            self.load()
+            return self.__dict__[name]
+        raise AttributeError(name)
+    
+    def load(self):
+        """Import the Gemini SDK and build the model, client and prompt templates (once)"""
+        if self.loaded:
+            return
+        with self._load_lock:
+            if self.loaded:
+                return
             
-            ### 5. OVERALL ASSESSMENT
-            - Risk level (Low/Medium/High)
-            - Recommendations for next steps
-            - Key focus areas for negotiation
+            # The shared legal context goes to the model as a system instruction, so
+            # the templates do not repeat it; older SDKs without system instructions
+            # get it as a precomputed prefix of every prompt instead
+            prefix = ""
             
-            Contract text to analyze:
-            {text}
-            """,
+            # Initialize the model
+            try:
+                with startup.timed('load', 'google.generativeai'):
+                    import google.generativeai as genai
+                    genai.configure(api_key=GEMINI_API_KEY)
+                try:
+                    self.model = genai.GenerativeModel(GEMINI_MODEL, system_instruction=LEGAL_CONTEXT)
+                except TypeError:
+                    self.model = genai.GenerativeModel(GEMINI_MODEL)
+                    prefix = f"{LEGAL_CONTEXT}\n\n"
+                models = {GEMINI_MODEL: self.model}
+                
+                def make_model(name):
+                    if name not in models:
+                        if prefix:
+                            models[name] = genai.GenerativeModel(name)
+                        else:
+                            models[name] = genai.GenerativeModel(name, system_instruction=LEGAL_CONTEXT)
+                    return models[name]
+                
+                self.client = model_router_from_env(make_model, GEMINI_MODEL)
+                self.model_available = True
+            except Exception as e:
+                logger.error(f"Error initializing Gemini model: {e}")
+                self.model, self.client = None, None
+                self.model_available = False
             
-            'document_summary': f"""
-            ACT AS A LEGAL PROFESSIONAL. Summarize this legal document with the following structure:
+            # Templates are split and measured once, not rebuilt on every call
+            self.prompts = PromptRegistry(prefix)
+            self.loaded = True
+    
+    def _generate(self, prompt, task=None):
+        """Send a prompt to the model routed for task and return the response text"""
+        with stage('model'):
+            text = self.client.generate(prompt, task)
+        if not text:
+            raise ValueError("No response generated from the AI model")
+        return text
+    
+    def generate_stream(self, prompt, task=None):
+        """Send a prompt to the model in streaming mode and yield text as it arrives"""
+        yield from self.client.generate_stream(prompt, task)
+    
+    def model_signature(self, task):
+        """Models that may answer task, for cache keys"""
+        return self.client.signature(task) if self.client else GEMINI_MODEL
+    
+    def analysis_version(self, analysis_type):
+        """Version of the analysis template, for cache keys"""
+        return self.prompts.analysis_template(analysis_type).version
+    
+    def draft_version(self, doc_type):
+        """Version of the drafting template, for cache keys"""
+        return self.prompts.draft_template(doc_type).version
+    
+    def chunk_size(self, analysis_type):
+        """Characters of document per analysis chunk: ANALYSIS_CHUNK_SIZE, or as many as fit the prompt budget"""
+        if ANALYSIS_CHUNK_SIZE:
+            return ANALYSIS_CHUNK_SIZE
+        static_tokens = self.prompts.analysis_template(analysis_type).static_tokens + MAP_OVERHEAD_TOKENS
+        if self.client:
+            # Chunks are the longest prompts, so they go to the models for the
+            # largest size; a smaller chunk must also fit its own route
+            budget = self.client.prompt_budget(analysis_type, float('inf'))
+            budget = min(budget, self.client.prompt_budget(analysis_type, budget))
+        else:
+            budget = prompt_token_budget(GEMINI_MODEL)
+        return 4 * max(budget - static_tokens, 1000)
+    
+    def _single_prompt(self, text, analysis_type):
+        """Full prompt for analyzing text in one model call"""
+        with stage('prompt_build'):
+            template = self.prompts.analysis_template(analysis_type)
+            budget = self.client.prompt_budget(analysis_type, estimate_tokens(text) + template.static_tokens)
+            text, omitted = fit_to_budget(text, budget - template.static_tokens)
+            if omitted:
+                logger.warning(f"Document cut by about {omitted} tokens to fit the {budget} token budget")
+            prompt = template.render(text)
+        return prompt
+    
+    def build_analysis_prompt(self, text, analysis_type, chunk_size=None):
+        """Return (prompt, chunks) for the final analysis call.
+        
+        text is the whole (compacted) document: compaction, the result cache
+        and the near-duplicate index all need it before analysis starts. Text
+        longer than the chunk size is split on clause boundaries and the
+        chunks are analyzed concurrently (map); the returned prompt then
+        merges those partial analyses (reduce).
+        """
+        chunks = split_analysis_chunks(text, chunk_size or self.chunk_size(analysis_type))
+        if len(chunks) <= 1:
+            return self._single_prompt(chunks[0] if chunks else text, analysis_type), 1
+        
+        # Map: the chunks are analyzed at the same time, so latency is roughly
+        # one chunk call instead of N in a row
+        with stage('model'):
+            partials = self._generate_all([self._map_prompt(chunk, analysis_type) for chunk in chunks], analysis_type)
+        return self._reduce_prompt(partials, analysis_type), len(chunks)
+    
+    def _generate_all(self, prompts, task):
+        """Send prompts to the model concurrently; returns the texts in order.
+        
+        Each call gets its own pool of up to ANALYSIS_MAX_WORKERS threads, so
+        one long document never waits behind the chunks of another request.
+        """
+        with ThreadPoolExecutor(max_workers=max(1, min(len(prompts), ANALYSIS_MAX_WORKERS))) as pool:
+            return list(pool.map(lambda prompt: self._generate(prompt, task), prompts))
+    
+    def _fit_partials(self, partials, analysis_type, static_tokens):
+        """Cut partial analyses so the reduce prompt fits the model's budget.
+        
+        Short partials are kept whole and the room they leave is shared among
+        the longer ones, so only the longest are cut.
+        """
+        tokens = [estimate_tokens(partial) for partial in partials]
+        budget = self.client.prompt_budget(analysis_type, static_tokens + sum(tokens)) - static_tokens
+        if sum(tokens) <= budget:
+            return partials
+        logger.warning(f"Partial analyses cut from about {sum(tokens)} to {budget} tokens for the reduce step")
+        shares = {}
+        remaining = max(budget, 0)
+        order = sorted(range(len(partials)), key=tokens.__getitem__)
+        for position, i in enumerate(order):
+            shares[i] = min(tokens[i], remaining // (len(order) - position))
+            remaining -= shares[i]
+        return [partial if shares[i] >= tokens[i] else fit_to_budget(partial, shares[i])[0]
+                for i, partial in enumerate(partials)]
+    
+    def _reduce_prompt(self, partials, analysis_type):
+        """Prompt merging the partial analyses of a chunked document into one report"""
+        template = self.prompts.analysis_template(analysis_type)
+        # Room for the instructions and the per-partial separators
+        static_tokens = template.static_tokens + REDUCE_OVERHEAD_TOKENS + 16 * len(partials)
+        partials = self._fit_partials(partials, analysis_type, static_tokens)
+        sections = "\n\n".join(
+            f"--- PARTIAL ANALYSIS {i} OF {len(partials)} ---\n{partial}"
+            for i, partial in enumerate(partials, 1)
+        )
+        reduce_prompt = f"""{self.prompts.prefix}
+            The document below was too long to analyze at once, so it was split into {len(partials)} parts
+            and each part was analyzed separately using these instructions:
 
-            ## LEGAL DOCUMENT SUMMARY
-            
-            ### 1. MAIN PURPOSE AND PARTIES
-            - Primary objective of the document
-            - Parties involved and their roles
-            - Effective dates and duration
-            
-            ### 2. KEY OBLIGATIONS AND RIGHTS
-            - Main responsibilities of each party
-            - Rights granted to each party
-            - Key deliverables and expectations
-            
-            ### 3. IMPORTANT DEADLINES AND DATES
-            - Critical timelines
-            - Milestone dates
-            - Termination and renewal dates
-            
-            ### 4. TERMINATION CONDITIONS
-            - Grounds for termination
-            - Notice requirements
-            - Post-termination obligations
-            
-            ### 5. KEY LEGAL PROVISIONS
-            - Governing law and jurisdiction
-            - Dispute resolution mechanisms
-            - Confidentiality and intellectual property
-            
-            Document text:
-            {text}
-            """,
-            
-            'compliance_check': f"""
-            ACT AS A COMPLIANCE OFFICER. Analyze this document for compliance issues:
+            {template.render_instructions("[see partial analyses below]")}
 
-            ## COMPLIANCE ANALYSIS REPORT
-            
-            ### 1. REGULATORY COMPLIANCE RISKS
-            - Potential regulatory violations
-            - Industry-specific compliance requirements
-            - Reporting and documentation obligations
-            
-            ### 2. DATA PROTECTION ISSUES
-            - GDPR/CCPA compliance assessment
-            - Data handling and storage concerns
-            - Privacy policy adequacy
-            
-            ### 3. CONTRACT LAW COMPLIANCE
-            - Contract formation validity
-            - Consideration and mutual assent
-            - Capacity and legality assessment
-            
-            ### 4. INDUSTRY-SPECIFIC REGULATIONS
-            - Relevant industry standards
-            - Licensing and certification requirements
-            - Professional standards compliance
-            
-            ### 5. RECOMMENDED COMPLIANCE MEASURES
-            - Immediate actions required
-            - Documentation improvements
-            - Monitoring and audit recommendations
-            
-            Document text:
-            {text}
-            """,
-            
-            'legal_advice': f"""
-            ACT AS A LEGAL ADVISOR. Provide general legal guidance on this situation:
+            Merge the partial analyses into ONE consolidated report that follows the same structure.
+            Remove duplicates, reconcile contradictions, and keep every distinct finding.
+            Do not mention that the document was split into parts.
 
-            ## LEGAL GUIDANCE ANALYSIS
-            
-            ### 1. RELEVANT LAWS AND REGULATIONS
-            - Applicable statutes and regulations
-            - Legal principles involved
-            - Jurisdictional considerations
-            
-            ### 2. POTENTIAL LEGAL STRATEGIES
-            - Available legal approaches
-            - Pros and cons of each strategy
-            - Recommended course of action
-            
-            ### 3. RIGHTS AND OBLIGATIONS
-            - Legal rights of involved parties
-            - Corresponding obligations
-            - Potential liabilities
-            
-            ### 4. RISK ASSESSMENT
-            - Legal risks involved
-            - Probability of success
-            - Potential consequences
-            
-            ### 5. NEXT STEPS TO CONSIDER
-            - Immediate actions to take
-            - Documentation to gather
-            - When to consult a licensed attorney
-            
-            Situation to analyze:
-            {text}
+            {sections}
             """
-        }
+        return reduce_prompt
+    
+    def _map_prompt(self, chunk, analysis_type):
+        """Prompt for analyzing one part of a longer document"""
+        return (
+            f"{self.prompts.analysis_template(analysis_type).render(chunk)}\n\n"
+            f"Note: this text is one part of a longer document. "
+            f"Only report on what appears in this part."
+        )
+    
+    def analyze_document(self, text, analysis_type):
+        """Analyze legal document based on type"""
+        if not self.model_available:
+            return "Error: Gemini model not available. Please check your API key."
         
         try:
-            prompt = f"{self.legal_context}\n\n{prompts.get(analysis_type, prompts['document_summary'])}"
+            prompt = self._single_prompt(text, analysis_type)
             
-            # Limit text length for free API
-            if len(prompt) > 30000:
-                prompt = prompt[:30000] + "\n\n[Document truncated due to length limitations]"
+            with stage('model'):
+                text = self.client.generate(prompt, analysis_type)
             
-            response = self.model.generate_content(prompt)
-            
-            if response.text:
-                return response.text
+            if text:
+                return text
             else:
                 return "Error: No response generated from the AI model. Please try again."
                 
+        except UpstreamBusyError:
+            return BUSY_MESSAGE
         except Exception as e:
             return f"Error analyzing document: {str(e)}. Please check your API key and try again."
     
+    def analyze_document_chunked(self, text, analysis_type, chunk_size=None):
+        """Analyze a long document by mapping over clause-aligned chunks and reducing the results"""
+        if not self.model_available:
+            return "Error: Gemini model not available. Please check your API key.", 0
+        
+        chunks = 0
+        try:
+            prompt, chunks = self.build_analysis_prompt(text, analysis_type, chunk_size)
+            return self._generate(prompt, analysis_type), chunks
+        except DocumentTooLongError:
+            raise
+        except UpstreamBusyError:
+            return BUSY_MESSAGE, chunks
+        except Exception as e:
+            return f"Error analyzing document: {str(e)}. Please check your API key and try again.", chunks
+    
+    def build_draft_prompt(self, doc_type, requirements):
+        """Full prompt for drafting a document"""
+        with stage('prompt_build'):
+            return self.prompts.draft_template(doc_type).render(requirements)
+    
     def draft_document(self, doc_type, requirements):
         """Draft legal documents based on requirements"""
         if not self.model_available:
             return "Error: Gemini model not available. Please check your API key."
         
-        draft_prompts = {
-            'nda': f"""
-            ACT AS A LEGAL DRAFTING EXPERT. Draft a comprehensive Non-Disclosure Agreement based on these requirements:
+        try:
+            prompt = self.build_draft_prompt(doc_type, requirements)
+            
+            with stage('model'):
+                text = self.client.generate(prompt, doc_type)
+            
+            if text:
+                return text
+            else:
+                return "Error: No response generated from the AI model. Please try again."
+                
+        except UpstreamBusyError:
+            return BUSY_MESSAGE
+        except Exception as e:
+            return f"Error drafting document: {str(e)}. Please check your API key and try again."
+    
+    async def _generate_async(self, prompt, task=None):
+        """Async _generate(); callers time the model stage around it"""
+        text = await self.client.generate_async(prompt, task)
+        if not text:
+            raise ValueError("No response generated from the AI model")
+        return text
+    
+    async def analyze_document_async(self, text, analysis_type):
+        """analyze_document() for the async server; the model call does not hold a thread"""
+        if not self.model_available:
+            return "Error: Gemini model not available. Please check your API key."
+        
+        try:
+            prompt = self._single_prompt(text, analysis_type)
+            with stage('model'):
+                return await self._generate_async(prompt, analysis_type)
+        except UpstreamBusyError:
+            return BUSY_MESSAGE
+        except Exception as e:
+            return f"Error analyzing document: {str(e)}. Please check your API key and try again."
+    
+    async def analyze_document_chunked_async(self, text, analysis_type, chunk_size=None):
+        """analyze_document_chunked() for the async server; partial analyses are awaited together"""
+        if not self.model_available:
+            return "Error: Gemini model not available. Please check your API key.", 0
+        
+        chunks = []
+        try:
+            chunks = split_analysis_chunks(text, chunk_size or self.chunk_size(analysis_type))
+            if len(chunks) <= 1:
+                return await self.analyze_document_async(text, analysis_type), 1
+            
+            # At most ANALYSIS_MAX_WORKERS chunks of one request in flight, as on the sync path
+            limit = asyncio.Semaphore(ANALYSIS_MAX_WORKERS)
+            
+            async def analyze_chunk(chunk):
+                async with limit:
+                    return await self._generate_async(self._map_prompt(chunk, analysis_type), analysis_type)
+            
+            with stage('model'):
+                partials = await asyncio.gather(*(analyze_chunk(chunk) for chunk in chunks))
+                result = await self._generate_async(self._reduce_prompt(partials, analysis_type), analysis_type)
+            return result, len(chunks)
+        except DocumentTooLongError:
+            raise
+        except UpstreamBusyError:
+            return BUSY_MESSAGE, len(chunks)
+        except Exception as e:
+            return f"Error analyzing document: {str(e)}. Please check your API key and try again.", len(chunks)
+    
+    async def draft_document_async(self, doc_type, requirements):
+        """draft_document() for the async server"""
+        if not self.model_available:
+            return "Error: Gemini model not available. Please check your API key."
+        
+        try:
+            prompt = self.build_draft_prompt(doc_type, requirements)
+            with stage('model'):
+                return await self._generate_async(prompt, doc_type)
+        except UpstreamBusyError:
+            return BUSY_MESSAGE
+        except Exception as e:
+            return f"Error drafting document: {str(e)}. Please check your API key and try again."
+    
+    def answer_follow_up(self, context):
+        """Answer a follow-up question in a document session; context holds the question and excerpts"""
+        if not self.model_available:
+            return "Error: Gemini model not available. Please check your API key."
+        
+        try:
+            with stage('prompt_build'):
+                prompt = self.prompts.follow_up.render(context)
+            return self._generate(prompt, 'follow_up')
+        except UpstreamBusyError:
+            return BUSY_MESSAGE
+        except Exception as e:
+            return f"Error answering question: {str(e)}. Please check your API key and try again."
 
-            REQUIREMENTS PROVIDED:
-            {requirements}
+    def analyze_changes(self, changes_text):
+        """Risk analysis of the changed clauses between two contract versions"""
+        if not self.model_available:
+            return "Error: Gemini model not available. Please check your API key."
 
-            DRAFT A COMPLETE NON-DISCLOSURE AGREEMENT INCLUDING:
-
-            1. PARTIES INFORMATION
-            - Full legal names and addresses
-            - Effective date
-            - Purpose of disclosure
-
-            2. DEFINITION OF CONFIDENTIAL INFORMATION
-            - Specific categories of protected information
-            - Exclusions from confidentiality
-            - Examples of confidential materials
-
-            3. OBLIGATIONS OF RECEIVING PARTY
-            - Duty to maintain confidentiality
-            - Permitted uses of information
-            - Security measures required
-            - Return/destruction of information
-
-            4. TERM AND TERMINATION
-            - Duration of confidentiality
-            - Termination conditions
-            - Survival of obligations
-
-            5. REMEDIES AND JURISDICTION
-            - Legal remedies for breach
-            - Injunctive relief provisions
-            - Governing law and jurisdiction
-            - Dispute resolution process
-
-            6. MISCELLANEOUS PROVISIONS
-            - Entire agreement clause
-            - Severability
-            - Notices
-            - Assignment restrictions
-
-            Provide the complete agreement in proper legal format with appropriate section headings.
-            """,
-            
-            'employment_contract': f"""
-            ACT AS AN EMPLOYMENT LAW SPECIALIST. Draft a comprehensive Employment Contract based on these requirements:
+        try:
+            with stage('prompt_build'):
+                template = self.prompts.redline
+                budget = self.client.prompt_budget('contract_compare', estimate_tokens(changes_text) + template.static_tokens)
+                changes_text, omitted = fit_to_budget(changes_text, budget - template.static_tokens)
+                if omitted:
+                    logger.warning(f"Changes cut by about {omitted} tokens to fit the {budget} token budget")
+                prompt = template.render(changes_text)
+            return self._generate(prompt, 'contract_compare')
+        except UpstreamBusyError:
+            return BUSY_MESSAGE
+        except Exception as e:
+            return f"Error comparing versions: {str(e)}. Please check your API key and try again."
 
-            REQUIREMENTS PROVIDED:
-            {requirements}
+    def build_near_duplicate_prompt(self, previous, changes_text, analysis_type):
+        """Prompt updating an earlier analysis for the differing clauses, or None if it does not fit"""
+        with stage('prompt_build'):
+            template = self.prompts.near_duplicate
+            text = f"EARLIER ANALYSIS:\n{previous}\n\n{changes_text}"
+            tokens = estimate_tokens(text) + template.static_tokens
+            if tokens > self.client.prompt_budget(analysis_type, tokens):
+                return None
+            return template.render(text)
 
-            DRAFT A COMPLETE EMPLOYMENT CONTRACT INCLUDING:
-
-            1. POSITION AND DUTIES
-            - Job title and description
-            - Reporting structure
-            - Primary responsibilities
-            - Work location requirements
-
-            2. COMPENSATION AND BENEFITS
-            - Salary and payment schedule
-            - Bonus structure if applicable
-            - Benefits package details
-            - Expense reimbursement
-
-            3. WORKING HOURS AND LOCATION
-            - Standard working hours
-            - Overtime policies
-            - Remote work provisions
-            - Travel requirements
-
-            4. CONFIDENTIALITY AND IP
-            - Confidentiality obligations
-            - Intellectual property assignment
-            - Non-compete provisions (if applicable)
-            - Non-solicitation clauses
-
-            5. TERMINATION CONDITIONS
-            - Notice periods
-            - Grounds for termination
-            - Severance provisions
-            - Return of company property
-
-            6. GENERAL PROVISIONS
-            - At-will employment statement (if applicable)
-            - Governing law
-            - Entire agreement clause
-            - Amendment procedures
-
-            Provide the complete contract in proper legal format.
-            """,
-            
-            'lease_agreement': f"""
-            ACT AS A REAL ESTATE ATTORNEY. Draft a comprehensive Residential Lease Agreement based on these requirements:
+    def update_analysis(self, previous, changes_text, analysis_type):
+        """Analysis of a near-duplicate document from an earlier analysis and the clauses that differ.
 
-            REQUIREMENTS PROVIDED:
-            {requirements}
+        Returns None when the prompt would not fit the token budget, so the
+        caller analyzes the whole document instead.
+        """
+        if not self.model_available:
+            return "Error: Gemini model not available. Please check your API key."
 
-            DRAFT A COMPLETE RESIDENTIAL LEASE AGREEMENT INCLUDING:
-
-            1. PROPERTY DESCRIPTION
-            - Complete address and unit details
-            - Included furnishings and appliances
-            - Common areas and exclusive use spaces
-
-            2. LEASE TERM AND RENT
-            - Lease commencement and end dates
-            - Monthly rent amount and due date
-            - Late payment penalties
-            - Security deposit details
-
-            3. MAINTENANCE RESPONSIBILITIES
-            - Tenant maintenance obligations
-            - Landlord repair responsibilities
-            - Emergency procedures
-            - Alteration restrictions
-
-            4. HOUSE RULES AND REGULATIONS
-            - Occupancy limits
-            - Pet policies (if any)
-            - Noise restrictions
-            - Smoking policies
-
-            5. DEFAULT AND TERMINATION
-            - Default conditions
-            - Eviction procedures
-            - Early termination options
-            - Renewal procedures
-
-            6. LEGAL PROVISIONS
-            - Governing state law
-            - Notice requirements
-            - Security deposit return procedures
-            - Dispute resolution
-
-            Provide the complete lease agreement in proper legal format.
-            """,
-            
-            'service_agreement': f"""
-            ACT AS A CONTRACT LAW EXPERT. Draft a comprehensive Service Agreement based on these requirements:
+        try:
+            prompt = self.build_near_duplicate_prompt(previous, changes_text, analysis_type)
+            return prompt and self._generate(prompt, analysis_type)
+        except UpstreamBusyError:
+            return BUSY_MESSAGE
+        except Exception as e:
+            return f"Error analyzing document: {str(e)}. Please check your API key and try again."
+
+    async def update_analysis_async(self, previous, changes_text, analysis_type):
+        """update_analysis() for the async server"""
+        if not self.model_available:
+            return "Error: Gemini model not available. Please check your API key."
+
+        try:
+            prompt = self.build_near_duplicate_prompt(previous, changes_text, analysis_type)
+            if prompt is None:
+                return None
+            with stage('model'):
+                return await self._generate_async(prompt, analysis_type)
+        except UpstreamBusyError:
+            return BUSY_MESSAGE
+        except Exception as e:
+            return f"Error analyzing document: {str(e)}. Please check your API key and try again."
 
-            REQUIREMENTS PROVIDED:
+    def _revision_prompt(self, doc_type, requirements, changes, outline, section):
+        """Prompt for rewriting one section of an existing draft"""
+        doc_label = doc_type.replace('_', ' ')
+        return f"""{self.prompts.prefix}
+            You are revising one section of an existing {doc_label} after the client changed their requirements.
+
+            CHANGES TO THE REQUIREMENTS (- removed, + added):
+            {changes}
+
+            FULL UPDATED REQUIREMENTS:
             {requirements}
 
-            DRAFT A COMPLETE SERVICE AGREEMENT INCLUDING:
-
-            1. SERVICES TO BE PROVIDED
-            - Detailed description of services
-            - Performance standards
-            - Deliverables timeline
-            - Acceptance criteria
-
-            2. PAYMENT TERMS
-            - Fee structure and amounts
-            - Payment schedule
-            - Expense reimbursement
-            - Tax responsibilities
-
-            3. TIMELINE AND DELIVERABLES
-            - Project milestones
-            - Delivery dates
-            - Performance metrics
-            - Reporting requirements
-
-            4. INTELLECTUAL PROPERTY RIGHTS
-            - Pre-existing IP ownership
-            - New IP creation and ownership
-            - License grants
-            - IP protection obligations
-
-            5. LIABILITY AND INDEMNIFICATION
-            - Limitation of liability
-            - Indemnification provisions
-            - Insurance requirements
-            - Warranty disclaimers
-
-            6. TERM AND TERMINATION
-            - Agreement duration
-            - Termination for cause
-            - Termination for convenience
-            - Post-termination obligations
-
-            Provide the complete service agreement in proper legal format.
+            OUTLINE OF THE WHOLE DOCUMENT (for numbering and cross-references):
+            {outline}
+
+            SECTION TO REVISE:
+            {section}
+
+            Rewrite ONLY this section so that it reflects the updated requirements.
+            Keep its heading, numbering and formatting style. If the changes do not
+            affect this section, return it unchanged. Return only the section text,
+            without commentary.
             """
-        }
+    
+    def revise_sections(self, doc_type, requirements, changes, sections, indexes):
+        """Regenerate the given sections of a draft concurrently; returns the new section texts"""
+        outline = "\n".join(section_heading(section) for section in sections if section.strip())
+        changes = "\n".join(changes)
+        with stage('prompt_build'):
+            prompts = [
+                self._revision_prompt(doc_type, requirements, changes, outline, sections[i].strip())
+                for i in indexes
+            ]
+        with stage('model'):
+            return self._generate_all(prompts, doc_type)
+    
+    def revise_draft(self, doc_type, requirements, changes, sections, indexes):
+        """Return the draft with the given sections regenerated, or an error string"""
+        if not self.model_available:
+            return "Error: Gemini model not available. Please check your API key."
         
         try:
-            prompt = f"{self.legal_context}\n\n{draft_prompts.get(doc_type, draft_prompts['service_agreement'])}"
-            
-            response = self.model.generate_content(prompt)
-            
-            if response.text:
-                return response.text
-            else:
-                return "Error: No response generated from the AI model. Please try again."
-                
+            revised = list(sections)
+            for i, text in zip(indexes, self.revise_sections(doc_type, requirements, changes, sections, indexes)):
+                # Keep the original surrounding whitespace so the splice is seamless
+                original = sections[i]
+                leading = original[:len(original) - len(original.lstrip())]
+                trailing = original[len(original.rstrip()):]
+                revised[i] = leading + text.strip() + trailing
+            return "".join(revised)
+        except UpstreamBusyError:
+            return BUSY_MESSAGE
         except Exception as e:
-            return f"Error drafting document: {str(e)}. Please check your API key and try again."
+            return f"Error revising document: {str(e)}. Please check your API key and try again."
 
-# Initialize the legal assistant
-legal_assistant = LegalAssistant()
+# Initialize the legal assistant; the model itself is loaded on first use or
+# by the background pre-warm
+with startup.timed('init', 'legal_assistant'):
+    legal_assistant = LegalAssistant()
+with startup.timed('init', 'result_cache'):
+    result_cache = result_cache_from_env()
+with startup.timed('init', 'extraction_cache'):
+    extraction_cache = extraction_cache_from_env()
+with startup.timed('init', 'near_duplicate_index'):
+    near_duplicate_index = near_duplicate_index_from_env()
+clause_indexes = ClauseIndexCache(max_documents=RETRIEVAL_MAX_DOCUMENTS)
+draft_store = DraftStore(max_entries=DRAFT_STORE_MAX_ENTRIES, ttl=DRAFT_STORE_TTL)
+session_store = SessionStore(max_sessions=SESSION_MAX_ENTRIES, max_bytes=SESSION_MAX_BYTES,
+                             ttl=SESSION_TTL, max_turns=SESSION_MAX_TURNS)
+startup.register_prewarm('gemini_model', legal_assistant.load)
+startup.register_prewarm('pdf_parser', load_parsers)
+startup.register_prewarm('docx_writer', load_renderers)
 
-def extract_text_from_pdf(file):
-    """Extract text from PDF file"""
-    text = ""
-    try:
-        with pdfplumber.open(file) as pdf:
-            for page in pdf.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text += page_text + "\n"
-    except Exception as e:
-        print(f"Error extracting PDF text: {e}")
-        return f"Error extracting text from PDF: {str(e)}"
-    return text
+# Chunked analyses inside these calls start their own pools for the chunks
+batch_executor = ThreadPoolExecutor(max_workers=BATCH_MAX_WORKERS)
+job_queue = JobQueue(
+    max_workers=JOB_WORKERS,
+    max_depth=JOB_QUEUE_DEPTH,
+    job_timeout=JOB_TIMEOUT,
+    max_timeout=JOB_MAX_TIMEOUT,
+    result_ttl=JOB_RESULT_TTL
+)
 
-def extract_text_from_docx(file):
-    """Extract text from DOCX file"""
-    text = ""
-    try:
-        doc = Document(file)
-        for paragraph in doc.paragraphs:
-            if paragraph.text:
-                text += paragraph.text + "\n"
-    except Exception as e:
-        print(f"Error extracting DOCX text: {e}")
-        return f"Error extracting text from DOCX: {str(e)}"
-    return text
+def is_error_result(result):
+    """LegalAssistant reports failures as 'Error...' strings; those must not be cached"""
+    return result.startswith("Error")
+
+def metric_type(name, known):
+    """Metrics label for a client-supplied type: a known template name, else 'other'.
+    
+    Labels are never taken from raw input, which would let clients create
+    unbounded series.
+    """
+    return name if name in known else 'other'
 
 @app.route('/')
 def index():
     """Main application page"""
     return render_template('index.html')
 
+@app.before_request
+def begin_prewarm():
+    """Start pre-warming on the first request when the server was not started through __main__ or asgi.py"""
+    startup.start_prewarm()
+
+@app.before_request
+def reject_oversized_body():
+    """Refuse oversized uploads up front, before a view reads the body"""
+    if request.content_length and request.content_length > MAX_UPLOAD_BYTES:
+        abort(413)
+
+@app.errorhandler(413)
+def upload_too_large(error):
+    """Reject request bodies over MAX_UPLOAD_BYTES with a JSON error"""
+    return jsonify({'error': f'File too large. The maximum upload size is {MAX_UPLOAD_BYTES // (1024 * 1024)} MB.'}), 413
+
+def read_analysis_input():
+    """Collect analysis type and text from the form or an uploaded file.
+    
+    Returns (analysis_type, text, error) where error is a message for the client.
+    """
+    with stage('file_read'):
+        # Accessing the form makes Werkzeug read and parse the request body
+        form = request.form
+        file = request.files.get('file')
+    return parse_analysis_input(form, file.filename if file else None, file)
+
+def parse_analysis_input(form, filename, file):
+    """Analysis type and text from submitted form fields and an optional upload.
+    
+    Shared by the Flask and ASGI handlers; returns (analysis_type, text, error).
+    """
+    analysis_type = form.get('analysis_type', 'document_summary')
+    text = form.get('text', '')
+    pages = parse_page_range(form.get('pages', ''))
+    
+    logger.debug(f"Analysis type: {analysis_type}")
+    logger.debug(f"Text length: {len(text)}")
+    logger.debug(f"File uploaded: {filename or 'None'}")
+    
+    if filename:
+        text, error = extract_text_from_upload(filename, file, pages)
+        if error:
+            return analysis_type, None, error
+    
+    if not text or not text.strip():
+        return analysis_type, None, 'No text provided for analysis. Please upload a file or paste text.'
+    
+    return analysis_type, text, None
+
+def extract_text_from_upload(filename, file, pages=None):
+    """Extract text from an uploaded file by extension; returns (text, error)
+    
+    pages optionally restricts PDF extraction to parsed page ranges.
+    """
+    filename = filename.lower()
+    with stage('extraction'):
+        if filename.endswith('.pdf'):
+            text = extract_text_from_pdf(file, pages, cache=extraction_cache)
+            logger.debug(f"PDF text extracted, length: {len(text)}")
+        elif filename.endswith('.docx'):
+            text = extract_text_from_docx(file, cache=extraction_cache)
+            logger.debug(f"DOCX text extracted, length: {len(text)}")
+        elif filename.endswith('.txt'):
+            text = extract_text_from_txt(file)
+            logger.debug(f"TXT text extracted, length: {len(text)}")
+        else:
+            return None, 'Unsupported file format. Please upload PDF, DOCX, or TXT.'
+    return text, None
+
+def compact_input(text):
+    """Strip extraction noise and repeated boilerplate before analysis; returns (text, stats)"""
+    with stage('compaction'):
+        text, stats = compact(text)
+    COMPACTION_TOKENS_SAVED.inc(stats['tokens_saved'])
+    if stats['tokens_saved']:
+        logger.info(f"Compaction saved about {stats['tokens_saved']} of {stats['original_tokens']} tokens")
+    return text, stats
+
+def split_question(text):
+    """Split text built by focus_on_question into (question header, document); the header is '' if there is none"""
+    if text.startswith(QUESTION_PREFIX):
+        header, separator, document = text.partition(DOCUMENT_PREFIX)
+        if separator:
+            return header + separator, document
+    return '', text
+
+def split_analysis_chunks(text, chunk_size):
+    """Split a document into clause-aligned analysis chunks, each keeping the question header if any.
+    
+    Raises DocumentTooLongError instead of dropping chunks beyond ANALYSIS_MAX_CHUNKS.
+    """
+    # A question asked about the whole document is repeated in every chunk
+    header, text = split_question(text)
+    chunk_size = max(chunk_size - len(header), chunk_size // 2)
+    with stage('chunking'):
+        chunks = [header + chunk for chunk in iter_chunks([text], chunk_size)]
+    if len(chunks) > ANALYSIS_MAX_CHUNKS:
+        raise DocumentTooLongError(len(chunks))
+    return chunks
+
+def focus_on_question(text, analysis_type, question):
+    """Pair a question with the document, keeping only relevant clauses of long documents.
+    
+    Returns (text, retrieval) where retrieval describes the selected clauses,
+    or is None when the whole document is sent.
+    """
+    question = (question or '').strip()
+    if not question or analysis_type not in QUESTION_ANALYSES:
+        return text, None
+    
+    if estimate_tokens(text) > RETRIEVAL_TOKEN_BUDGET:
+        header = f"{QUESTION_PREFIX}{question}\n\n{EXCERPTS_PREFIX}"
+        # The excerpts must fit in one analysis chunk, or map-reduce would
+        # split them and leave the question out of the later chunks
+        room = legal_assistant.chunk_size(analysis_type) - len(header) - CLAUSE_LABEL_CHARS * RETRIEVAL_TOP_K
+        budget = max(min(RETRIEVAL_TOKEN_BUDGET, room // 4), 0)
+        with stage('retrieval'):
+            index = clause_indexes.get(text)
+            context, clause_ids = build_question_context(index, question, budget, RETRIEVAL_TOP_K)
+        if context:
+            logger.info(f"Retrieved {len(clause_ids)} of {len(index.clauses)} clauses for question")
+            return (
+                f"{header}{context}",
+                {'clauses': [clause_id + 1 for clause_id in clause_ids], 'total_clauses': len(index.clauses)}
+            )
+    
+    return f"{QUESTION_PREFIX}{question}{DOCUMENT_PREFIX}{text}", None
+
+def lookup_analysis(text, analysis_type):
+    """Result cache key and cached entry (or None) for an analysis"""
+    with stage('cache_lookup'):
+        cache_key = make_cache_key(text, f"analyze:{analysis_type}", legal_assistant.model_signature(analysis_type),
+                                   legal_assistant.analysis_version(analysis_type))
+        return cache_key, result_cache.get(cache_key)
+
+def lookup_draft(doc_type, requirements):
+    """Result cache key and cached entry (or None) for a draft"""
+    with stage('cache_lookup'):
+        cache_key = make_cache_key(requirements, f"draft:{doc_type}", legal_assistant.model_signature(doc_type),
+                                   legal_assistant.draft_version(doc_type))
+        return cache_key, result_cache.get(cache_key)
+
+def store_analysis(analysis_type, result):
+    """Keep an analysis result for download by id; returns the id, or None for errors"""
+    if not result or is_error_result(result):
+        return None
+    return draft_store.put(analysis_type, '', result, kind='analysis')
+
+def lookup_near_duplicate_update(text, analysis_type, match):
+    """Result cache key and cached entry (or None) for an update of the matched earlier analysis.
+
+    Kept apart from full analyses so near_duplicate=off never gets an update.
+    """
+    with stage('cache_lookup'):
+        cache_key = make_cache_key(text, f"near_duplicate:{analysis_type}:{match['id']}",
+                                   legal_assistant.model_signature(analysis_type),
+                                   legal_assistant.prompts.near_duplicate.version)
+        return cache_key, result_cache.get(cache_key)
+
+def near_duplicate_mode(requested=None):
+    """The requested near-duplicate mode if valid, else NEAR_DUPLICATE_MODE"""
+    return requested if requested in NEAR_DUPLICATE_MODES else NEAR_DUPLICATE_MODE
+
+def check_near_duplicate(text, analysis_type, mode):
+    """Fingerprint a document and look for an earlier analysis of a near-identical one.
+
+    Returns (entry, match). entry is what index_analysis needs to add this
+    document once analyzed; it is None when the index is disabled or the
+    analysis answers a question. match is the earlier document with the
+    clauses of this one that differ and the (number, heading) of its clauses
+    that are gone, or None.
+    """
+    if near_duplicate_index is None or analysis_type in QUESTION_ANALYSES:
+        return None, None
+    with stage('near_duplicate'):
+        clauses = split_into_clauses(text)
+        signature = minhash_signature(clauses)
+        if signature is None:
+            return None, None
+        hashes = clause_hashes(clauses)
+        scope = '\0'.join((analysis_type, legal_assistant.model_signature(analysis_type),
+                           legal_assistant.analysis_version(analysis_type)))
+        entry = {'scope': scope, 'signature': signature, 'clause_hashes': hashes,
+                 'clause_headings': clause_headings(clauses)}
+        if mode == 'off':
+            return entry, None
+        try:
+            match = near_duplicate_index.lookup(scope, signature)
+        except sqlite3.Error as e:
+            logger.error(f"Near-duplicate index read error: {e}")
+            match = None
+        if match:
+            previous = set(match['clause_hashes'])
+            match['differing'] = [
+                (number, clause) for number, (clause, clause_hash) in enumerate(zip(clauses, hashes), 1)
+                if clause_hash not in previous
+            ]
+            current = set(hashes)
+            match['removed'] = [
+                (number, heading) for number, (clause_hash, heading)
+                in enumerate(zip(match['clause_hashes'], match['clause_headings']), 1)
+                if clause_hash not in current
+            ]
+            match['total_clauses'] = len(clauses)
+            logger.info(f"Near-duplicate of indexed document {match['id']} (similarity {match['similarity']}), "
+                        f"{len(match['differing'])} of {len(clauses)} clauses differ, {len(match['removed'])} removed")
+    return entry, match
+
+def index_analysis(entry, result, chunks):
+    """Add a fully analyzed document to the near-duplicate index"""
+    if entry is None or is_error_result(result):
+        return
+    try:
+        near_duplicate_index.add(entry['scope'], entry['signature'], entry['clause_hashes'],
+                                 entry['clause_headings'], result, chunks)
+    except sqlite3.Error as e:
+        logger.error(f"Near-duplicate index write error: {e}")
+
+def near_duplicate_note(match, max_listed=20):
+    """Earlier analysis headed by a note naming the clauses of this document that differ"""
+    differing = match['differing']
+    note = (f"NOTE: This analysis was reused from an earlier analysis of a near-identical document "
+            f"(about {match['similarity']:.0%} similar).")
+    if differing:
+        listed = '; '.join(f"clause {number} ({section_heading(clause)[:60]})" for number, clause in differing[:max_listed])
+        more = f" and {len(differing) - max_listed} more" if len(differing) > max_listed else ''
+        note += f" These clauses differ from that document, so findings about them may not apply: {listed}{more}."
+    removed = match['removed']
+    if removed:
+        listed = '; '.join(f"clause {number} ({heading[:60]})" for number, heading in removed[:max_listed])
+        more = f" and {len(removed) - max_listed} more" if len(removed) > max_listed else ''
+        note += f" These clauses of that document are not in this one, so findings about them do not apply: {listed}{more}."
+    note += " Submit again with near_duplicate=off for a full analysis."
+    return f"{note}\n\n{match['result']}"
+
+def near_duplicate_changes(match):
+    """The differing and removed clauses as prompt text, or None when too much of the document changed"""
+    differing, removed = match['differing'], match['removed']
+    total = max(match['total_clauses'], len(match['clause_hashes']))
+    if len(differing) + len(removed) > NEAR_DUPLICATE_MAX_CHANGED_SHARE * total:
+        return None
+    blocks = []
+    if differing:
+        blocks.append(f"CLAUSES OF THE NEW DOCUMENT THAT DIFFER ({len(differing)} of {match['total_clauses']} clauses):")
+        blocks.extend(f"[Clause {number}]\n{clause}" for number, clause in differing)
+    if removed:
+        blocks.append("CLAUSES OF THE EARLIER DOCUMENT THAT ARE NOT IN THE NEW ONE (drop findings about them):\n"
+                      + "\n".join(f"- Clause {number}: {heading}" for number, heading in removed))
+    return "\n\n".join(blocks)
+
+def near_duplicate_summary(match, mode):
+    """What was reused from an earlier near-identical document, for responses"""
+    return {
+        'mode': mode,
+        'similarity': match['similarity'],
+        'differing_clauses': [number for number, _ in match['differing']],
+        'removed_clauses': [heading for _, heading in match['removed']],
+    }
+
+def run_analysis(text, analysis_type, near_duplicate=None):
+    """Analyze text through the result cache and near-duplicate index.
+
+    Returns (result, chunks, cached, reused) where reused describes the
+    earlier near-identical analysis that was returned or updated (see
+    near_duplicate_summary), or is None. Only full analyses are indexed, so
+    updates never build on other updates.
+    """
+    cache_key, cached = lookup_analysis(text, analysis_type)
+    if cached:
+        logger.info("Analysis served from cache")
+        return cached['result'], cached['chunks'], True, None
+
+    mode = near_duplicate_mode(near_duplicate)
+    entry, match = check_near_duplicate(text, analysis_type, mode)
+    if match and (mode == 'note' or not (match['differing'] or match['removed'])):
+        NEAR_DUPLICATE_REUSES.inc(mode='note')
+        return near_duplicate_note(match), match['chunks'], False, near_duplicate_summary(match, 'note')
+    changes_text = match and near_duplicate_changes(match)
+    if changes_text:
+        update_key, updated = lookup_near_duplicate_update(text, analysis_type, match)
+        result = updated['result'] if updated else legal_assistant.update_analysis(match['result'], changes_text, analysis_type)
+        if result is not None:
+            NEAR_DUPLICATE_REUSES.inc(mode='reanalyze')
+            if not updated and not is_error_result(result):
+                result_cache.set(update_key, {'result': result, 'chunks': 1})
+            return result, 1, bool(updated), near_duplicate_summary(match, 'reanalyze')
+
+    logger.info(f"Starting analysis with text length: {len(text)}")
+    if len(text) > legal_assistant.chunk_size(analysis_type):
+        # Long documents are analyzed in full via map-reduce instead of truncated
+        result, chunks = legal_assistant.analyze_document_chunked(text, analysis_type)
+        logger.info(f"Chunked analysis completed over {chunks} chunks")
+    else:
+        result, chunks = legal_assistant.analyze_document(text, analysis_type), 1
+        logger.info("Analysis completed successfully")
+    if not is_error_result(result):
+        result_cache.set(cache_key, {'result': result, 'chunks': chunks})
+        index_analysis(entry, result, chunks)
+    return result, chunks, False, None
+
+def instrumented(route):
+    """Record latency, per-stage timings and counters for a view under the given route label"""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            with track_request(route) as timer:
+                try:
+                    response = app.make_response(view(*args, **kwargs))
+                except Exception:
+                    timer.fail()
+                    timer.finish()
+                    raise
+                if response.status_code >= 400:
+                    timer.fail()
+                total = timer.finish()
+                if METRICS_TIMING_HEADER or request.headers.get('X-Request-Timing') == '1':
+                    response.headers['Server-Timing'] = timer.server_timing(total)
+                return response
+        return wrapper
+    return decorator
+
+def json_result(timer, payload):
+    """Serialize a successful result, recording output size and serialization time"""
+    timer.output_chars = len(payload['result'])
+    if is_error_result(payload['result']):
+        timer.fail()
+    with timer.stage('serialization'):
+        return jsonify(payload)
+
+def json_error(timer, message, status=200):
+    timer.fail()
+    return jsonify({'error': message}), status
+
+def sse_event(event, data):
+    """Format one Server-Sent Event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def sse_response(events):
+    """Wrap an event generator in a streaming text/event-stream response"""
+    return Response(
+        stream_with_context(events),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.route('/analyze', methods=['POST'])
+@instrumented('analyze')
 def analyze_document():
     """Analyze uploaded document"""
+    timer = current_timer()
+    try:
+        analysis_type, text, error = read_analysis_input()
+        timer.type = metric_type(analysis_type, ANALYSIS_TEMPLATES)
+        if error:
+            return json_error(timer, error)
+        timer.input_chars = len(text)
+        text, compaction = compact_input(text)
+        text, retrieval = focus_on_question(text, analysis_type, request.form.get('question'))
+        
+        result, chunks, cached, reused = run_analysis(text, analysis_type, request.form.get('near_duplicate'))
+        
+        return json_result(timer, {
+            'success': True,
+            'result': result,
+            'analysis_type': analysis_type,
+            'result_id': store_analysis(analysis_type, result),
+            'chunks': chunks,
+            'cached': cached,
+            'near_duplicate': reused,
+            'retrieval': retrieval,
+            'compaction': compaction,
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        })
+        
+    except PageRangeError as e:
+        return json_error(timer, str(e), 400)
+    except DocumentTooLongError as e:
+        return json_error(timer, str(e), 413)
+    except Exception as e:
+        logger.error(f"Analysis error: {str(e)}")
+        return json_error(timer, f'Analysis failed: {str(e)}')
+
+@app.route('/analyze/stream', methods=['POST'])
+def analyze_document_stream():
+    """Analyze uploaded document, streaming the result as Server-Sent Events.
+    
+    Goes through the result cache and near-duplicate index like run_analysis;
+    reused and cached analyses arrive as a single chunk.
+    """
+    retrieval = compaction = None
+    mode = near_duplicate_mode(request.form.get('near_duplicate'))
+    try:
+        analysis_type, text, error = read_analysis_input()
+        if not error:
+            text, compaction = compact_input(text)
+            text, retrieval = focus_on_question(text, analysis_type, request.form.get('question'))
+            # Rejected before streaming starts, like an oversized upload
+            split_analysis_chunks(text, legal_assistant.chunk_size(analysis_type))
+    except PageRangeError as e:
+        return jsonify({'error': str(e)}), 400
+    except DocumentTooLongError as e:
+        return jsonify({'error': str(e)}), 413
+    except Exception as e:
+        logger.error(f"Analysis error: {str(e)}")
+        analysis_type, text, error = None, None, f'Analysis failed: {str(e)}'
+    
+    def events():
+        if error:
+            yield sse_event('error', {'error': error})
+            return
+        if not legal_assistant.model_available:
+            yield sse_event('error', {'error': 'Gemini model not available. Please check your API key.'})
+            return
+        
+        cache_key, cached = lookup_analysis(text, analysis_type)
+        try:
+            meta = {'analysis_type': analysis_type, 'cached': bool(cached), 'near_duplicate': None,
+                    'retrieval': retrieval, 'compaction': compaction}
+            result = prompt = entry = None
+            if cached:
+                logger.info("Analysis served from cache")
+                result, meta['chunks'] = cached['result'], cached['chunks']
+            else:
+                entry, match = check_near_duplicate(text, analysis_type, mode)
+                if match and (mode == 'note' or not (match['differing'] or match['removed'])):
+                    NEAR_DUPLICATE_REUSES.inc(mode='note')
+                    result, meta['chunks'] = near_duplicate_note(match), match['chunks']
+                    meta['near_duplicate'] = near_duplicate_summary(match, 'note')
+                changes_text = match and result is None and near_duplicate_changes(match)
+                if changes_text:
+                    update_key, updated = lookup_near_duplicate_update(text, analysis_type, match)
+                    if updated:
+                        result = updated['result']
+                    else:
+                        prompt = legal_assistant.build_near_duplicate_prompt(match['result'], changes_text, analysis_type)
+                    if updated or prompt:
+                        NEAR_DUPLICATE_REUSES.inc(mode='reanalyze')
+                        meta.update(chunks=1, cached=bool(updated),
+                                    near_duplicate=near_duplicate_summary(match, 'reanalyze'))
+                        # Only full analyses are indexed, so updates never build on other updates
+                        cache_key, entry = update_key, None
+                if result is None and prompt is None:
+                    logger.info(f"Starting streaming analysis with text length: {len(text)}")
+                    prompt, meta['chunks'] = legal_assistant.build_analysis_prompt(text, analysis_type)
+            
+            yield sse_event('meta', meta)
+            if result is not None:
+                yield sse_event('chunk', {'text': result})
+            else:
+                parts = []
+                for part in legal_assistant.generate_stream(prompt, analysis_type):
+                    parts.append(part)
+                    yield sse_event('chunk', {'text': part})
+                result = ''.join(parts)
+                if result:
+                    result_cache.set(cache_key, {'result': result, 'chunks': meta['chunks']})
+                    index_analysis(entry, result, meta['chunks'])
+                logger.info("Streaming analysis completed")
+            yield sse_event('done', {
+                'result_id': store_analysis(analysis_type, result),
+                'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            })
+        except UpstreamBusyError:
+            yield sse_event('error', {'error': BUSY_MESSAGE[len("Error: "):]})
+        except Exception as e:
+            logger.error(f"Analysis error: {str(e)}")
+            yield sse_event('error', {'error': f'Error analyzing document: {str(e)}. Please check your API key and try again.'})
+    
+    return sse_response(events())
+
+def analysis_job(analysis_type, text, filename, upload, pages=None, question=None):
+    """Background job: extract the uploaded file (if any) and analyze it"""
+    if filename:
+        with upload:
+            text, error = extract_text_from_upload(filename, upload, pages)
+        if error:
+            raise ValueError(error)
+    if not text or not text.strip():
+        raise ValueError('No text provided for analysis. Please upload a file or paste text.')
+    check_job()
+    text, compaction = compact_input(text)
+    text, retrieval = focus_on_question(text, analysis_type, question)
+    check_job()
+    
+    result, chunks, cached, reused = run_analysis(text, analysis_type)
+    if is_error_result(result):
+        raise RuntimeError(result)
+    return {
+        'result': result,
+        'analysis_type': analysis_type,
+        'chunks': chunks,
+        'cached': cached,
+        'near_duplicate': reused,
+        'retrieval': retrieval,
+        'compaction': compaction,
+        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    }
+
+@app.route('/jobs/analyze', methods=['POST'])
+def submit_analysis_job():
+    """Queue an analysis and return its job id immediately"""
     try:
         analysis_type = request.form.get('analysis_type', 'document_summary')
         text = request.form.get('text', '')
         file = request.files.get('file')
+        pages = parse_page_range(request.form.get('pages', ''))
         
-        print(f"Analysis type: {analysis_type}")
-        print(f"Text length: {len(text)}")
-        print(f"File uploaded: {file.filename if file else 'None'}")
-        
+        filename, upload = None, None
         if file and file.filename:
-            filename = file.filename.lower()
-            if filename.endswith('.pdf'):
-                text = extract_text_from_pdf(file)
-                print(f"PDF text extracted, length: {len(text)}")
-            elif filename.endswith('.docx'):
-                text = extract_text_from_docx(file)
-                print(f"DOCX text extracted, length: {len(text)}")
-            elif filename.endswith('.txt'):
-                text = file.read().decode('utf-8')
-                print(f"TXT text extracted, length: {len(text)}")
+            # The upload stream is closed once the request ends, so hand the job
+            # its own spooled copy; it is deleted when closed or garbage collected
+            filename, upload = file.filename, tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_BYTES)
+            file.save(upload)
+            upload.seek(0)
+        elif not text.strip():
+            return jsonify({'error': 'No text provided for analysis. Please upload a file or paste text.'}), 400
+        
+        timeout = request.form.get('timeout', type=int)
+        job = job_queue.submit(analysis_job, analysis_type, text, filename, upload, pages,
+                               request.form.get('question'), timeout=timeout)
+        logger.info(f"Analysis job {job.id} queued")
+        
+        return jsonify({
+            'success': True,
+            'job_id': job.id,
+            'status': job.status,
+            'status_url': f'/jobs/{job.id}'
+        }), 202
+        
+    except PageRangeError as e:
+        return jsonify({'error': str(e)}), 400
+    except QueueFullError as e:
+        return jsonify({'error': str(e)}), 429, {'Retry-After': '5'}
+    except Exception as e:
+        logger.error(f"Job submission error: {str(e)}")
+        return jsonify({'error': f'Job submission failed: {str(e)}'}), 500
+
+@app.route('/jobs/<job_id>', methods=['GET', 'DELETE'])
+def job_status(job_id):
+    """Job status and result (GET) or cancellation (DELETE)"""
+    job = job_queue.cancel(job_id) if request.method == 'DELETE' else job_queue.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify({'success': True, **job.to_dict()})
+
+def batch_analysis_task(name, text, analysis_type):
+    """Analyze one (document, analysis type) pair of a batch and build its NDJSON record"""
+    try:
+        result, chunks, cached, reused = run_analysis(text, analysis_type)
+        if is_error_result(result):
+            return {'file': name, 'analysis_type': analysis_type, 'success': False, 'error': result}
+        return {
+            'file': name,
+            'analysis_type': analysis_type,
+            'success': True,
+            'result': result,
+            'chunks': chunks,
+            'cached': cached,
+            'near_duplicate': reused,
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        }
+    except Exception as e:
+        return {'file': name, 'analysis_type': analysis_type, 'success': False, 'error': str(e)}
+
+@app.route('/analyze/batch', methods=['POST'])
+def analyze_batch():
+    """Run several analysis types over several files, streaming NDJSON as each call finishes"""
+    try:
+        analysis_types = []
+        for value in request.form.getlist('analysis_types'):
+            analysis_types.extend(t.strip() for t in value.split(',') if t.strip())
+        if not analysis_types:
+            return jsonify({'error': 'Please provide at least one analysis type.'}), 400
+        concurrency = max(1, min(request.form.get('concurrency', BATCH_CONCURRENCY, type=int), BATCH_MAX_WORKERS))
+        pages = parse_page_range(request.form.get('pages', ''))
+        
+        # Extract and compact every document exactly once, whatever the number of analysis types
+        documents = []
+        errors = []
+        tokens_saved = 0
+        text = request.form.get('text', '')
+        if text.strip():
+            text, compaction = compact_input(text)
+            tokens_saved += compaction['tokens_saved']
+            documents.append(('text', text))
+        for file in request.files.getlist('files'):
+            if not file.filename:
+                continue
+            file_text, error = extract_text_from_upload(file.filename, file, pages)
+            if error or not file_text or not file_text.strip():
+                errors.append({'file': file.filename, 'success': False,
+                               'error': error or 'No text could be extracted from this file.'})
             else:
-                return jsonify({'error': 'Unsupported file format. Please upload PDF, DOCX, or TXT.'})
+                file_text, compaction = compact_input(file_text)
+                tokens_saved += compaction['tokens_saved']
+                documents.append((file.filename, file_text))
+        if not documents and not errors:
+            return jsonify({'error': 'No text provided for analysis. Please upload files or paste text.'}), 400
         
-        if not text or not text.strip():
-            return jsonify({'error': 'No text provided for analysis. Please upload a file or paste text.'})
+        logger.info(f"Batch analysis: {len(documents)} documents x {len(analysis_types)} types, concurrency {concurrency}")
+    except PageRangeError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Batch analysis error: {str(e)}")
+        return jsonify({'error': f'Batch analysis failed: {str(e)}'}), 400
+    
+    tasks = [(name, doc_text, analysis_type) for name, doc_text in documents for analysis_type in analysis_types]
+    
+    def records():
+        for error in errors:
+            yield json.dumps(error) + "\n"
         
-        # Limit text length for free API
-        if len(text) > 10000:
-            original_length = len(text)
-            text = text[:10000] + f"\n\n[Document truncated from {original_length} to 10000 characters due to length limitations]"
-            print(f"Text truncated from {original_length} to 10000 characters")
+        # Keep at most `concurrency` calls in flight and emit each as it finishes
+        pending = set()
+        queued = iter(tasks)
+        for task in queued:
+            pending.add(batch_executor.submit(batch_analysis_task, *task))
+            if len(pending) >= concurrency:
+                break
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield json.dumps(future.result()) + "\n"
+                task = next(queued, None)
+                if task:
+                    pending.add(batch_executor.submit(batch_analysis_task, *task))
         
-        print(f"Starting analysis with text length: {len(text)}")
-        result = legal_assistant.analyze_document(text, analysis_type)
-        print("Analysis completed successfully")
+        yield json.dumps({'done': True, 'documents': len(documents), 'results': len(tasks),
+                          'tokens_saved': tokens_saved}) + "\n"
+    
+    return Response(
+        stream_with_context(records()),
+        mimetype='application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def relevant_findings(results, question):
+    """Paragraphs of a session's earlier analyses that best match the question"""
+    paragraphs = [
+        (analysis_type, paragraph.strip())
+        for analysis_type, result in results.items()
+        for paragraph in result.split('\n\n') if paragraph.strip()
+    ]
+    if not paragraphs:
+        return ''
+    index = ClauseIndex([paragraph for _, paragraph in paragraphs])
+    selected = index.select(question, SESSION_RESULTS_TOKENS, k=6)
+    return "\n\n".join(f"[{paragraphs[i][0].replace('_', ' ')}]\n{paragraphs[i][1]}" for i in selected)
+
+def follow_up_context(session, question):
+    """Earlier conversation, relevant earlier findings, the question and the relevant clauses.
+    
+    Returns (context, retrieval) where retrieval describes the selected clauses,
+    or is None when the whole document is sent.
+    """
+    parts = []
+    history = summarize_history(session['turns'], SESSION_HISTORY_TOKENS)
+    if history:
+        parts.append(f"EARLIER CONVERSATION:\n{history}")
+    with stage('retrieval'):
+        findings = relevant_findings(session['results'], question)
+    if findings:
+        parts.append(f"YOUR EARLIER FINDINGS (excerpts):\n{findings}")
+    parts.append(f"QUESTION:\n{question}")
+    
+    text = session['text']
+    if estimate_tokens(text) <= RETRIEVAL_TOKEN_BUDGET:
+        parts.append(f"DOCUMENT:\n{text}")
+        return "\n\n".join(parts), None
+    
+    with stage('retrieval'):
+        index = clause_indexes.get(text)
+        context, clause_ids = build_question_context(index, question, RETRIEVAL_TOKEN_BUDGET, RETRIEVAL_TOP_K)
+    if context:
+        parts.append(f"RELEVANT EXCERPTS FROM THE DOCUMENT (clause numbers refer to the full document):\n{context}")
+    else:
+        # Nothing matches the wording of the question: send the opening of the
+        # document (parties, definitions) and rely on the earlier findings
+        opening, _ = fit_to_budget(text, RETRIEVAL_TOKEN_BUDGET)
+        parts.append(f"OPENING OF THE DOCUMENT:\n{opening}")
+    return "\n\n".join(parts), {'clauses': [clause_id + 1 for clause_id in clause_ids],
+                                  'total_clauses': len(index.clauses)}
+
+def session_summary(session):
+    """Public view of a session"""
+    return {
+        'session_id': session['id'],
+        'filename': session['filename'],
+        'document_chars': len(session['text']),
+        'document_tokens': estimate_tokens(session['text']),
+        'analyses': sorted(session['results']),
+        'turns': len(session['turns']),
+        'created': datetime.fromtimestamp(session['created'], tz=timezone.utc).isoformat(),
+        'expires': datetime.fromtimestamp(session['updated'] + SESSION_TTL, tz=timezone.utc).isoformat(),
+    }
+
+@app.route('/sessions', methods=['POST'])
+@instrumented('session_create')
+def create_session():
+    """Extract an uploaded file (or pasted text) once and keep it for follow-up questions.
+    
+    With an analysis_type field the document is also analyzed right away.
+    """
+    timer = current_timer()
+    try:
+        analysis_type, text, error = read_analysis_input()
+        if error:
+            return json_error(timer, error)
+        timer.input_chars = len(text)
+        text, compaction = compact_input(text)
+        if len(text) > SESSION_MAX_BYTES:
+            return json_error(timer, 'Document too large to keep in a session.')
+        upload = request.files.get('file')
+        session_id = session_store.create(upload.filename if upload and upload.filename else None, text)
         
-        return jsonify({
+        payload = {'success': True, 'session_id': session_id, 'compaction': compaction}
+        if request.form.get('analysis_type'):
+            timer.type = metric_type(analysis_type, ANALYSIS_TEMPLATES)
+            result, chunks, cached, reused = run_analysis(text, analysis_type)
+            if not is_error_result(result):
+                session_store.add_result(session_id, analysis_type, result)
+            payload.update({'result': result, 'analysis_type': analysis_type, 'chunks': chunks, 'cached': cached,
+                            'near_duplicate': reused})
+            timer.output_chars = len(result)
+            if is_error_result(result):
+                timer.fail()
+        payload.update(session_summary(session_store.get(session_id)))
+        payload['timestamp'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        with stage('serialization'):
+            return jsonify(payload)
+    
+    except PageRangeError as e:
+        return json_error(timer, str(e), 400)
+    except Exception as e:
+        logger.error(f"Session error: {str(e)}")
+        return json_error(timer, f'Could not start the session: {str(e)}')
+
+@app.route('/sessions/<session_id>', methods=['GET', 'DELETE'])
+def session_detail(session_id):
+    """Session details with its questions so far (GET), or end the session (DELETE)"""
+    if request.method == 'DELETE':
+        if not session_store.delete(session_id):
+            return jsonify({'error': 'Session not found or expired.'}), 404
+        return jsonify({'success': True})
+    session = session_store.get(session_id)
+    if session is None:
+        return jsonify({'error': 'Session not found or expired.'}), 404
+    details = session_summary(session)
+    details['questions'] = [turn['question'] for turn in session['turns']]
+    return jsonify({'success': True, **details})
+
+@app.route('/sessions/<session_id>/analyze', methods=['POST'])
+@instrumented('session_analyze')
+def analyze_session(session_id):
+    """Run another analysis type on a session's document without re-uploading it"""
+    timer = current_timer()
+    try:
+        session = session_store.get(session_id)
+        if session is None:
+            return json_error(timer, 'Session not found or expired. Please upload the document again.')
+        analysis_type = request.form.get('analysis_type', 'document_summary')
+        timer.type = metric_type(analysis_type, ANALYSIS_TEMPLATES)
+        timer.input_chars = len(session['text'])
+        
+        result = session['results'].get(analysis_type)
+        chunks, cached, reused = None, result is not None, None
+        if result is None:
+            result, chunks, cached, reused = run_analysis(session['text'], analysis_type)
+            if not is_error_result(result):
+                session_store.add_result(session_id, analysis_type, result)
+        
+        return json_result(timer, {
             'success': True,
+            'session_id': session_id,
             'result': result,
             'analysis_type': analysis_type,
+            'chunks': chunks,
+            'cached': cached,
+            'near_duplicate': reused,
             'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         })
+    
+    except Exception as e:
+        logger.error(f"Session analysis error: {str(e)}")
+        return json_error(timer, f'Analysis failed: {str(e)}')
+
+@app.route('/sessions/<session_id>/ask', methods=['POST'])
+@instrumented('session_ask')
+def ask_session(session_id):
+    """Answer a follow-up question from the relevant clauses, earlier findings and conversation"""
+    timer = current_timer()
+    try:
+        session = session_store.get(session_id)
+        if session is None:
+            return json_error(timer, 'Session not found or expired. Please upload the document again.')
+        question = request.form.get('question', '').strip()
+        if not question:
+            return json_error(timer, 'Please provide a question.')
+        timer.type = 'follow_up'
+        timer.input_chars = len(question)
+        
+        context, retrieval = follow_up_context(session, question)
+        result = legal_assistant.answer_follow_up(context)
+        if not is_error_result(result):
+            session_store.add_turn(session_id, question, result)
         
+        return json_result(timer, {
+            'success': True,
+            'session_id': session_id,
+            'result': result,
+            'retrieval': retrieval,
+            'prompt_tokens': legal_assistant.prompts.follow_up.static_tokens + estimate_tokens(context),
+            'document_tokens': estimate_tokens(session['text']),
+            'turn': len(session['turns']) + 1,
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        })
+    
     except Exception as e:
-        print(f"Analysis error: {str(e)}")
-        return jsonify({'error': f'Analysis failed: {str(e)}'})
+        logger.error(f"Follow-up error: {str(e)}")
+        return json_error(timer, f'Follow-up failed: {str(e)}')
+
+def read_compare_input():
+    """Previous and new contract versions from old_file/new_file uploads or old_text/new_text.
+
+    Returns (old_text, new_text, error) with both texts compacted.
+    """
+    with stage('file_read'):
+        form = request.form
+        files = request.files
+    texts = []
+    for side, label in (('old', 'previous'), ('new', 'new')):
+        upload = files.get(f'{side}_file')
+        text = form.get(f'{side}_text', '')
+        if upload and upload.filename:
+            text, error = extract_text_from_upload(upload.filename, upload)
+            if error:
+                return None, None, error
+        if not text or not text.strip():
+            return None, None, f'No text provided for the {label} version. Please upload a file or paste text.'
+        texts.append(compact_input(text)[0])
+    return texts[0], texts[1], None
+
+def diff_versions(old_text, new_text):
+    """Clause alignment of two versions; returns (changes, stats)"""
+    with stage('diff'):
+        changes, stats = compare_versions(old_text, new_text)
+    logger.info(f"Version diff: {stats['modified']} modified, {stats['added']} added, "
+                f"{stats['removed']} removed of {stats['new_clauses']} clauses")
+    return changes, stats
+
+def change_summary(change):
+    """A change without its clause texts"""
+    return {key: value for key, value in change.items() if key not in ('old', 'new')}
+
+@app.route('/compare', methods=['POST'])
+@instrumented('compare')
+def compare_documents():
+    """Redline risk analysis of two contract versions; only the changed clauses go to the model"""
+    timer = current_timer()
+    try:
+        old_text, new_text, error = read_compare_input()
+        if error:
+            return json_error(timer, error)
+        timer.input_chars = len(old_text) + len(new_text)
+        changes, stats = diff_versions(old_text, new_text)
+
+        if not changes:
+            result, cached = 'No differences found: both versions contain the same clauses.', False
+        else:
+            with stage('prompt_build'):
+                changes_text = render_changes(changes, stats)
+            stats['prompt_tokens'] = estimate_tokens(changes_text) + legal_assistant.prompts.redline.static_tokens
+            with stage('cache_lookup'):
+                cache_key = make_cache_key(changes_text, 'compare:redline', legal_assistant.model_signature('contract_compare'),
+                                           legal_assistant.prompts.redline.version)
+                entry = result_cache.get(cache_key)
+            cached = entry is not None
+            if cached:
+                result = entry['result']
+            else:
+                result = legal_assistant.analyze_changes(changes_text)
+                if not is_error_result(result):
+                    result_cache.set(cache_key, {'result': result, 'chunks': 1})
+
+        return json_result(timer, {
+            'success': True,
+            'result': result,
+            'result_id': store_analysis('contract_compare', result),
+            'stats': stats,
+            'changes': [change_summary(change) for change in changes],
+            'cached': cached,
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        })
+
+    except Exception as e:
+        logger.error(f"Comparison error: {str(e)}")
+        return json_error(timer, f'Comparison failed: {str(e)}')
+
+@app.route('/compare/diff', methods=['POST'])
+@instrumented('compare_diff')
+def compare_documents_diff():
+    """Clause-level diff of two contract versions without a model call"""
+    timer = current_timer()
+    try:
+        old_text, new_text, error = read_compare_input()
+        if error:
+            return json_error(timer, error)
+        timer.input_chars = len(old_text) + len(new_text)
+        changes, stats = diff_versions(old_text, new_text)
+        with stage('serialization'):
+            return jsonify({'success': True, 'stats': stats, 'changes': changes})
+
+    except Exception as e:
+        logger.error(f"Comparison error: {str(e)}")
+        return json_error(timer, f'Comparison failed: {str(e)}')
+
+def read_draft_input():
+    """Collect document type and requirements from the form.
+    
+    Returns (doc_type, requirements, error) where error is a message for the client.
+    """
+    return parse_draft_input(request.form)
+
+def parse_draft_input(form):
+    """Document type and requirements from submitted form fields; returns (doc_type, requirements, error)"""
+    doc_type = form.get('doc_type', 'service_agreement')
+    requirements = form.get('requirements', '')
+    
+    logger.debug(f"Document type: {doc_type}")
+    logger.debug(f"Requirements length: {len(requirements)}")
+    
+    if not requirements.strip():
+        return doc_type, None, 'Please provide requirements for the document.'
+    return doc_type, requirements, None
 
 @app.route('/draft', methods=['POST'])
+@instrumented('draft')
 def draft_document():
     """Draft legal document"""
+    timer = current_timer()
     try:
-        doc_type = request.form.get('doc_type', 'service_agreement')
-        requirements = request.form.get('requirements', '')
+        with stage('file_read'):
+            doc_type, requirements, error = read_draft_input()
+        timer.type = metric_type(doc_type, DRAFT_TEMPLATES)
+        if error:
+            return json_error(timer, error)
+        timer.input_chars = len(requirements)
         
-        print(f"Document type: {doc_type}")
-        print(f"Requirements length: {len(requirements)}")
+        cache_key, cached = lookup_draft(doc_type, requirements)
+        if cached:
+            result = cached['result']
+            logger.info("Draft served from cache")
+        else:
+            logger.info("Starting document drafting...")
+            result = legal_assistant.draft_document(doc_type, requirements)
+            logger.info("Document drafting completed")
+            if not is_error_result(result):
+                result_cache.set(cache_key, {'result': result})
         
+        draft_id = None if is_error_result(result) else draft_store.put(doc_type, requirements, result)
+        return json_result(timer, {
+            'success': True,
+            'result': result,
+            'doc_type': doc_type,
+            'draft_id': draft_id,
+            'cached': bool(cached),
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        })
+        
+    except Exception as e:
+        logger.error(f"Drafting error: {str(e)}")
+        return json_error(timer, f'Document drafting failed: {str(e)}')
+
+@app.route('/draft/stream', methods=['POST'])
+def draft_document_stream():
+    """Draft legal document, streaming the result as Server-Sent Events"""
+    doc_type, requirements, error = read_draft_input()
+    
+    def events():
+        if error:
+            yield sse_event('error', {'error': error})
+            return
+        if not legal_assistant.model_available:
+            yield sse_event('error', {'error': 'Gemini model not available. Please check your API key.'})
+            return
+        
+        cache_key, cached = lookup_draft(doc_type, requirements)
+        try:
+            yield sse_event('meta', {'doc_type': doc_type, 'cached': bool(cached)})
+            if cached:
+                logger.info("Draft served from cache")
+                result = cached['result']
+                yield sse_event('chunk', {'text': result})
+            else:
+                logger.info("Starting streaming document drafting...")
+                parts = []
+                prompt = legal_assistant.build_draft_prompt(doc_type, requirements)
+                for part in legal_assistant.generate_stream(prompt, doc_type):
+                    parts.append(part)
+                    yield sse_event('chunk', {'text': part})
+                result = ''.join(parts)
+                if result:
+                    result_cache.set(cache_key, {'result': result})
+                logger.info("Streaming document drafting completed")
+            yield sse_event('done', {
+                'draft_id': draft_store.put(doc_type, requirements, result) if result else None,
+                'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            })
+        except UpstreamBusyError:
+            yield sse_event('error', {'error': BUSY_MESSAGE[len("Error: "):]})
+        except Exception as e:
+            logger.error(f"Drafting error: {str(e)}")
+            yield sse_event('error', {'error': f'Error drafting document: {str(e)}. Please check your API key and try again.'})
+    
+    return sse_response(events())
+
+@app.route('/draft/revise', methods=['POST'])
+@instrumented('draft_revise')
+def revise_draft():
+    """Apply changed requirements to a stored draft, regenerating only the sections they touch"""
+    timer = current_timer()
+    try:
+        draft_id = request.form.get('draft_id', '')
+        requirements = request.form.get('requirements', '')
+        draft = draft_store.get(draft_id)
+        if draft is None or draft['kind'] != 'draft':
+            return json_error(timer, 'Draft not found or expired. Please generate the document again.')
         if not requirements.strip():
-            return jsonify({'error': 'Please provide requirements for the document.'})
+            return json_error(timer, 'Please provide requirements for the document.')
+        timer.type = metric_type(draft['doc_type'], DRAFT_TEMPLATES)
+        timer.input_chars = len(requirements)
         
-        print("Starting document drafting...")
-        result = legal_assistant.draft_document(doc_type, requirements)
-        print("Document drafting completed")
+        changes = diff_requirements(draft['requirements'], requirements)
+        sections = split_into_sections(draft['content'])
         
-        return jsonify({
+        # Sections may also be named explicitly by their index in changed_sections
+        explicit = [int(i) for i in request.form.get('sections', '').split(',') if i.strip().isdigit()]
+        if explicit:
+            indexes = sorted({i for i in explicit if 0 <= i < len(sections) and sections[i].strip()})
+        elif changes:
+            with stage('retrieval'):
+                indexes = sections_touched(sections, changes)
+        else:
+            indexes = []
+        
+        if not indexes and not changes:
+            result, mode = draft['content'], 'unchanged'
+        elif not indexes or len(indexes) > DRAFT_REVISION_MAX_SHARE * len(sections):
+            logger.info(f"Revision touches {len(indexes)} of {len(sections)} sections, regenerating the whole draft")
+            result, mode = legal_assistant.draft_document(draft['doc_type'], requirements), 'full'
+            indexes = []
+        else:
+            logger.info(f"Revising {len(indexes)} of {len(sections)} draft sections")
+            result, mode = legal_assistant.revise_draft(
+                draft['doc_type'], requirements, changes or ["(no change listed; revise as requested)"],
+                sections, indexes
+            ), 'sections'
+        
+        version = draft['version']
+        if not is_error_result(result) and mode != 'unchanged':
+            version = draft_store.update(draft_id, requirements, result)
+        
+        return json_result(timer, {
             'success': True,
             'result': result,
-            'doc_type': doc_type,
+            'doc_type': draft['doc_type'],
+            'draft_id': draft_id,
+            'version': version,
+            'mode': mode,
+            'changed_sections': [{'index': i, 'heading': section_heading(sections[i])} for i in indexes],
+            'total_sections': len(sections),
             'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         })
         
     except Exception as e:
-        print(f"Drafting error: {str(e)}")
-        return jsonify({'error': f'Document drafting failed: {str(e)}'})
+        logger.error(f"Revision error: {str(e)}")
+        return json_error(timer, f'Document revision failed: {str(e)}')
+
+def render_export(item, export_format):
+    """Rendered bytes of a stored draft or result, or an iterator of PDF chunks on a cache miss"""
+    title = item['doc_type'].replace('_', ' ').title()
+    with stage('serialization'):
+        if export_format == 'txt':
+            return render_txt(item['content'])
+        if export_format == 'docx':
+            return render_docx(item['content'], title)
+    
+    def pdf_chunks():
+        # Streamed to the client as it is produced and cached once complete
+        chunks = []
+        for chunk in iter_pdf(item['content'], title):
+            chunks.append(chunk)
+            yield chunk
+        draft_store.put_artifact(item['id'], item['version'], 'pdf', b''.join(chunks))
+    return pdf_chunks()
+
+@app.route('/download/<item_id>')
+@instrumented('download')
+def download_item(item_id):
+    """Download a stored draft or analysis result as TXT, DOCX or PDF (?format=)"""
+    timer = current_timer()
+    export_format = request.args.get('format', 'txt').lower()
+    if export_format not in EXPORT_MIMETYPES:
+        return jsonify({'error': f"Unsupported format. Choose one of: {', '.join(EXPORT_MIMETYPES)}."}), 400
+    item = draft_store.get(item_id)
+    if item is None:
+        return jsonify({'error': 'Document not found or expired. Please generate it again.'}), 404
+    timer.type = export_format
+    timer.output_chars = len(item['content'])
+    
+    gzipped = (export_format in COMPRESSIBLE_FORMATS and len(item['content']) >= DOWNLOAD_GZIP_MIN_BYTES
+               and 'gzip' in request.accept_encodings)
+    artifact = f"{export_format}.gz" if gzipped else export_format
+    etag = f"{item['id']}-{item['version']}-{artifact}"
+    if request.if_none_match.contains(etag):
+        body = b''
+    else:
+        with stage('cache_lookup'):
+            body = draft_store.get_artifact(item['id'], item['version'], artifact)
+        if body is None:
+            body = render_export(item, export_format)
+            if gzipped:
+                with stage('serialization'):
+                    body = gzip.compress(body, compresslevel=6, mtime=0)
+            # Plain text is just the stored content encoded, not worth a second copy
+            if isinstance(body, bytes) and artifact != 'txt':
+                draft_store.put_artifact(item['id'], item['version'], artifact, body)
+    
+    response = Response(body, mimetype=EXPORT_MIMETYPES[export_format])
+    if gzipped:
+        response.content_encoding = 'gzip'
+    response.vary.add('Accept-Encoding')
+    response.set_etag(etag)
+    response.last_modified = datetime.fromtimestamp(item['updated'], tz=timezone.utc)
+    # Browsers keep the file but revalidate it with If-None-Match on every download
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    created = datetime.fromtimestamp(item['created']).strftime('%Y%m%d_%H%M%S')
+    prefix = 'legal_document' if item['kind'] == 'draft' else f"legal_{item['doc_type']}"
+    response.headers['Content-Disposition'] = f'attachment; filename="{prefix}_{created}.{export_format}"'
+    return response.make_conditional(request)
 
 @app.route('/download_draft', methods=['POST'])
 def download_draft():
-    """Download drafted document as text file"""
+    """Download drafted document as text file (superseded by GET /download/<id>)"""
     try:
         content = request.json.get('content', '')
         if not content:
@@ -546,15 +1821,131 @@ def download_draft():
     except Exception as e:
         return jsonify({'error': f'Download failed: {str(e)}'})
 
+def admin_error():
+    """Error response for a request the admin endpoints refuse, or None.
+    
+    Without ADMIN_TOKEN the endpoints are disabled rather than open.
+    """
+    if not ADMIN_TOKEN:
+        return jsonify({'error': 'Admin endpoints are disabled. Set ADMIN_TOKEN to enable them.'}), 403
+    if not hmac.compare_digest(request.headers.get('X-Admin-Token', '').encode(), ADMIN_TOKEN.encode()):
+        return jsonify({'error': 'Unauthorized'}), 401
+    return None
+
+@app.route('/admin/cache', methods=['GET', 'DELETE'])
+def admin_cache():
+    """Result cache statistics (GET) and invalidation (DELETE, optional ?key=)"""
+    error = admin_error()
+    if error:
+        return error
+    
+    if request.method == 'DELETE':
+        removed = result_cache.invalidate(request.args.get('key'))
+        return jsonify({'success': True, 'removed': removed})
+    
+    return jsonify({'success': True, 'stats': result_cache.get_stats()})
+
+@app.route('/admin/extraction_cache', methods=['GET', 'DELETE'])
+def admin_extraction_cache():
+    """Extraction cache statistics (GET) and clearing (DELETE)"""
+    error = admin_error()
+    if error:
+        return error
+    if not extraction_cache:
+        return jsonify({'error': 'Extraction cache is disabled'}), 404
+    
+    if request.method == 'DELETE':
+        extraction_cache.clear()
+        return jsonify({'success': True})
+    
+    return jsonify({'success': True, 'stats': extraction_cache.get_stats()})
+
+@app.route('/admin/near_duplicates', methods=['GET', 'DELETE'])
+def admin_near_duplicates():
+    """Near-duplicate index statistics (GET) and clearing (DELETE)"""
+    error = admin_error()
+    if error:
+        return error
+    if not near_duplicate_index:
+        return jsonify({'error': 'Near-duplicate index is disabled'}), 404
+
+    if request.method == 'DELETE':
+        near_duplicate_index.clear()
+        return jsonify({'success': True})
+
+    return jsonify({'success': True, 'mode': NEAR_DUPLICATE_MODE, 'stats': near_duplicate_index.get_stats()})
+
+@app.route('/admin/prompts')
+def admin_prompts():
+    """Prompt template versions and static sizes"""
+    error = admin_error()
+    if error:
+        return error
+    return jsonify({'success': True, 'templates': legal_assistant.prompts.describe()})
+
+@app.route('/admin/model')
+def admin_model():
+    """Model client call, retry, coalescing and error counters"""
+    error = admin_error()
+    if error:
+        return error
+    if not legal_assistant.model_available:
+        return jsonify({'error': 'Model not available'}), 404
+    return jsonify({'success': True, 'stats': legal_assistant.client.get_stats()})
+
+@app.route('/admin/jobs')
+def admin_jobs():
+    """Background job queue statistics"""
+    error = admin_error()
+    if error:
+        return error
+    return jsonify({'success': True, 'stats': job_queue.get_stats()})
+
+@app.route('/admin/sessions')
+def admin_sessions():
+    """Document session count, memory held and evictions"""
+    error = admin_error()
+    if error:
+        return error
+    return jsonify({'success': True, 'stats': session_store.get_stats()})
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus metrics for this process"""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+def health_payload():
+    """Liveness and readiness details; never triggers loading the model itself"""
+    if not legal_assistant.loaded:
+        model_status = "not_loaded"
+    else:
+        model_status = "available" if legal_assistant.model_available else "unavailable"
+    return {
+        'status': 'healthy',
+        'live': True,
+        # Ready once the deferred libraries are loaded and the model is usable;
+        # a model that failed to load (e.g. no API key) never becomes ready
+        'ready': legal_assistant.loaded and legal_assistant.model_available,
+        'model_status': model_status,
+        'prewarm': startup.prewarm_state(),
+        'timestamp': datetime.now().isoformat()
+    }
+
 @app.route('/health')
 def health_check():
     """Health check endpoint"""
-    model_status = "available" if legal_assistant.model_available else "unavailable"
-    return jsonify({
-        'status': 'healthy', 
-        'model_status': model_status,
-        'timestamp': datetime.now().isoformat()
-    })
+    return jsonify(health_payload())
+
+@app.route('/health/live')
+def health_live():
+    """Liveness probe: the process is up and serving"""
+    return jsonify({'live': True})
+
+@app.route('/health/ready')
+def health_ready():
+    """Readiness probe: 503 until pre-warming has loaded the model"""
+    payload = health_payload()
+    return jsonify(payload), 200 if payload['ready'] else 503
 
 @app.route('/test')
 def test_page():
@@ -581,7 +1972,7 @@ def test_page():
     '''.format("Available" if legal_assistant.model_available else "Unavailable - Check API Key")
 
 if __name__ == '__main__':
-    print("Starting AI Legal Assistant...")
-    print(f"Gemini API Key: {'Set' if GEMINI_API_KEY else 'Not Set'}")
-    print(f"Model Available: {legal_assistant.model_available}")
+    logger.info("Starting AI Legal Assistant...")
+    logger.info(f"Gemini API Key: {'Set' if GEMINI_API_KEY else 'Not Set'}")
+    startup.start_prewarm()
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
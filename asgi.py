@@ -0,0 +1,267 @@
+"""ASGI entry point for production serving.
+
+/analyze, /draft and /health are served by async handlers: model calls are
+awaited on the event loop and extraction runs in a thread pool, so one
+process holds hundreds of concurrent model calls. Every other route is
+served by the Flask app unchanged.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+"""
+import asyncio
+import contextlib
+import contextvars
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.datastructures import UploadFile
+from starlette.responses import JSONResponse
+from starlette.routing import Mount, Route
+
+import startup
+from app import (
+    MAX_UPLOAD_BYTES, METRICS_TIMING_HEADER, DocumentTooLongError, app as flask_app,
+    check_near_duplicate, compact_input, draft_store, focus_on_question, health_payload, index_analysis,
+    is_error_result, legal_assistant, logger, lookup_analysis, lookup_draft, lookup_near_duplicate_update,
+    metric_type, near_duplicate_changes, near_duplicate_mode, near_duplicate_note, near_duplicate_summary,
+    parse_analysis_input, parse_draft_input, result_cache, store_analysis
+)
+from extraction import PageRangeError
+from metrics import NEAR_DUPLICATE_REUSES, track_request
+from prompts import ANALYSIS_TEMPLATES, DRAFT_TEMPLATES
+
+# Threads for CPU-bound and blocking work (extraction, compaction, cache I/O)
+BLOCKING_WORKERS = int(os.getenv('ASGI_BLOCKING_WORKERS', str(min(32, (os.cpu_count() or 1) + 4))))
+# Threads serving the Flask routes mounted under the ASGI app
+WSGI_WORKERS = int(os.getenv('ASGI_WSGI_WORKERS', '16'))
+
+blocking_executor = ThreadPoolExecutor(max_workers=BLOCKING_WORKERS)
+
+
+def run_blocking(func, *args):
+    """Run func in the blocking pool with the caller's context, so stage timings still apply"""
+    context = contextvars.copy_context()
+    return asyncio.get_running_loop().run_in_executor(blocking_executor, functools.partial(context.run, func, *args))
+
+
+def instrumented(route):
+    """Async counterpart of app.instrumented; the handler receives the request timer"""
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(request):
+            with track_request(route) as timer:
+                try:
+                    response = await handler(request, timer)
+                except Exception:
+                    timer.fail()
+                    timer.finish()
+                    raise
+                finally:
+                    # Deletes any spooled upload files right away
+                    await request.close()
+                if response.status_code >= 400:
+                    timer.fail()
+                total = timer.finish()
+                if METRICS_TIMING_HEADER or request.headers.get('x-request-timing') == '1':
+                    response.headers['Server-Timing'] = timer.server_timing(total)
+                return response
+        return wrapper
+    return decorator
+
+
+def json_result(timer, payload):
+    timer.output_chars = len(payload['result'])
+    if is_error_result(payload['result']):
+        timer.fail()
+    with timer.stage('serialization'):
+        return JSONResponse(payload)
+
+
+def json_error(timer, message, status=200):
+    timer.fail()
+    return JSONResponse({'error': message}, status_code=status)
+
+
+async def read_form(request):
+    """Parse the multipart form, or return None when it is over MAX_UPLOAD_BYTES.
+
+    Uploads are spooled to temporary files by Starlette. max_part_size only
+    limits text fields, and chunked bodies have no Content-Length, so the
+    parsed parts are measured as well.
+    """
+    length = request.headers.get('content-length')
+    if length and int(length) > MAX_UPLOAD_BYTES:
+        return None
+    form = await request.form(max_part_size=MAX_UPLOAD_BYTES)
+    size = sum(value.size or 0 if isinstance(value, UploadFile) else len(value) for _, value in form.multi_items())
+    if size > MAX_UPLOAD_BYTES:
+        await form.close()
+        return None
+    return form
+
+
+def too_large():
+    return JSONResponse(
+        {'error': f'File too large. The maximum upload size is {MAX_UPLOAD_BYTES // (1024 * 1024)} MB.'},
+        status_code=413
+    )
+
+
+async def run_analysis(text, analysis_type, near_duplicate=None):
+    """Async app.run_analysis; returns (result, chunks, cached, reused)"""
+    cache_key, cached = await run_blocking(lookup_analysis, text, analysis_type)
+    if cached:
+        logger.info("Analysis served from cache")
+        return cached['result'], cached['chunks'], True, None
+
+    mode = near_duplicate_mode(near_duplicate)
+    entry, match = await run_blocking(check_near_duplicate, text, analysis_type, mode)
+    if match and (mode == 'note' or not (match['differing'] or match['removed'])):
+        NEAR_DUPLICATE_REUSES.inc(mode='note')
+        return near_duplicate_note(match), match['chunks'], False, near_duplicate_summary(match, 'note')
+    changes_text = match and near_duplicate_changes(match)
+    if changes_text:
+        update_key, updated = await run_blocking(lookup_near_duplicate_update, text, analysis_type, match)
+        if updated:
+            result = updated['result']
+        else:
+            result = await legal_assistant.update_analysis_async(match['result'], changes_text, analysis_type)
+        if result is not None:
+            NEAR_DUPLICATE_REUSES.inc(mode='reanalyze')
+            if not updated and not is_error_result(result):
+                await run_blocking(result_cache.set, update_key, {'result': result, 'chunks': 1})
+            return result, 1, bool(updated), near_duplicate_summary(match, 'reanalyze')
+
+    logger.info(f"Starting analysis with text length: {len(text)}")
+    if len(text) > legal_assistant.chunk_size(analysis_type):
+        result, chunks = await legal_assistant.analyze_document_chunked_async(text, analysis_type)
+        logger.info(f"Chunked analysis completed over {chunks} chunks")
+    else:
+        result, chunks = await legal_assistant.analyze_document_async(text, analysis_type), 1
+        logger.info("Analysis completed successfully")
+    if not is_error_result(result):
+        await run_blocking(result_cache.set, cache_key, {'result': result, 'chunks': chunks})
+        await run_blocking(index_analysis, entry, result, chunks)
+    return result, chunks, False, None
+
+
+@instrumented('analyze')
+async def analyze_document(request, timer):
+    """Analyze uploaded document"""
+    try:
+        with timer.stage('file_read'):
+            form = await read_form(request)
+        if form is None:
+            return too_large()
+        upload = form.get('file')
+        if isinstance(upload, UploadFile) and upload.filename:
+            filename, file = upload.filename, upload.file
+        else:
+            filename, file = None, None
+
+        analysis_type, text, error = await run_blocking(parse_analysis_input, form, filename, file)
+        timer.type = metric_type(analysis_type, ANALYSIS_TEMPLATES)
+        if error:
+            return json_error(timer, error)
+        timer.input_chars = len(text)
+        text, compaction = await run_blocking(compact_input, text)
+        text, retrieval = await run_blocking(focus_on_question, text, analysis_type, form.get('question'))
+
+        result, chunks, cached, reused = await run_analysis(text, analysis_type, form.get('near_duplicate'))
+
+        return json_result(timer, {
+            'success': True,
+            'result': result,
+            'analysis_type': analysis_type,
+            'result_id': store_analysis(analysis_type, result),
+            'chunks': chunks,
+            'cached': cached,
+            'near_duplicate': reused,
+            'retrieval': retrieval,
+            'compaction': compaction,
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        })
+
+    except PageRangeError as e:
+        return json_error(timer, str(e), 400)
+    except DocumentTooLongError as e:
+        return json_error(timer, str(e), 413)
+    except Exception as e:
+        logger.error(f"Analysis error: {str(e)}")
+        return json_error(timer, f'Analysis failed: {str(e)}')
+
+
+@instrumented('draft')
+async def draft_document(request, timer):
+    """Draft legal document"""
+    try:
+        with timer.stage('file_read'):
+            form = await read_form(request)
+        if form is None:
+            return too_large()
+        doc_type, requirements, error = parse_draft_input(form)
+        timer.type = metric_type(doc_type, DRAFT_TEMPLATES)
+        if error:
+            return json_error(timer, error)
+        timer.input_chars = len(requirements)
+
+        cache_key, cached = await run_blocking(lookup_draft, doc_type, requirements)
+        if cached:
+            result = cached['result']
+            logger.info("Draft served from cache")
+        else:
+            logger.info("Starting document drafting...")
+            result = await legal_assistant.draft_document_async(doc_type, requirements)
+            logger.info("Document drafting completed")
+            if not is_error_result(result):
+                await run_blocking(result_cache.set, cache_key, {'result': result})
+
+        draft_id = None if is_error_result(result) else draft_store.put(doc_type, requirements, result)
+        return json_result(timer, {
+            'success': True,
+            'result': result,
+            'doc_type': doc_type,
+            'draft_id': draft_id,
+            'cached': bool(cached),
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        })
+
+    except Exception as e:
+        logger.error(f"Drafting error: {str(e)}")
+        return json_error(timer, f'Document drafting failed: {str(e)}')
+
+
+async def health_check(request):
+    """Health check endpoint"""
+    return JSONResponse(health_payload())
+
+
+async def health_ready(request):
+    """Readiness probe: 503 until pre-warming has loaded the model"""
+    payload = health_payload()
+    return JSONResponse(payload, status_code=200 if payload['ready'] else 503)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    # Load the model and parsers in the background once the server is accepting connections
+    startup.start_prewarm()
+    yield
+
+
+app = Starlette(routes=[
+    Route('/analyze', analyze_document, methods=['POST']),
+    Route('/draft', draft_document, methods=['POST']),
+    Route('/health', health_check),
+    Route('/health/ready', health_ready),
+    Mount('/', app=WSGIMiddleware(flask_app, workers=WSGI_WORKERS)),
+], lifespan=lifespan)
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    uvicorn.run(app, host='0.0.0.0', port=int(os.getenv('PORT', '5000')))
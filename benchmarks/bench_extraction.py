@@ -0,0 +1,94 @@
+"""Micro-benchmarks for PDF, DOCX and TXT text extraction across document sizes.
+
+    python -m benchmarks.bench_extraction --sizes 1,10,100,500 --output extraction.json
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from docx import Document
+
+from benchmarks.fixtures import build_fixtures
+from benchmarks.results import compare_results, write_results
+from extraction import extract_text_from_docx, extract_text_from_pdf, extract_text_from_txt
+
+
+def extract_docx_dom(file):
+    """The former DOCX path: full python-docx object model, body paragraphs only"""
+    return "".join(f"{paragraph.text}\n" for paragraph in Document(file).paragraphs if paragraph.text)
+
+
+# Format name -> extractor; "docx-dom" runs on the docx fixtures for comparison
+EXTRACTORS = {
+    'pdf': extract_text_from_pdf,
+    'docx': extract_text_from_docx,
+    'docx-dom': extract_docx_dom,
+    'txt': extract_text_from_txt,
+}
+
+
+def bench(path, extract, repeat):
+    """Return (timings, chars, peak_bytes); peak Python allocation is measured in one extra run"""
+    timings = []
+    chars = 0
+    for _ in range(repeat):
+        with open(path, 'rb') as f:
+            started = time.perf_counter()
+            chars = len(extract(f))
+            timings.append(time.perf_counter() - started)
+    with open(path, 'rb') as f:
+        tracemalloc.start()
+        try:
+            extract(f)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return timings, chars, peak
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='1,10,50,100,250,500', help='comma-separated page counts')
+    parser.add_argument('--formats', default='pdf,docx,docx-dom,txt')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--fixtures', default=os.path.join(tempfile.gettempdir(), 'legal_assistant_fixtures'))
+    parser.add_argument('--output', default='extraction_results.json')
+    parser.add_argument('--baseline', help='previous results file to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown against the baseline')
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(',')]
+    formats = args.formats.split(',')
+    fixtures = build_fixtures(args.fixtures, sizes, sorted({fmt.split('-')[0] for fmt in formats}))
+
+    results = []
+    for fmt in formats:
+        for pages in sizes:
+            path = fixtures[(fmt.split('-')[0], pages)]
+            timings, chars, peak = bench(path, EXTRACTORS[fmt], args.repeat)
+            row = {
+                'format': fmt,
+                'pages': pages,
+                'bytes': os.path.getsize(path),
+                'chars': chars,
+                'min_seconds': min(timings),
+                'median_seconds': statistics.median(timings),
+                'seconds_per_page': statistics.median(timings) / pages,
+                'peak_bytes': peak,
+            }
+            results.append(row)
+            print(f"{fmt:>8} {pages:>4}p  median {row['median_seconds'] * 1000:9.1f} ms  "
+                  f"({row['seconds_per_page'] * 1000:.2f} ms/page, peak {peak / 1024 / 1024:.1f} MB, {chars} chars)")
+
+    write_results(args.output, 'extraction', results, {'repeat': args.repeat})
+    if args.baseline and not compare_results(results, args.baseline, ('format', 'pages'), 'median_seconds', args.tolerance):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,133 @@
+"""Lookup latency and accuracy of the near-duplicate index as it grows.
+
+    python -m benchmarks.bench_near_duplicates --documents 10000,100000,200000 --output near_duplicates.json
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.fixtures import WORDS
+from benchmarks.results import compare_results, percentile, write_results
+from near_duplicate_index import NearDuplicateIndex, clause_hashes, clause_headings, minhash_signature
+
+NAMES = ("Acme", "Beta", "Gamma", "Delta", "Orion", "Vega", "Nova", "Atlas", "Zenith", "Apex")
+
+
+def template(rng, clauses=20, words=60, party_clauses=3):
+    """A contract template; a few clauses name the party through a {party} placeholder"""
+    result = []
+    named = set(rng.sample(range(clauses), party_clauses))
+    for number in range(clauses):
+        body = [rng.choice(WORDS) for _ in range(words)]
+        if number in named:
+            body.insert(rng.randrange(words), "{party}")
+        result.append(f"{number + 1}. " + " ".join(body) + ".")
+    return result
+
+
+def fill(clauses, rng, edits=0):
+    """Template instance with random party names and some clauses reworded"""
+    party = f"{rng.choice(NAMES)} {rng.choice(NAMES)} {rng.randrange(10000)}"
+    filled = [clause.format(party=party) for clause in clauses]
+    for index in rng.sample(range(len(filled)), edits):
+        filled[index] += " " + " ".join(rng.choice(WORDS) for _ in range(6)) + "."
+    return filled
+
+
+def grow(index, count, templates, used, rng, batch=1000):
+    """Add count template instances, noting their templates in used; returns (fingerprint, store) seconds"""
+    fingerprint = store = 0.0
+    for start in range(0, count, batch):
+        entries = []
+        started = time.perf_counter()
+        for _ in range(min(batch, count - start)):
+            number = rng.randrange(len(templates))
+            used.add(number)
+            clauses = fill(templates[number], rng)
+            entries.append(('bench', minhash_signature(clauses), clause_hashes(clauses), clause_headings(clauses),
+                            'analysis', 1))
+        fingerprint += time.perf_counter() - started
+        started = time.perf_counter()
+        index.add_many(entries)
+        store += time.perf_counter() - started
+    return fingerprint, store
+
+
+def measure(index, templates, rng, queries):
+    """Lookup latency for near-duplicates of the given (indexed) templates and for unrelated documents"""
+    timings = []
+    hits = false_hits = candidates = 0
+    # Time spent on lookups that compared at least one candidate
+    compared_seconds = 0.0
+    for i in range(queries):
+        near = i % 2 == 0
+        clauses = fill(rng.choice(templates), rng, edits=1) if near else fill(template(rng), rng)
+        signature = minhash_signature(clauses)
+        before = index.stats['candidates']
+        started = time.perf_counter()
+        match = index.lookup('bench', signature)
+        elapsed = time.perf_counter() - started
+        timings.append(elapsed)
+        if index.stats['candidates'] > before:
+            candidates += index.stats['candidates'] - before
+            compared_seconds += elapsed
+        if near:
+            hits += match is not None
+        else:
+            false_hits += match is not None
+    ms_per_candidate = 1000 * compared_seconds / candidates if candidates else None
+    return timings, hits / (queries / 2), false_hits / (queries / 2), candidates / queries, ms_per_candidate
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--documents', default='10000,50000', help='comma-separated index sizes')
+    parser.add_argument('--templates', type=int, default=2000, help='distinct templates the documents are filled from')
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--threshold', type=float, default=0.85)
+    parser.add_argument('--db', default=os.path.join(tempfile.gettempdir(), 'near_duplicates_bench.db'))
+    parser.add_argument('--output', default='near_duplicates_results.json')
+    parser.add_argument('--baseline', help='previous results file to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(args.db + suffix):
+            os.remove(args.db + suffix)
+    rng = random.Random(0)
+    templates = [template(rng) for _ in range(args.templates)]
+    index = NearDuplicateIndex(args.db, threshold=args.threshold, max_entries=10 ** 9)
+
+    results = []
+    indexed = 0
+    used = set()
+    for size in sorted(int(value) for value in args.documents.split(',')):
+        added = size - indexed
+        fingerprint, store = grow(index, added, templates, used, rng)
+        indexed = size
+        timings, recall, false_rate, candidates, ms_per_candidate = measure(index, [templates[number] for number in sorted(used)], rng, args.queries)
+        row = {
+            'documents': size,
+            'lookup_p50_ms': round(1000 * percentile(timings, 50), 3),
+            'lookup_p95_ms': round(1000 * percentile(timings, 95), 3),
+            'lookup_p99_ms': round(1000 * percentile(timings, 99), 3),
+            'avg_candidates': round(candidates, 2),
+            'ms_per_candidate': ms_per_candidate and round(ms_per_candidate, 4),
+            'recall': round(recall, 4),
+            'false_match_rate': round(false_rate, 4),
+            'fingerprint_ms_per_doc': round(1000 * fingerprint / max(1, added), 3),
+            'store_ms_per_doc': round(1000 * store / max(1, added), 3),
+        }
+        results.append(row)
+        print(row)
+
+    write_results(args.output, 'near_duplicates', results, vars(args))
+    if args.baseline:
+        ok = compare_results(results, args.baseline, ('documents',), 'lookup_p95_ms', args.tolerance)
+        raise SystemExit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
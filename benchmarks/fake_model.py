@@ -0,0 +1,94 @@
+import asyncio
+import random
+import time
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGenerativeModel:
+    """Local stand-in for genai.GenerativeModel with configurable latency and output size.
+
+    latency is the total response time in seconds (plus up to `jitter` extra);
+    a `slow_rate` fraction of calls take `slow_latency` instead, to model a
+    slow provider tail. Streaming responses spread the time over
+    `stream_chunks` chunks, with the first chunk arriving after `first_token`
+    seconds.
+    """
+
+    def __init__(self, latency=1.0, output_chars=4000, jitter=0.0, first_token=0.3,
+                 stream_chunks=20, error_rate=0.0, slow_rate=0.0, slow_latency=10.0):
+        self.latency = latency
+        self.output_chars = output_chars
+        self.jitter = jitter
+        self.first_token = first_token
+        self.stream_chunks = stream_chunks
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.calls = 0
+
+    def _latency(self):
+        if self.slow_rate and random.random() < self.slow_rate:
+            return self.slow_latency
+        return self.latency + random.uniform(0, self.jitter)
+
+    def _output(self, prompt):
+        line = f"## ANALYSIS\n- Finding based on {len(prompt)} prompt characters.\n"
+        return (line * (self.output_chars // len(line) + 1))[:self.output_chars]
+
+    def _maybe_fail(self):
+        if self.error_rate and random.random() < self.error_rate:
+            error = RuntimeError("Fake quota exceeded")
+            error.code = 429
+            raise error
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        self.calls += 1
+        total = self._latency()
+        if not stream:
+            time.sleep(total)
+            self._maybe_fail()
+            return FakeResponse(self._output(prompt))
+        return self._stream(prompt, total)
+
+    async def generate_content_async(self, prompt, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self._latency())
+        self._maybe_fail()
+        return FakeResponse(self._output(prompt))
+
+    def _stream(self, prompt, total):
+        time.sleep(min(self.first_token, total))
+        self._maybe_fail()
+        output = self._output(prompt)
+        size = max(1, len(output) // self.stream_chunks)
+        pause = max(0.0, total - self.first_token) / self.stream_chunks
+        for start in range(0, len(output), size):
+            yield FakeResponse(output[start:start + size])
+            time.sleep(pause)
+
+
+def use_fake_model(legal_assistant, **options):
+    """Point a LegalAssistant at a FakeGenerativeModel with client limits disabled.
+
+    Routing, fallback and hedging settings still come from the environment;
+    every routed model name is served by the same fake.
+    """
+    from gemini_client import GeminiClient
+    from model_router import model_router_from_env
+
+    fake = FakeGenerativeModel(**options)
+    # Load first so a later load() cannot replace the fake
+    legal_assistant.load()
+    legal_assistant.model = fake
+    legal_assistant.client = model_router_from_env(
+        lambda name: fake,
+        getattr(legal_assistant.client, 'default_model', 'fake'),
+        make_client=lambda model: GeminiClient(model, rpm=0, tpm=0, max_concurrency=1024, base_delay=0.05,
+                                               max_async_concurrency=1024)
+    )
+    legal_assistant.model_available = True
+    return fake
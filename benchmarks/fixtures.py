@@ -0,0 +1,107 @@
+import os
+import random
+
+from docx import Document
+
+WORDS = (
+    "agreement party parties shall hereby obligation payment term termination notice "
+    "confidential information license warranty indemnify liability governing law dispute "
+    "arbitration breach remedy clause section schedule effective date assignment consent "
+    "services deliverables fees invoice days written provided that pursuant thereto"
+).split()
+
+LINES_PER_PAGE = 45
+
+
+def contract_pages(pages, seed=0):
+    """Deterministic pseudo-contract text, one list of lines per page"""
+    rng = random.Random(seed)
+    result = []
+    section = 1
+    for _ in range(pages):
+        lines = []
+        for i in range(LINES_PER_PAGE):
+            if i % 15 == 0:
+                lines.append(f"{section}. {rng.choice(WORDS).upper()} AND {rng.choice(WORDS).upper()}")
+                section += 1
+            else:
+                lines.append(" ".join(rng.choice(WORDS) for _ in range(12)).capitalize() + ".")
+        result.append(lines)
+    return result
+
+
+def _pdf_escape(text):
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def write_pdf(path, pages):
+    """Write a minimal text-only PDF (Helvetica, one content stream per page)"""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in once the page object numbers are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_ids = []
+    for lines in pages:
+        stream = "BT /F1 10 Tf 50 780 Td 16 TL " + " ".join(f"({_pdf_escape(line)}) Tj T*" for line in lines) + " ET"
+        stream = stream.encode('latin-1')
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        page_ids.append(len(objects))
+    kids = b" ".join(b"%d 0 R" % page_id for page_id in page_ids)
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, 'wb') as f:
+        f.write(out)
+
+
+def write_docx(path, pages):
+    """Write a DOCX with the page lines as paragraphs and a fee table on every page"""
+    doc = Document()
+    for number, lines in enumerate(pages, 1):
+        for line in lines:
+            doc.add_paragraph(line)
+        table = doc.add_table(rows=3, cols=3)
+        for row, values in enumerate((("Milestone", "Due", "Fee"),
+                                      (f"Phase {number}", f"Day {number * 30}", f"${number * 1000:,}"),
+                                      ("Total", "", f"${number * 1000:,}"))):
+            for col, value in enumerate(values):
+                table.cell(row, col).text = value
+        doc.add_page_break()
+    doc.save(path)
+
+
+def write_txt(path, pages):
+    with open(path, 'w', encoding='utf-8') as f:
+        for lines in pages:
+            f.write("\n".join(lines))
+            f.write("\n\f\n")
+
+
+def build_fixtures(directory, sizes=(1, 10, 50, 100, 250, 500), formats=('pdf', 'docx', 'txt')):
+    """Generate fixtures for each page count and format; returns {(format, pages): path}"""
+    os.makedirs(directory, exist_ok=True)
+    writers = {'pdf': write_pdf, 'docx': write_docx, 'txt': write_txt}
+    fixtures = {}
+    for pages in sizes:
+        content = contract_pages(pages, seed=pages)
+        for fmt in formats:
+            path = os.path.join(directory, f"contract_{pages}p.{fmt}")
+            if not os.path.exists(path):
+                writers[fmt](path, content)
+            fixtures[(fmt, pages)] = path
+    return fixtures
@@ -0,0 +1,190 @@
+"""Concurrent load driver for the /analyze and /draft endpoints.
+
+By default the Flask app is driven in-process with a fake model, so the
+numbers reflect the server's own overhead plus the configured model latency:
+
+    python -m benchmarks.load_test --endpoint analyze --concurrency 16 --requests 200
+
+Pass --url to drive a running server instead (its real model is used).
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.fixtures import build_fixtures
+from benchmarks.results import compare_results, percentile, write_results
+
+
+def build_request(endpoint, file_path, unique):
+    """Return (path, fields, files) for one request; unique inputs defeat the result cache"""
+    salt = f"\nReference {uuid.uuid4().hex}" if unique else ""
+    if endpoint == 'draft':
+        return '/draft', {'doc_type': 'nda', 'requirements': f"Mutual NDA between Acme and Beta for two years.{salt}"}, {}
+    fields = {'analysis_type': 'contract_review'}
+    if file_path:
+        with open(file_path, 'rb') as f:
+            data = f.read()
+        if unique and file_path.endswith('.txt'):
+            data += salt.encode('utf-8')
+        return '/analyze', fields, {'file': (os.path.basename(file_path), data)}
+    fields['text'] = f"1. TERM\nThis agreement lasts twelve months and renews automatically.{salt}"
+    return '/analyze', fields, {}
+
+
+def encode_multipart(fields, files):
+    boundary = uuid.uuid4().hex
+    body = bytearray()
+    for name, value in fields.items():
+        body += f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode('utf-8')
+    for name, (filename, data) in files.items():
+        body += (f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                 f'Content-Type: application/octet-stream\r\n\r\n').encode('utf-8')
+        body += data + b'\r\n'
+    body += f'--{boundary}--\r\n'.encode('utf-8')
+    return bytes(body), f'multipart/form-data; boundary={boundary}'
+
+
+class HttpDriver:
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def send(self, path, fields, files):
+        body, content_type = encode_multipart(fields, files)
+        request = urllib.request.Request(self.base_url + path, data=body, headers={'Content-Type': content_type})
+        with urllib.request.urlopen(request, timeout=600) as response:
+            payload = response.read()
+            return response.status, b'"error"' not in payload[:200]
+
+
+class InProcessDriver:
+    def __init__(self, latency, output_chars, jitter, slow_rate=0.0, slow_latency=10.0, hedge=False):
+        # Keep benchmark runs from reading or filling the on-disk caches; the
+        # near-duplicate index would also answer the salted repeat requests
+        os.environ['EXTRACTION_CACHE_DB'] = ''
+        os.environ['NEAR_DUPLICATE_DB'] = ''
+        os.environ.pop('RESULT_CACHE_DB', None)
+        if hedge:
+            os.environ['GEMINI_HEDGE'] = '1'
+        import app as legal_app
+        from benchmarks.fake_model import use_fake_model
+
+        use_fake_model(legal_app.legal_assistant, latency=latency, output_chars=output_chars, jitter=jitter,
+                       slow_rate=slow_rate, slow_latency=slow_latency)
+        self.app = legal_app.app
+        self._local = threading.local()
+
+    def send(self, path, fields, files):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        data = dict(fields)
+        for name, (filename, content) in files.items():
+            data[name] = (io.BytesIO(content), filename)
+        response = client.post(path, data=data, content_type='multipart/form-data')
+        return response.status_code, 'error' not in (response.get_json(silent=True) or {})
+
+
+def run_load(driver, endpoint, file_path, concurrency, total, unique):
+    latencies = []
+    failures = 0
+    lock = threading.Lock()
+
+    def one(_):
+        nonlocal failures
+        path, fields, files = build_request(endpoint, file_path, unique)
+        started = time.perf_counter()
+        try:
+            status, ok = driver.send(path, fields, files)
+        except Exception:
+            status, ok = None, False
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            if status != 200 or not ok:
+                failures += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(total)))
+    wall = time.perf_counter() - started
+
+    return {
+        'requests': total,
+        'failures': failures,
+        'wall_seconds': wall,
+        'throughput_rps': total / wall,
+        'p50_seconds': percentile(latencies, 50),
+        'p95_seconds': percentile(latencies, 95),
+        'p99_seconds': percentile(latencies, 99),
+        'max_seconds': max(latencies),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help='drive a running server instead of the in-process app')
+    parser.add_argument('--endpoint', choices=('analyze', 'draft'), default='analyze')
+    parser.add_argument('--file-format', choices=('pdf', 'docx', 'txt'), help='upload a generated fixture')
+    parser.add_argument('--pages', type=int, default=10, help='fixture size in pages')
+    parser.add_argument('--concurrency', default='1,4,16', help='comma-separated concurrency levels')
+    parser.add_argument('--requests', type=int, default=100, help='requests per concurrency level')
+    parser.add_argument('--latency', type=float, default=1.0, help='fake model latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.2, help='extra random fake model latency')
+    parser.add_argument('--output-chars', type=int, default=4000, help='fake model output size')
+    parser.add_argument('--slow-rate', type=float, default=0.0, help='fraction of fake model calls that are slow')
+    parser.add_argument('--slow-latency', type=float, default=10.0, help='latency of slow fake model calls')
+    parser.add_argument('--hedge', action='store_true', help='enable hedged model requests (GEMINI_HEDGE=1)')
+    parser.add_argument('--repeat-input', action='store_true', help='send identical inputs (measures cache hits)')
+    parser.add_argument('--fixtures', default=os.path.join(tempfile.gettempdir(), 'legal_assistant_fixtures'))
+    parser.add_argument('--output', default='load_results.json')
+    parser.add_argument('--baseline', help='previous results file to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed p95 slowdown against the baseline')
+    args = parser.parse_args(argv)
+
+    file_path = None
+    if args.endpoint == 'analyze' and args.file_format:
+        file_path = build_fixtures(args.fixtures, (args.pages,), (args.file_format,))[(args.file_format, args.pages)]
+
+    if args.url:
+        driver = HttpDriver(args.url)
+    else:
+        driver = InProcessDriver(args.latency, args.output_chars, args.jitter,
+                                 args.slow_rate, args.slow_latency, args.hedge)
+
+    results = []
+    for concurrency in (int(c) for c in args.concurrency.split(',')):
+        row = run_load(driver, args.endpoint, file_path, concurrency, args.requests, not args.repeat_input)
+        row.update({
+            'endpoint': args.endpoint,
+            'input': f"{args.file_format}:{args.pages}p" if file_path else 'text',
+            'concurrency': concurrency,
+        })
+        results.append(row)
+        print(f"{args.endpoint} c={concurrency:<4} {row['throughput_rps']:8.2f} req/s  "
+              f"p50 {row['p50_seconds'] * 1000:8.1f} ms  p95 {row['p95_seconds'] * 1000:8.1f} ms  "
+              f"p99 {row['p99_seconds'] * 1000:8.1f} ms  failures {row['failures']}")
+
+    config = {
+        'mode': 'http' if args.url else 'in-process',
+        'requests': args.requests,
+        'fake_latency': None if args.url else args.latency,
+        'fake_output_chars': None if args.url else args.output_chars,
+        'fake_slow_rate': None if args.url else args.slow_rate,
+        'hedge': None if args.url else args.hedge,
+    }
+    write_results(args.output, 'load', results, config)
+    if args.baseline and not compare_results(results, args.baseline, ('endpoint', 'input', 'concurrency'),
+                                             'p95_seconds', args.tolerance):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,49 @@
+import json
+import platform
+import sys
+from datetime import datetime
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def write_results(path, benchmark, results, config=None):
+    """Write results as JSON together with enough context to compare runs"""
+    payload = {
+        'benchmark': benchmark,
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'config': config or {},
+        'results': results,
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, indent=2)
+    print(f"Results written to {path}")
+
+
+def compare_results(current, baseline_path, key_fields, metric, tolerance):
+    """Print regressions where metric grew by more than tolerance (a fraction) against a baseline file.
+
+    Returns True when no regression was found.
+    """
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)['results']
+    index = {tuple(row[k] for k in key_fields): row for row in baseline}
+    ok = True
+    for row in current:
+        previous = index.get(tuple(row[k] for k in key_fields))
+        if not previous or not previous.get(metric) or row.get(metric) is None:
+            continue
+        change = row[metric] / previous[metric] - 1
+        if change > tolerance:
+            ok = False
+            label = ", ".join(f"{k}={row[k]}" for k in key_fields)
+            print(f"REGRESSION {label}: {metric} {previous[metric]:.4f} -> {row[metric]:.4f} (+{change:.0%})")
+    return ok
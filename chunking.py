@@ -0,0 +1,125 @@
+import re
+
+# Headings that usually open a new clause or section in contracts,
+# e.g. "ARTICLE IV", "Section 12.3", "SCHEDULE A", "7.", "7.2 Payment"
+SECTION_HEADING = re.compile(
+    r'^\s*(?:'
+    r'(?:ARTICLE|Article|SECTION|Section|CLAUSE|Clause|SCHEDULE|Schedule|EXHIBIT|Exhibit|ANNEX|Annex|APPENDIX|Appendix)\b'
+    r'|\d+(?:\.\d+)*[.)]?\s+\S'
+    r'|\(?[a-z]\)\s+\S'
+    r'|[IVXLC]+\.\s+\S'
+    r')'
+)
+
+SENTENCE_END = re.compile(r'(?<=[.;:!?])\s+')
+
+
+def split_into_clauses(text):
+    """Split text into clauses on section headings and blank lines"""
+    clauses = []
+    current = []
+    for line in text.splitlines():
+        if not line.strip():
+            if current:
+                clauses.append("\n".join(current))
+                current = []
+            continue
+        if current and SECTION_HEADING.match(line):
+            clauses.append("\n".join(current))
+            current = []
+        current.append(line)
+    if current:
+        clauses.append("\n".join(current))
+    return clauses
+
+
+def _split_oversized(clause, chunk_size):
+    """Break a clause longer than chunk_size on sentence boundaries"""
+    pieces = []
+    current = ""
+    for sentence in SENTENCE_END.split(clause):
+        while len(sentence) > chunk_size:
+            # No usable sentence boundary, fall back to a hard cut
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(sentence[:chunk_size])
+            sentence = sentence[chunk_size:]
+        if current and len(current) + len(sentence) + 1 > chunk_size:
+            pieces.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_into_chunks(text, chunk_size):
+    """Pack clauses into chunks of at most chunk_size characters"""
+    chunks = []
+    current = []
+    current_len = 0
+    for clause in split_into_clauses(text):
+        parts = [clause] if len(clause) <= chunk_size else _split_oversized(clause, chunk_size)
+        for part in parts:
+            # +2 accounts for the blank line re-inserted between clauses
+            if current and current_len + len(part) + 2 > chunk_size:
+                chunks.append("\n\n".join(current))
+                current = []
+                current_len = 0
+            current.append(part)
+            current_len += len(part) + 2
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def iter_chunks(texts, chunk_size):
+    """Yield chunks from an iterable of text pieces (e.g. pages) as soon as they are complete"""
+    buffer = ""
+    for text in texts:
+        if not text:
+            continue
+        buffer = f"{buffer}\n{text}" if buffer else text
+        if len(buffer) > 2 * chunk_size:
+            # The last chunk may continue on the next page, so keep it buffered
+            chunks = split_into_chunks(buffer, chunk_size)
+            yield from chunks[:-1]
+            buffer = chunks[-1]
+    if buffer:
+        yield from split_into_chunks(buffer, chunk_size)
+
+
+# Top-level numbered headings in generated drafts, e.g. "1. PARTIES",
+# "## 2. Term", "**3. PAYMENT TERMS**", "ARTICLE 4 - NOTICES"; not "1.1 ..."
+TOP_LEVEL_HEADING = re.compile(
+    r'^\s*(?:#{1,6}\s*)?(?:\*\*)?\s*'
+    r'(?:(?:ARTICLE|Article|SECTION|Section)\s+)?'
+    r'(?:\d+|[IVXLC]+)(?:[.:)](?!\d))?\s+\S'
+)
+
+
+def split_into_sections(text):
+    """Split a draft into top-level sections.
+
+    Returns a list of section strings whose concatenation is exactly text; the
+    first entry is the preamble before the first heading (possibly empty).
+    """
+    sections = []
+    current = []
+    for line in text.splitlines(keepends=True):
+        if TOP_LEVEL_HEADING.match(line):
+            sections.append("".join(current))
+            current = []
+        current.append(line)
+    sections.append("".join(current))
+    return sections
+
+
+def section_heading(section):
+    """First non-empty line of a section"""
+    for line in section.splitlines():
+        if line.strip():
+            return line.strip()
+    return ""
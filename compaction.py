@@ -0,0 +1,189 @@
+import math
+import os
+import re
+
+from chunking import SENTENCE_END
+from prompts import estimate_tokens
+
+# Prompt token budgets per model family (longest matching prefix wins); the
+# default matches the old 30,000 character cutoff
+MODEL_TOKEN_BUDGETS = {
+    'gemini-2.5-pro': 30000,
+    'gemini-2.5-flash': 15000,
+    'gemini-2.5-flash-lite': 7500,
+    'gemini-2.0-flash': 15000,
+}
+DEFAULT_TOKEN_BUDGET = 7500
+
+# "Page 3", "Page 3 of 10", "3 of 10", "3/10", "- 3 -" on a line of their own
+PAGE_NUMBER_LINE = re.compile(
+    r'^\s*(?:(?:page|pg\.?)\s*\d+(?:\s*(?:of|/)\s*\d+)?|\d+\s*(?:of|/)\s*\d+|[-–—]\s*\d+\s*[-–—]|\d{1,4})\s*$',
+    re.IGNORECASE
+)
+# Page references inside running headers and footers, ignored when comparing lines
+PAGE_REFERENCE = re.compile(r'(?:page|pg\.?)\s*\d+(?:\s*(?:of|/)\s*\d+)?|\b\d+\s+of\s+\d+\b', re.IGNORECASE)
+INLINE_SPACE = re.compile(r'[ \t\u00a0\f\v]+')
+BLANK_LINES = re.compile(r'\n{3,}')
+
+# Running headers and footers are looked for in the first and last
+# PAGE_EDGE_LINES non-blank lines of each page; a short edge line seen on
+# HEADER_MIN_REPEATS pages is taken to be one. Edge lines that differ only in
+# a page reference ("Acme Corp - Page 3") must be on PAGED_HEADER_MIN_SHARE
+# of the pages, so body lines like "see page 4" / "see page 7" are kept
+PAGE_EDGE_LINES = 3
+HEADER_MIN_REPEATS = 3
+PAGED_HEADER_MIN_SHARE = 0.5
+HEADER_MAX_CHARS = 100
+HEADER_MIN_CHARS = 8
+# Extracted PDF pages are separated by a form feed
+PAGE_BREAK = '\f'
+# Paragraphs at least this long are collapsed when repeated verbatim
+BOILERPLATE_MIN_CHARS = 200
+
+TRUNCATION_NOTE = "[Document truncated to fit the model's input limit: about {tokens} tokens omitted]"
+
+
+def prompt_token_budget(model_name):
+    """Token budget for one prompt to model_name; PROMPT_TOKEN_BUDGET overrides the table"""
+    override = os.getenv('PROMPT_TOKEN_BUDGET')
+    if override:
+        return int(override)
+    matches = [prefix for prefix in MODEL_TOKEN_BUDGETS if model_name.startswith(prefix)]
+    return MODEL_TOKEN_BUDGETS[max(matches, key=len)] if matches else DEFAULT_TOKEN_BUDGET
+
+
+def _header_key(line):
+    return INLINE_SPACE.sub(' ', PAGE_REFERENCE.sub('', line)).strip().lower()
+
+
+def _is_header(line, counts, paged_min_repeats):
+    if not HEADER_MIN_CHARS <= len(line) <= HEADER_MAX_CHARS:
+        return False
+    min_repeats = paged_min_repeats if PAGE_REFERENCE.search(line) else HEADER_MIN_REPEATS
+    return counts.get(_header_key(line), 0) >= min_repeats
+
+
+def _edge_noise(lines, order, counts, paged_min_repeats):
+    """Indexes of the noise lines at one edge of a page, walking inward in order.
+
+    At most one page number and PAGE_EDGE_LINES lines are taken, stopping at
+    the first line that is neither a page number nor a running header.
+    """
+    noise = set()
+    page_number = False
+    for i in [i for i in order if lines[i]][:PAGE_EDGE_LINES]:
+        if not page_number and PAGE_NUMBER_LINE.match(lines[i]):
+            page_number = True
+        elif not _is_header(lines[i], counts, paged_min_repeats):
+            break
+        noise.add(i)
+    return noise
+
+
+def strip_noise(text):
+    """Remove extraction noise: page numbers, running headers/footers and whitespace runs.
+
+    Only lines at the top and bottom of a page (pages are split on form
+    feeds) are taken for noise, so text without page breaks keeps all of its
+    lines. The first occurrence of a repeated header or footer line is kept,
+    so a title that doubles as a running header survives once.
+    """
+    text = text.replace('\r\n', '\n').replace('\r', '\n')
+    pages = [[INLINE_SPACE.sub(' ', line).strip() for line in page.split('\n')] for page in text.split(PAGE_BREAK)]
+    if len(pages) == 1:
+        return BLANK_LINES.sub('\n\n', '\n'.join(pages[0])).strip()
+
+    # Pages each line appears on among the first and last lines of a page
+    counts = {}
+    for lines in pages:
+        filled = [line for line in lines if line]
+        edge = filled[:PAGE_EDGE_LINES] + filled[-PAGE_EDGE_LINES:]
+        for key in {_header_key(line) for line in edge if HEADER_MIN_CHARS <= len(line) <= HEADER_MAX_CHARS}:
+            counts[key] = counts.get(key, 0) + 1
+    paged_min_repeats = max(HEADER_MIN_REPEATS, math.ceil(PAGED_HEADER_MIN_SHARE * len(pages)))
+
+    kept = []
+    seen_headers = set()
+    for lines in pages:
+        indexes = range(len(lines))
+        noise = (_edge_noise(lines, indexes, counts, paged_min_repeats)
+                 | _edge_noise(lines, reversed(indexes), counts, paged_min_repeats))
+        for i, line in enumerate(lines):
+            if i in noise:
+                if PAGE_NUMBER_LINE.match(line):
+                    continue
+                key = _header_key(line)
+                if key in seen_headers:
+                    continue
+                seen_headers.add(key)
+            kept.append(line)
+    return BLANK_LINES.sub('\n\n', '\n'.join(kept)).strip()
+
+
+def collapse_boilerplate(text):
+    """Replace verbatim repeats of long paragraphs with a short note"""
+    seen = set()
+    paragraphs = []
+    for paragraph in text.split('\n\n'):
+        key = INLINE_SPACE.sub(' ', paragraph.replace('\n', ' ')).strip().lower()
+        if len(key) >= BOILERPLATE_MIN_CHARS:
+            if key in seen:
+                paragraphs.append("[Repeated paragraph omitted]")
+                continue
+            seen.add(key)
+        paragraphs.append(paragraph)
+    return '\n\n'.join(paragraphs)
+
+
+def fit_to_budget(text, max_tokens):
+    """Cut text to about max_tokens on paragraph, then sentence, boundaries.
+
+    Returns (text, omitted_tokens); a note marks where text was cut.
+    """
+    total = estimate_tokens(text)
+    if total <= max_tokens:
+        return text, 0
+    # Leave room for the truncation note itself
+    budget = max(max_tokens - estimate_tokens(TRUNCATION_NOTE) - 4, 0)
+
+    kept = []
+    used = 0
+    for paragraph in text.split('\n\n'):
+        tokens = estimate_tokens(paragraph) + 1
+        if used + tokens <= budget:
+            kept.append(paragraph)
+            used += tokens
+            continue
+        sentences = []
+        for sentence in SENTENCE_END.split(paragraph):
+            tokens = estimate_tokens(sentence) + 1
+            if used + tokens > budget:
+                break
+            sentences.append(sentence)
+            used += tokens
+        if sentences:
+            kept.append(' '.join(sentences))
+        elif not kept:
+            # A single giant sentence: fall back to a hard cut
+            kept.append(paragraph[:budget * 4])
+        break
+
+    fitted = '\n\n'.join(kept)
+    omitted = total - estimate_tokens(fitted)
+    return f"{fitted}\n\n{TRUNCATION_NOTE.format(tokens=omitted)}", omitted
+
+
+def compact(text):
+    """Strip noise and collapse duplicated boilerplate.
+
+    Returns (text, stats) where stats reports estimated tokens before and
+    after and the tokens saved.
+    """
+    original_tokens = estimate_tokens(text)
+    compacted = collapse_boilerplate(strip_noise(text))
+    tokens = estimate_tokens(compacted)
+    return compacted, {
+        'original_tokens': original_tokens,
+        'tokens': tokens,
+        'tokens_saved': original_tokens - tokens,
+    }
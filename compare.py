@@ -0,0 +1,170 @@
+import difflib
+import re
+
+from chunking import SENTENCE_END, section_heading, split_into_clauses
+from prompts import estimate_tokens, estimate_tokens_for_length
+
+WHITESPACE = re.compile(r'\s+')
+WORD = re.compile(r'\w+')
+
+# Clauses of a replaced block at least this similar (by words) are paired up
+# as modified; the rest count as removed and added
+MODIFIED_MIN_SIMILARITY = 0.5
+# How far ahead in a replaced block to look for a clause's modified version
+PAIRING_WINDOW = 4
+# Modified clauses longer than this are shown as their changed sentences only
+FULL_CLAUSE_MAX_CHARS = 1200
+
+
+def _normalize(clause):
+    return WHITESPACE.sub(' ', clause).strip().lower()
+
+
+def _words(clause):
+    return WORD.findall(clause.lower())
+
+
+def _similarity(old_words, new_words):
+    matcher = difflib.SequenceMatcher(a=old_words, b=new_words, autojunk=False)
+    # quick_ratio is an upper bound on ratio and much cheaper
+    if matcher.quick_ratio() < MODIFIED_MIN_SIMILARITY:
+        return 0.0
+    return matcher.ratio()
+
+
+def _pair_block(old_ids, new_ids, old_words, new_words):
+    """Pair the clauses of one replaced block in order; returns [(old_id|None, new_id|None, similarity)]"""
+    pairs = []
+    j = 0
+    for old_id in old_ids:
+        best, best_score = None, MODIFIED_MIN_SIMILARITY
+        for candidate in range(j, min(j + PAIRING_WINDOW, len(new_ids))):
+            score = _similarity(old_words[old_id], new_words[new_ids[candidate]])
+            if score >= best_score:
+                best, best_score = candidate, score
+        if best is None:
+            pairs.append((old_id, None, 0.0))
+            continue
+        pairs.extend((None, new_id, 0.0) for new_id in new_ids[j:best])
+        pairs.append((old_id, new_ids[best], best_score))
+        j = best + 1
+    pairs.extend((None, new_id, 0.0) for new_id in new_ids[j:])
+    return pairs
+
+
+def compare_versions(old_text, new_text):
+    """Align two versions of a contract clause by clause.
+
+    Returns (changes, stats). Each change is a dict with type 'modified',
+    'added', 'removed' or 'moved', 1-based clause numbers in the old and new
+    version, a heading and the clause texts; stats counts clauses by outcome.
+    """
+    old_clauses = split_into_clauses(old_text)
+    new_clauses = split_into_clauses(new_text)
+    old_keys = [_normalize(clause) for clause in old_clauses]
+    new_keys = [_normalize(clause) for clause in new_clauses]
+
+    pairs = []
+    matcher = difflib.SequenceMatcher(a=old_keys, b=new_keys, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            continue
+        old_ids, new_ids = list(range(i1, i2)), list(range(j1, j2))
+        if old_ids and new_ids:
+            old_words = {i: _words(old_clauses[i]) for i in old_ids}
+            new_words = {j: _words(new_clauses[j]) for j in new_ids}
+            pairs.extend(_pair_block(old_ids, new_ids, old_words, new_words))
+        else:
+            pairs.extend((i, None, 0.0) for i in old_ids)
+            pairs.extend((None, j, 0.0) for j in new_ids)
+
+    # A clause removed in one place and added unchanged in another was moved;
+    # each added copy pairs with at most one removed copy
+    added_at = {}
+    for i, j, _ in pairs:
+        if i is None:
+            added_at.setdefault(new_keys[j], []).append(j)
+    moved_from = {}
+    for i, j, _ in pairs:
+        if j is None and added_at.get(old_keys[i]):
+            moved_from[i] = added_at[old_keys[i]].pop(0)
+    moved_to = set(moved_from.values())
+
+    changes = []
+    for i, j, similarity in pairs:
+        if i is not None and j is not None:
+            change = {'type': 'modified', 'similarity': round(similarity, 3)}
+        elif i is not None and i in moved_from:
+            j = moved_from[i]
+            change = {'type': 'moved'}
+        elif i is not None:
+            change = {'type': 'removed'}
+        elif j in moved_to:
+            continue
+        else:
+            change = {'type': 'added'}
+        change.update({
+            'old_clause': None if i is None else i + 1,
+            'new_clause': None if j is None else j + 1,
+            'heading': section_heading(new_clauses[j] if j is not None else old_clauses[i])[:100],
+            'old': None if i is None else old_clauses[i],
+            'new': None if j is None else new_clauses[j],
+        })
+        changes.append(change)
+
+    counts = {kind: sum(1 for change in changes if change['type'] == kind)
+              for kind in ('modified', 'added', 'removed', 'moved')}
+    changed_chars = sum(len(change['old'] or '') + len(change['new'] or '')
+                        for change in changes if change['type'] != 'moved')
+    stats = {
+        'old_clauses': len(old_clauses),
+        'new_clauses': len(new_clauses),
+        'unchanged': len(new_clauses) - counts['modified'] - counts['added'] - counts['moved'],
+        **counts,
+        'changed_share': round(sum(counts.values()) / max(len(old_clauses), len(new_clauses), 1), 3),
+        'old_tokens': estimate_tokens(old_text),
+        'new_tokens': estimate_tokens(new_text),
+        'changed_tokens': estimate_tokens_for_length(changed_chars),
+    }
+    return changes, stats
+
+
+def _sentence_redline(old, new):
+    """Changed sentences of a long clause as '- ' / '+ ' lines"""
+    old_sentences = [sentence.strip() for sentence in SENTENCE_END.split(old) if sentence.strip()]
+    new_sentences = [sentence.strip() for sentence in SENTENCE_END.split(new) if sentence.strip()]
+    lines = []
+    matcher = difflib.SequenceMatcher(a=old_sentences, b=new_sentences, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag != 'equal':
+            lines.extend(f"- {sentence}" for sentence in old_sentences[i1:i2])
+            lines.extend(f"+ {sentence}" for sentence in new_sentences[j1:j2])
+    return "\n".join(lines)
+
+
+def render_changes(changes, stats):
+    """Changed clauses as prompt text: full text of short clauses, changed sentences of long ones"""
+    blocks = [
+        f"The previous version has {stats['old_clauses']} clauses and the new version {stats['new_clauses']}: "
+        f"{stats['modified']} modified, {stats['added']} added, {stats['removed']} removed, "
+        f"{stats['moved']} moved unchanged, {stats['unchanged']} unchanged (not shown)."
+    ]
+    for change in changes:
+        kind = change['type']
+        if kind == 'modified':
+            header = f"[MODIFIED] Clause {change['new_clause']} (clause {change['old_clause']} before): {change['heading']}"
+            if len(change['old']) + len(change['new']) <= 2 * FULL_CLAUSE_MAX_CHARS:
+                body = f"BEFORE:\n{change['old']}\nAFTER:\n{change['new']}"
+            else:
+                body = f"CHANGED SENTENCES (- before, + after):\n{_sentence_redline(change['old'], change['new'])}"
+        elif kind == 'added':
+            header = f"[ADDED] Clause {change['new_clause']}: {change['heading']}"
+            body = change['new']
+        elif kind == 'removed':
+            header = f"[REMOVED] Clause {change['old_clause']} of the previous version: {change['heading']}"
+            body = change['old']
+        else:
+            blocks.append(f"[MOVED] {change['heading']} (clause {change['old_clause']} -> {change['new_clause']}, text unchanged)")
+            continue
+        blocks.append(f"{header}\n{body}")
+    return "\n\n".join(blocks)
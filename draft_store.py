@@ -0,0 +1,132 @@
+import difflib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from chunking import SENTENCE_END
+from retrieval import ClauseIndex
+
+
+class DraftStore:
+    """In-memory store of generated drafts and analysis results by id, with LRU size limit and TTL.
+
+    Rendered downloads (DOCX, PDF, gzipped text) are cached with the entry and
+    dropped when its content changes or it is evicted.
+    """
+
+    def __init__(self, max_entries=500, ttl=24 * 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._drafts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, doc_type, requirements, content, kind='draft'):
+        """Store a new draft (or, with kind='analysis', an analysis result) and return its id"""
+        now = time.time()
+        draft = {
+            'id': uuid.uuid4().hex,
+            'kind': kind,
+            'doc_type': doc_type,
+            'requirements': requirements,
+            'content': content,
+            'version': 1,
+            'created': now,
+            'updated': now,
+            'artifacts': {},
+        }
+        with self._lock:
+            self._drafts[draft['id']] = draft
+            self._evict(now)
+        return draft['id']
+
+    def get(self, draft_id):
+        """Return a copy of the draft, or None if unknown or expired"""
+        now = time.time()
+        with self._lock:
+            draft = self._drafts.get(draft_id)
+            if draft is None:
+                return None
+            if now - draft['updated'] > self.ttl:
+                del self._drafts[draft_id]
+                return None
+            self._drafts.move_to_end(draft_id)
+            copy = dict(draft)
+            del copy['artifacts']
+            return copy
+
+    def update(self, draft_id, requirements, content):
+        """Replace a draft's content with a new version; returns the new version number"""
+        with self._lock:
+            draft = self._drafts[draft_id]
+            draft['requirements'] = requirements
+            draft['content'] = content
+            draft['version'] += 1
+            draft['updated'] = time.time()
+            draft['artifacts'] = {}
+            self._drafts.move_to_end(draft_id)
+            return draft['version']
+
+    def get_artifact(self, draft_id, version, name):
+        """Cached rendering of the given version, or None"""
+        with self._lock:
+            draft = self._drafts.get(draft_id)
+            if draft is None or draft['version'] != version:
+                return None
+            return draft['artifacts'].get(name)
+
+    def put_artifact(self, draft_id, version, name, data):
+        """Cache a rendering; ignored if the draft has changed or gone since it was read"""
+        with self._lock:
+            draft = self._drafts.get(draft_id)
+            if draft is not None and draft['version'] == version:
+                draft['artifacts'][name] = data
+
+    def _evict(self, now):
+        while self._drafts:
+            oldest_id, oldest = next(iter(self._drafts.items()))
+            if len(self._drafts) <= self.max_entries and now - oldest['updated'] <= self.ttl:
+                break
+            del self._drafts[oldest_id]
+
+
+def _requirement_units(requirements):
+    """Requirements as a list of individual sentences"""
+    return [
+        sentence.strip()
+        for line in requirements.splitlines()
+        for sentence in SENTENCE_END.split(line)
+        if sentence.strip()
+    ]
+
+
+def diff_requirements(old, new):
+    """Sentence-level changes between two sets of requirements.
+
+    Returns a list of lines prefixed with '- ' (removed) or '+ ' (added).
+    """
+    old_units = _requirement_units(old)
+    new_units = _requirement_units(new)
+    changes = []
+    matcher = difflib.SequenceMatcher(a=old_units, b=new_units, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            continue
+        changes.extend(f"- {unit}" for unit in old_units[i1:i2])
+        changes.extend(f"+ {unit}" for unit in new_units[j1:j2])
+    return changes
+
+
+def sections_touched(sections, changes, per_change=1):
+    """Indexes of the sections that the changed requirements most likely affect.
+
+    Each change is matched against the sections with BM25 and contributes its
+    per_change best-scoring sections; returned in document order.
+    """
+    index = ClauseIndex(sections)
+    touched = set()
+    for change in changes:
+        for section_id, score in index.search(change[2:], per_change):
+            if score > 0:
+                touched.add(section_id)
+    return sorted(touched)
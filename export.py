@@ -0,0 +1,162 @@
+import io
+import re
+import textwrap
+import zlib
+
+from chunking import TOP_LEVEL_HEADING
+
+EXPORT_MIMETYPES = {
+    'txt': 'text/plain; charset=utf-8',
+    'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'pdf': 'application/pdf',
+}
+# DOCX and PDF are compressed already; only plain text is worth gzipping
+COMPRESSIBLE_FORMATS = frozenset({'txt'})
+
+MARKDOWN_HEADING = re.compile(r'^\s*(#{1,6})\s+(.*)$')
+BOLD = re.compile(r'\*\*(.+?)\*\*')
+HEADING_MAX_CHARS = 80
+
+# US Letter in points, 1 inch margins, 10pt Courier (every glyph is 0.6em wide)
+PAGE_WIDTH, PAGE_HEIGHT = 612, 792
+MARGIN = 72
+FONT_SIZE = 10
+LEADING = 12
+LINE_CHARS = int((PAGE_WIDTH - 2 * MARGIN) / (FONT_SIZE * 0.6))
+PAGE_LINES = (PAGE_HEIGHT - 2 * MARGIN) // LEADING
+
+
+def _blocks(text):
+    """Lines of a generated document as (kind, text) with markdown markers removed.
+
+    kind is 'heading', 'paragraph' or 'blank'.
+    """
+    for line in text.replace('\r\n', '\n').split('\n'):
+        stripped = line.strip()
+        if not stripped:
+            yield 'blank', ''
+            continue
+        match = MARKDOWN_HEADING.match(stripped)
+        if match:
+            yield 'heading', BOLD.sub(r'\1', match.group(2)).strip()
+            continue
+        plain = BOLD.sub(r'\1', stripped)
+        whole_line_bold = stripped.startswith('**') and stripped.endswith('**') and len(plain) < len(stripped)
+        numbered_title = bool(TOP_LEVEL_HEADING.match(plain)) and not plain.endswith(('.', ';', ':', ','))
+        if len(plain) <= HEADING_MAX_CHARS and (whole_line_bold or numbered_title):
+            yield 'heading', plain
+        else:
+            yield 'paragraph', plain
+
+
+def render_txt(text):
+    return text.encode('utf-8')
+
+
+def load_renderers():
+    """Import the DOCX writer, which is otherwise loaded on the first DOCX download"""
+    import docx
+
+
+def render_docx(text, title=''):
+    """Word document with one paragraph per line and detected headings as Heading 2"""
+    import docx
+
+    document = docx.Document()
+    document.core_properties.title = title
+    for kind, content in _blocks(text):
+        if kind == 'heading':
+            document.add_heading(content, level=2)
+        elif kind == 'paragraph':
+            document.add_paragraph(content)
+    output = io.BytesIO()
+    document.save(output)
+    return output.getvalue()
+
+
+def _pdf_string(text):
+    encoded = text.encode('cp1252', errors='replace')
+    return b'(' + encoded.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)') + b')'
+
+
+def _pdf_lines(text):
+    """(font, line) pairs wrapped to the page width"""
+    for kind, content in _blocks(text):
+        if kind == 'blank':
+            yield b'/F1', ''
+            continue
+        font = b'/F2' if kind == 'heading' else b'/F1'
+        for line in textwrap.wrap(content, LINE_CHARS) or ['']:
+            yield font, line
+
+
+def _pdf_page_content(lines):
+    commands = [b'BT', b'%d TL' % LEADING, b'%d %d Td' % (MARGIN, PAGE_HEIGHT - MARGIN)]
+    current_font = None
+    for font, line in lines:
+        if font != current_font:
+            commands.append(font + b' %d Tf' % FONT_SIZE)
+            current_font = font
+        commands.append(b'T* ' + _pdf_string(line) + b' Tj')
+    commands.append(b'ET')
+    return zlib.compress(b'\n'.join(commands))
+
+
+def iter_pdf(text, title=''):
+    """Yield a PDF of text page by page, so a long document is never held whole.
+
+    Uses the standard Courier fonts, so no font files are embedded; characters
+    outside Windows-1252 are shown as '?'.
+    """
+    offsets = {}
+    position = 0
+
+    def emit(number, body):
+        nonlocal position
+        offsets[number] = position
+        chunk = b'%d 0 obj\n' % number + body + b'\nendobj\n'
+        position += len(chunk)
+        return chunk
+
+    header = b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n'
+    position = len(header)
+    yield header
+    # 1: catalog, 2: page tree (written last, once the pages are known), 3-4: fonts, 5: info
+    yield emit(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+    yield emit(3, b'<< /Type /Font /Subtype /Type1 /BaseFont /Courier /Encoding /WinAnsiEncoding >>')
+    yield emit(4, b'<< /Type /Font /Subtype /Type1 /BaseFont /Courier-Bold /Encoding /WinAnsiEncoding >>')
+    yield emit(5, b'<< /Title ' + _pdf_string(title) + b' /Producer (AI Legal Assistant) >>')
+
+    pages = []
+    number = 6
+    lines = []
+    source = _pdf_lines(text)
+    while True:
+        lines.clear()
+        for line in source:
+            lines.append(line)
+            if len(lines) == PAGE_LINES:
+                break
+        if not lines and pages:
+            break
+        content = _pdf_page_content(lines)
+        yield emit(number, b'<< /Length %d /Filter /FlateDecode >>\nstream\n' % len(content) + content + b'\nendstream')
+        yield emit(number + 1, (
+            b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Contents %d 0 R '
+            b'/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> >>' % (PAGE_WIDTH, PAGE_HEIGHT, number)
+        ))
+        pages.append(number + 1)
+        number += 2
+        if len(lines) < PAGE_LINES:
+            break
+
+    kids = b' '.join(b'%d 0 R' % page for page in pages)
+    yield emit(2, b'<< /Type /Pages /Kids [' + kids + b'] /Count %d >>' % len(pages))
+
+    xref = [b'xref\n0 %d\n' % number, b'0000000000 65535 f \n']
+    xref.extend(b'%010d 00000 n \n' % offsets[obj] for obj in range(1, number))
+    yield b''.join(xref) + b'trailer\n<< /Size %d /Root 1 0 R /Info 5 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (number, position)
+
+
+def render_pdf(text, title=''):
+    return b''.join(iter_pdf(text, title))
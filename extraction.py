@@ -0,0 +1,342 @@
+import codecs
+import logging
+import mmap
+import os
+import shutil
+import re
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from xml.etree.ElementTree import iterparse
+
+logger = logging.getLogger(__name__)
+
+# PDFs with at least PDF_PARALLEL_MIN_PAGES pages are split into ranges of
+# PDF_PAGES_PER_TASK pages and parsed by up to PDF_WORKERS processes
+PDF_WORKERS = int(os.getenv('PDF_WORKERS', str(os.cpu_count() or 1)))
+PDF_PAGES_PER_TASK = int(os.getenv('PDF_PAGES_PER_TASK', '16'))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv('PDF_PARALLEL_MIN_PAGES', '32'))
+
+# Text uploads are decoded in blocks of this many bytes, trying each encoding
+# in turn; latin-1 accepts any byte sequence, so decoding always succeeds
+TEXT_BLOCK_SIZE = 1024 * 1024
+TEXT_ENCODINGS = ('utf-8-sig', 'cp1252', 'latin-1')
+
+# WordprocessingML element names
+W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+W_BODY, W_P, W_T, W_TAB, W_BR, W_CR = W + 'body', W + 'p', W + 't', W + 'tab', W + 'br', W + 'cr'
+W_TBL, W_TR, W_TC, W_SECTPR = W + 'tbl', W + 'tr', W + 'tc', W + 'sectPr'
+DOCX_PART = re.compile(r'word/(header|footer)\d*\.xml$')
+
+_pdf_pool = None
+
+
+def _get_pdf_pool():
+    """Process pool for page-range extraction, created on first use"""
+    global _pdf_pool
+    if _pdf_pool is None:
+        _pdf_pool = ProcessPoolExecutor(max_workers=PDF_WORKERS)
+    return _pdf_pool
+
+
+class PageRangeError(ValueError):
+    """A pages field that is not a valid page selection"""
+
+
+def parse_page_range(spec):
+    """Parse a 1-based page selection like "1-5,8,10-" into (start, stop) ranges.
+
+    start is 0-based and stop exclusive; open-ended ranges ("10-") have a stop
+    of None and are resolved against the page count by select_pages. Raises
+    PageRangeError for anything else.
+    """
+    if not spec or not spec.strip():
+        return None
+    ranges = []
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            if '-' in part:
+                start, _, stop = part.partition('-')
+                start = int(start) if start.strip() else 1
+                stop = int(stop) if stop.strip() else None
+            else:
+                start = stop = int(part)
+        except ValueError:
+            raise PageRangeError(f"Invalid page range: {part}") from None
+        if start < 1 or (stop is not None and stop < start):
+            raise PageRangeError(f"Invalid page range: {part}")
+        ranges.append((start - 1, stop))
+    return ranges
+
+
+def select_pages(page_ranges, page_count):
+    """Resolve parsed page ranges against the page count"""
+    if page_ranges is None:
+        return list(range(page_count))
+    selected = set()
+    for start, stop in page_ranges:
+        selected.update(range(start, min(stop or page_count, page_count)))
+    return sorted(selected)
+
+
+@contextmanager
+def mapped(file):
+    """Memory-map an upload that is spooled to disk; anything else is yielded unchanged.
+
+    The mapping is read-only and supports read/seek/tell, so extractors can
+    treat it like the original stream without copying it into Python bytes.
+    """
+    stream = getattr(file, 'stream', file)
+    # Calling fileno() on a SpooledTemporaryFile still held in memory would
+    # force it onto disk, so small uploads are used as they are
+    if getattr(stream, '_rolled', True) is False:
+        yield file
+        return
+    try:
+        fileno = stream.fileno()
+        size = os.fstat(fileno).st_size
+    except (AttributeError, OSError, ValueError):
+        yield file
+        return
+    if not size:
+        yield file
+        return
+    with mmap.mmap(fileno, 0, access=mmap.ACCESS_READ) as view:
+        yield view
+
+
+def decode_text(file):
+    """Decode a text upload incrementally; returns (text, encoding)"""
+    file.seek(0)
+    head = file.read(2)
+    encodings = ('utf-16',) if head in (codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE) else TEXT_ENCODINGS
+    for encoding in encodings:
+        decoder = codecs.getincrementaldecoder(encoding)()
+        parts = []
+        file.seek(0)
+        try:
+            while True:
+                block = file.read(TEXT_BLOCK_SIZE)
+                if not block:
+                    break
+                parts.append(decoder.decode(block))
+            parts.append(decoder.decode(b'', final=True))
+        except UnicodeDecodeError:
+            continue
+        return "".join(parts), encoding
+    raise ValueError("Could not decode text file")
+
+
+def load_parsers():
+    """Import the PDF parser, which is otherwise loaded on the first PDF"""
+    import pdfplumber
+
+
+def _extract_pages(path, page_numbers):
+    """Worker: extract the text of the given pages from the PDF at path"""
+    import pdfplumber
+
+    texts = []
+    with pdfplumber.open(path) as pdf:
+        for number in page_numbers:
+            texts.append(pdf.pages[number].extract_text() or "")
+    return texts
+
+
+def iter_pdf_pages(file, pages=None):
+    """Yield the text of each selected PDF page in order.
+
+    Large documents are parsed in page ranges across a process pool; pages are
+    yielded in order as soon as their range is done.
+    """
+    if isinstance(file, (str, os.PathLike)):
+        page_numbers = yield from _iter_pdf_pages_sequential(file, pages)
+        if page_numbers:
+            yield from _iter_pdf_pages_parallel(file, page_numbers)
+        return
+
+    file.seek(0)
+    with mapped(file) as source:
+        page_numbers = yield from _iter_pdf_pages_sequential(source, pages)
+        if not page_numbers:
+            return
+        # Worker processes need a path to open, so copy the upload to disk once
+        with tempfile.NamedTemporaryFile(suffix='.pdf') as tmp:
+            source.seek(0)
+            shutil.copyfileobj(source, tmp, 1024 * 1024)
+            tmp.flush()
+            yield from _iter_pdf_pages_parallel(tmp.name, page_numbers)
+
+
+def _iter_pdf_pages_sequential(source, pages):
+    """Yield pages of small documents in-process; returns the page numbers left for the pool"""
+    # pdfplumber and pdfminer are slow to import, so they are loaded on first use
+    import pdfplumber
+
+    with pdfplumber.open(source) as pdf:
+        page_numbers = select_pages(pages, len(pdf.pages))
+        if len(page_numbers) < PDF_PARALLEL_MIN_PAGES or PDF_WORKERS <= 1:
+            for number in page_numbers:
+                yield pdf.pages[number].extract_text() or ""
+            return []
+    return page_numbers
+
+
+def _iter_pdf_pages_parallel(path, page_numbers):
+    futures = [
+        _get_pdf_pool().submit(_extract_pages, path, page_numbers[i:i + PDF_PAGES_PER_TASK])
+        for i in range(0, len(page_numbers), PDF_PAGES_PER_TASK)
+    ]
+    try:
+        for future in futures:
+            yield from future.result()
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def pdf_text_and_offsets(file, pages=None):
+    """Extract PDF text, returning (text, offsets) where offsets[i] is where page i starts.
+
+    Pages after the first start with a form feed, so later steps such as
+    compaction can still tell where each page begins.
+    """
+    page_texts = [f"{page_text}\n" for page_text in iter_pdf_pages(file, pages) if page_text]
+    page_texts[1:] = [f"\f{page_text}" for page_text in page_texts[1:]]
+    offsets = []
+    position = 0
+    for page_text in page_texts:
+        offsets.append(position)
+        position += len(page_text)
+    # Join once instead of growing a string page by page
+    return "".join(page_texts), offsets
+
+
+def _paragraph_text(paragraph):
+    parts = []
+    for element in paragraph.iter():
+        if element.tag == W_T:
+            parts.append(element.text or "")
+        elif element.tag == W_TAB:
+            parts.append("\t")
+        elif element.tag in (W_BR, W_CR):
+            parts.append("\n")
+    return "".join(parts)
+
+
+def iter_docx_blocks(stream):
+    """Yield the text of each paragraph and table row of a WordprocessingML part in order.
+
+    The XML is parsed incrementally and every finished block is discarded, so
+    memory stays flat however long the document is. Table rows come out as
+    cells joined by " | ", with "[Table]" before each top-level table, and
+    section breaks as "[Section break]".
+    """
+    cells = []   # stack of open table cells, each a list of its paragraph texts
+    rows = []    # stack of open table rows, each a list of cell texts
+    # Blocks are children of <w:body> in the document and of the root element
+    # in headers and footers
+    container, container_depth = None, 0
+    depth = 0
+    for event, element in iterparse(stream, events=('start', 'end')):
+        if event == 'start':
+            depth += 1
+            if depth == 1 or element.tag == W_BODY:
+                container, container_depth = element, depth
+            if element.tag == W_TBL and not cells:
+                yield "[Table]"
+            elif element.tag == W_TR:
+                rows.append([])
+            elif element.tag == W_TC:
+                cells.append([])
+            continue
+
+        depth -= 1
+        if element.tag == W_P:
+            text = _paragraph_text(element)
+            if cells:
+                if text:
+                    cells[-1].append(text)
+            elif text:
+                yield text
+            if element.find(f'{W}pPr/{W_SECTPR}') is not None:
+                yield "[Section break]"
+        elif element.tag == W_TC:
+            text = " ".join(cells.pop())
+            if rows:
+                rows[-1].append(text)
+        elif element.tag == W_TR:
+            row = " | ".join(rows.pop())
+            if cells:
+                cells[-1].append(row)
+            elif row.strip(" |"):
+                yield row
+        if depth == container_depth:
+            # A finished top-level block: drop it so the tree never grows
+            container.remove(element)
+
+
+def docx_text_and_offsets(file):
+    """Extract DOCX text, returning (text, offsets); DOCX has no pages, so offsets is [0].
+
+    Headers and footers are included once each, before and after the body.
+    """
+    with zipfile.ZipFile(file) as archive:
+        parts = {'header': [], 'footer': []}
+        for name in sorted(archive.namelist()):
+            match = DOCX_PART.match(name)
+            if match:
+                with archive.open(name) as stream:
+                    text = "\n".join(iter_docx_blocks(stream))
+                if text and text not in parts[match.group(1)]:
+                    parts[match.group(1)].append(text)
+        lines = [f"[Header]\n{text}\n" for text in parts['header']]
+        with archive.open('word/document.xml') as stream:
+            lines.extend(f"{block}\n" for block in iter_docx_blocks(stream))
+        lines.extend(f"[Footer]\n{text}\n" for text in parts['footer'])
+    return "".join(lines), [0]
+
+
+def extract_text_from_pdf(file, pages=None, cache=None):
+    """Extract text from PDF file"""
+    try:
+        if cache:
+            # Entries cached before page breaks were marked carry a different variant
+            variant = f"pdf:paged:{pages}" if pages else "pdf:paged"
+            text, _ = cache.get_or_extract(file, variant, lambda f: pdf_text_and_offsets(f, pages))
+        else:
+            text, _ = pdf_text_and_offsets(file, pages)
+        return text
+    except Exception as e:
+        logger.error(f"Error extracting PDF text: {e}")
+        return f"Error extracting text from PDF: {str(e)}"
+
+
+def extract_text_from_txt(file):
+    """Extract text from TXT file, falling back to other encodings when it is not UTF-8"""
+    try:
+        with mapped(file) as source:
+            text, encoding = decode_text(source)
+        if encoding != 'utf-8-sig':
+            logger.info(f"Text file decoded as {encoding}")
+        return text
+    except Exception as e:
+        logger.error(f"Error extracting TXT text: {e}")
+        return f"Error extracting text from TXT: {str(e)}"
+
+
+def extract_text_from_docx(file, cache=None):
+    """Extract text from DOCX file"""
+    try:
+        if cache:
+            text, _ = cache.get_or_extract(file, "docx:xml", docx_text_and_offsets)
+        else:
+            text, _ = docx_text_and_offsets(file)
+        return text
+    except Exception as e:
+        logger.error(f"Error extracting DOCX text: {e}")
+        return f"Error extracting text from DOCX: {str(e)}"
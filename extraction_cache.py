@@ -0,0 +1,152 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import time
+import zlib
+from array import array
+
+logger = logging.getLogger(__name__)
+
+
+def file_digest(file):
+    """SHA-256 of an upload stream's bytes; the stream is rewound afterwards"""
+    digest = hashlib.sha256()
+    file.seek(0)
+    while True:
+        block = file.read(1024 * 1024)
+        if not block:
+            break
+        digest.update(block)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+class ExtractionCache:
+    """Persistent cache of extracted document text keyed by the uploaded file's bytes.
+
+    Entries live in a SQLite file so every server process on the host shares
+    them. Text is stored zlib-compressed and page offsets as a packed uint32
+    array. When the stored size exceeds max_bytes the least recently used
+    entries are evicted. Hit/miss counters are kept in the same database so
+    they cover all processes.
+    """
+
+    def __init__(self, db_path, max_bytes=256 * 1024 * 1024):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS extractions '
+                '(key TEXT PRIMARY KEY, text BLOB NOT NULL, offsets BLOB NOT NULL, '
+                'size INTEGER NOT NULL, accessed REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS extractions_accessed ON extractions (accessed)')
+            conn.execute('CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=5)
+
+    def _count(self, conn, name):
+        conn.execute(
+            'INSERT INTO counters (name, value) VALUES (?, 1) '
+            'ON CONFLICT(name) DO UPDATE SET value = value + 1', (name,)
+        )
+
+    def get(self, key):
+        """Return (text, offsets) for key, or None"""
+        with self._connect() as conn:
+            row = conn.execute('SELECT text, offsets FROM extractions WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self._count(conn, 'misses')
+                return None
+            conn.execute('UPDATE extractions SET accessed = ? WHERE key = ?', (time.time(), key))
+            self._count(conn, 'hits')
+        offsets = array('I')
+        offsets.frombytes(row[1])
+        return zlib.decompress(row[0]).decode('utf-8'), offsets.tolist()
+
+    def set(self, key, text, offsets):
+        """Store extracted text and the character offset where each page starts"""
+        text_blob = zlib.compress(text.encode('utf-8'), 6)
+        offsets_blob = array('I', offsets).tobytes()
+        size = len(text_blob) + len(offsets_blob)
+        if size > self.max_bytes:
+            return
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO extractions (key, text, offsets, size, accessed) VALUES (?, ?, ?, ?, ?)',
+                (key, text_blob, offsets_blob, size, time.time())
+            )
+            self._evict(conn)
+
+    def _evict(self, conn):
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM extractions').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        evicted = 0
+        for key, size in conn.execute('SELECT key, size FROM extractions ORDER BY accessed').fetchall():
+            if excess <= 0:
+                break
+            conn.execute('DELETE FROM extractions WHERE key = ?', (key,))
+            excess -= size
+            evicted += 1
+        conn.execute(
+            'INSERT INTO counters (name, value) VALUES (?, ?) '
+            'ON CONFLICT(name) DO UPDATE SET value = value + excluded.value', ('evictions', evicted)
+        )
+
+    def get_or_extract(self, file, variant, extract):
+        """Return (text, offsets) for the upload, calling extract(file) only on a miss.
+
+        variant distinguishes different extractions of the same bytes, e.g. the
+        file type and the selected page range.
+        """
+        key = f"{file_digest(file)}:{variant}"
+        try:
+            cached = self.get(key)
+        except sqlite3.Error as e:
+            logger.error(f"Extraction cache read error: {e}")
+            cached = None
+        if cached is not None:
+            return cached
+
+        text, offsets = extract(file)
+        try:
+            self.set(key, text, offsets)
+        except sqlite3.Error as e:
+            logger.error(f"Extraction cache write error: {e}")
+        return text, offsets
+
+    def clear(self):
+        """Remove every cached extraction"""
+        with self._connect() as conn:
+            conn.execute('DELETE FROM extractions')
+
+    def get_stats(self):
+        """Hit/miss counters across all processes and current size"""
+        with self._connect() as conn:
+            stats = dict(conn.execute('SELECT name, value FROM counters').fetchall())
+            entries, size = conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM extractions').fetchone()
+        stats.setdefault('hits', 0)
+        stats.setdefault('misses', 0)
+        stats.setdefault('evictions', 0)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        stats['entries'] = entries
+        stats['bytes'] = size
+        stats['max_bytes'] = self.max_bytes
+        return stats
+
+
+def extraction_cache_from_env():
+    """Build the extraction cache from EXTRACTION_CACHE_* environment variables, or None if disabled"""
+    db_path = os.getenv('EXTRACTION_CACHE_DB', '')
+    if not db_path:
+        return None
+    return ExtractionCache(
+        db_path=db_path,
+        max_bytes=int(os.getenv('EXTRACTION_CACHE_MAX_MB', '256')) * 1024 * 1024
+    )
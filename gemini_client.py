@@ -0,0 +1,299 @@
+import asyncio
+import hashlib
+import logging
+import os
+import random
+import threading
+import time
+
+from prompts import estimate_tokens, estimate_tokens_for_length
+
+logger = logging.getLogger(__name__)
+
+# HTTP status codes and google.api_core exception names worth retrying
+RETRYABLE_CODES = {429, 500, 502, 503, 504}
+RETRYABLE_ERRORS = {
+    'ResourceExhausted', 'TooManyRequests', 'ServiceUnavailable',
+    'InternalServerError', 'DeadlineExceeded', 'GatewayTimeout', 'BadGateway',
+}
+RATE_LIMIT_ERRORS = {'ResourceExhausted', 'TooManyRequests'}
+
+
+class UpstreamBusyError(Exception):
+    """The model provider kept rejecting a request for quota or availability reasons"""
+
+
+def _error_code(error):
+    code = getattr(error, 'code', None)
+    # google.api_core exceptions expose the HTTP status as .code (an int or enum)
+    return getattr(code, 'value', code)
+
+
+def is_retryable(error):
+    """Quota, overload and transient server errors are retryable; bad requests are not"""
+    return _error_code(error) in RETRYABLE_CODES or type(error).__name__ in RETRYABLE_ERRORS
+
+
+def is_rate_limited(error):
+    return _error_code(error) == 429 or type(error).__name__ in RATE_LIMIT_ERRORS
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at rate_per_minute, holding at most one minute's worth"""
+
+    def __init__(self, rate_per_minute):
+        self.capacity = float(rate_per_minute)
+        self.tokens = self.capacity
+        self.rate = self.capacity / 60.0
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _reserve(self, amount):
+        """Take amount tokens and return 0 if available, else the seconds until they will be"""
+        # A request larger than the bucket would never fit; let it drain the bucket instead
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return 0
+            return (amount - self.tokens) / self.rate
+
+    def acquire(self, amount=1):
+        """Block until amount tokens are available, then take them"""
+        while True:
+            wait = self._reserve(amount)
+            if not wait:
+                return
+            time.sleep(min(wait, 1.0))
+
+    async def acquire_async(self, amount=1):
+        """Wait without blocking the event loop until amount tokens are available, then take them"""
+        while True:
+            wait = self._reserve(amount)
+            if not wait:
+                return
+            await asyncio.sleep(min(wait, 1.0))
+
+    def consume(self, amount):
+        """Take tokens without waiting; the balance may go negative and delay later callers"""
+        with self._lock:
+            self._refill()
+            self.tokens -= amount
+
+
+class _Flight:
+    """One upstream call shared by all concurrent callers with the same prompt"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class GeminiClient:
+    """Rate-limited, retrying wrapper around a GenerativeModel.
+
+    Works with any object exposing generate_content(prompt, stream=False), so a
+    local fake model can stand in for Gemini.
+
+    - requests per minute and tokens per minute are enforced with token buckets
+      (0 disables a limit)
+    - at most max_concurrency calls are in flight at once
+    - retryable errors are retried with exponential backoff and full jitter
+    - concurrent generate() calls with an identical prompt share one upstream call
+
+    generate_async() is the event-loop counterpart of generate(). It shares the
+    rate limits, retry policy and counters, but holds up to
+    max_async_concurrency calls in flight without a thread per call. It uses
+    the model's generate_content_async when available.
+    """
+
+    def __init__(self, model, rpm=60, tpm=1000000, max_concurrency=8,
+                 max_retries=4, base_delay=1.0, max_delay=30.0, sleep=time.sleep,
+                 max_async_concurrency=256):
+        self.model = model
+        self.request_bucket = TokenBucket(rpm) if rpm else None
+        self.token_bucket = TokenBucket(tpm) if tpm else None
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._sleep = sleep
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._flights = {}
+        self._flights_lock = threading.Lock()
+        self.max_async_concurrency = max_async_concurrency
+        # Created on first use, inside the event loop that serves requests
+        self._async_slots = None
+        self._async_flights = {}
+        self._stats_lock = threading.Lock()
+        self.stats = {'calls': 0, 'retries': 0, 'coalesced': 0, 'errors': 0}
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def _backoff_delay(self, attempt):
+        """Full jitter: a random time up to the exponential delay for this attempt"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _backoff(self, attempt):
+        self._sleep(self._backoff_delay(attempt))
+
+    def _throttle(self, prompt):
+        if self.request_bucket:
+            self.request_bucket.acquire(1)
+        if self.token_bucket:
+            self.token_bucket.acquire(estimate_tokens(prompt))
+
+    def _call(self, prompt):
+        """One rate-limited, retried, non-streaming upstream call"""
+        for attempt in range(self.max_retries + 1):
+            self._throttle(prompt)
+            try:
+                with self._slots:
+                    self._count('calls')
+                    response = self.model.generate_content(prompt)
+                    text = response.text
+                if self.token_bucket and text:
+                    self.token_bucket.consume(estimate_tokens(text))
+                return text
+            except Exception as e:
+                if not is_retryable(e) or attempt == self.max_retries:
+                    self._count('errors')
+                    if is_rate_limited(e):
+                        raise UpstreamBusyError(str(e)) from e
+                    raise
+                self._count('retries')
+                logger.warning(f"Retrying model call after error ({attempt + 1}/{self.max_retries}): {e}")
+                self._backoff(attempt)
+
+    def generate(self, prompt, coalesce=True):
+        """Return the response text for prompt, coalescing identical concurrent requests.
+
+        coalesce=False always makes a call of its own (used for hedge requests).
+        """
+        if not coalesce:
+            return self._call(prompt)
+        key = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            self._count('coalesced')
+            flight.done.wait()
+            if flight.error:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = self._call(prompt)
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._flights_lock:
+                del self._flights[key]
+            flight.done.set()
+
+    async def _throttle_async(self, prompt):
+        if self.request_bucket:
+            await self.request_bucket.acquire_async(1)
+        if self.token_bucket:
+            await self.token_bucket.acquire_async(estimate_tokens(prompt))
+
+    async def _call_async(self, prompt):
+        """One rate-limited, retried upstream call awaited on the event loop"""
+        if self._async_slots is None:
+            self._async_slots = asyncio.Semaphore(self.max_async_concurrency)
+        generate = getattr(self.model, 'generate_content_async', None)
+        for attempt in range(self.max_retries + 1):
+            await self._throttle_async(prompt)
+            try:
+                async with self._async_slots:
+                    self._count('calls')
+                    if generate:
+                        response = await generate(prompt)
+                    else:
+                        response = await asyncio.to_thread(self.model.generate_content, prompt)
+                    text = response.text
+                if self.token_bucket and text:
+                    self.token_bucket.consume(estimate_tokens(text))
+                return text
+            except Exception as e:
+                if not is_retryable(e) or attempt == self.max_retries:
+                    self._count('errors')
+                    if is_rate_limited(e):
+                        raise UpstreamBusyError(str(e)) from e
+                    raise
+                self._count('retries')
+                logger.warning(f"Retrying model call after error ({attempt + 1}/{self.max_retries}): {e}")
+                await asyncio.sleep(self._backoff_delay(attempt))
+
+    async def generate_async(self, prompt, coalesce=True):
+        """Async generate(): identical concurrent prompts on the event loop share one upstream call"""
+        if not coalesce:
+            return await self._call_async(prompt)
+        key = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+        flight = self._async_flights.get(key)
+        if flight is not None:
+            self._count('coalesced')
+            return await asyncio.shield(flight)
+
+        flight = self._async_flights[key] = asyncio.ensure_future(self._call_async(prompt))
+        flight.add_done_callback(lambda _: self._async_flights.pop(key, None))
+        # Shielded so a cancelled caller does not cancel the call others are waiting on
+        return await asyncio.shield(flight)
+
+    def generate_stream(self, prompt):
+        """Yield response text chunks; errors are retried only until the first chunk arrives"""
+        for attempt in range(self.max_retries + 1):
+            self._throttle(prompt)
+            started = False
+            try:
+                with self._slots:
+                    self._count('calls')
+                    output_chars = 0
+                    for chunk in self.model.generate_content(prompt, stream=True):
+                        if chunk.text:
+                            started = True
+                            output_chars += len(chunk.text)
+                            yield chunk.text
+                if self.token_bucket:
+                    self.token_bucket.consume(estimate_tokens_for_length(output_chars))
+                return
+            except Exception as e:
+                if started or not is_retryable(e) or attempt == self.max_retries:
+                    self._count('errors')
+                    if is_rate_limited(e):
+                        raise UpstreamBusyError(str(e)) from e
+                    raise
+                self._count('retries')
+                logger.warning(f"Retrying streaming model call after error ({attempt + 1}/{self.max_retries}): {e}")
+                self._backoff(attempt)
+
+    def get_stats(self):
+        with self._stats_lock:
+            return dict(self.stats)
+
+
+def gemini_client_from_env(model):
+    """Wrap model in a GeminiClient configured from GEMINI_* environment variables"""
+    return GeminiClient(
+        model,
+        rpm=int(os.getenv('GEMINI_RPM', '60')),
+        tpm=int(os.getenv('GEMINI_TPM', '1000000')),
+        max_concurrency=int(os.getenv('GEMINI_MAX_CONCURRENCY', '8')),
+        max_retries=int(os.getenv('GEMINI_MAX_RETRIES', '4')),
+        base_delay=float(os.getenv('GEMINI_RETRY_BASE_DELAY', '1.0')),
+        max_delay=float(os.getenv('GEMINI_RETRY_MAX_DELAY', '30')),
+        max_async_concurrency=int(os.getenv('GEMINI_ASYNC_MAX_CONCURRENCY', '256')),
+    )
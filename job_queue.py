@@ -0,0 +1,167 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity"""
+
+
+class JobStoppedError(Exception):
+    """Raised inside a job that timed out or was cancelled while running"""
+
+
+# The job each worker thread is running, for check_job
+_current = threading.local()
+
+
+def check_job():
+    """Raise JobStoppedError if the job running on this thread has timed out or been cancelled.
+
+    Jobs call this between steps so a stopped job frees its worker at the next
+    step instead of running to the end.
+    """
+    job = getattr(_current, 'job', None)
+    if job and job.status != 'running':
+        raise JobStoppedError(job.error or f"Job {job.status}")
+
+
+class Job:
+    """A unit of background work and its outcome"""
+
+    def __init__(self, func, args, timeout):
+        self.id = uuid.uuid4().hex
+        self.func = func
+        self.args = args
+        self.timeout = timeout
+        self.status = 'queued'
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.future = None
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'result': self.result,
+            'error': self.error,
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished,
+        }
+
+
+class JobQueue:
+    """Bounded in-process job queue backed by a thread pool.
+
+    At most max_depth jobs may be queued or running at once; further submissions
+    raise QueueFullError. Timeouts are capped at max_timeout. A job is marked
+    as timed out as soon as its timeout passes; worker threads cannot be
+    interrupted, so the job stops at its next check_job call and any result
+    it still produces is discarded. Cancelled jobs stop the same way.
+    """
+
+    ACTIVE = ('queued', 'running')
+
+    def __init__(self, max_workers=4, max_depth=32, job_timeout=300, max_timeout=1800, result_ttl=3600):
+        self.max_depth = max_depth
+        self.max_timeout = max_timeout
+        self.job_timeout = min(job_timeout, max_timeout)
+        self.result_ttl = result_ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args, timeout=None):
+        """Queue func(*args) and return the new Job; timeout is capped at max_timeout"""
+        with self._lock:
+            self._expire()
+            # Jobs that timed out or were cancelled mid-run still occupy a worker
+            in_flight = sum(1 for job in self._jobs.values() if job.future and not job.future.done())
+            if in_flight >= self.max_depth:
+                raise QueueFullError(f"Job queue is full ({self.max_depth} jobs in progress)")
+            job = Job(func, args, min(timeout, self.max_timeout) if timeout and timeout > 0 else self.job_timeout)
+            self._jobs[job.id] = job
+            job.future = self._executor.submit(self._run, job)
+        return job
+
+    def _run(self, job):
+        with self._lock:
+            if job.status != 'queued':
+                return
+            job.status = 'running'
+            job.started = time.time()
+        # Marks the job as timed out on time, not only when it is next polled
+        timer = threading.Timer(job.timeout, self._time_out, (job,))
+        timer.daemon = True
+        timer.start()
+        _current.job = job
+        try:
+            result = job.func(*job.args)
+            error = None
+        except Exception as e:
+            result, error = None, str(e)
+        finally:
+            timer.cancel()
+            _current.job = None
+        with self._lock:
+            self._check_timeout(job)
+            if job.status != 'running':
+                # Cancelled or timed out while running: drop the outcome
+                return
+            job.result = result
+            job.error = error
+            job.status = 'failed' if error else 'completed'
+            job.finished = time.time()
+
+    def _time_out(self, job):
+        with self._lock:
+            if job.status == 'running':
+                self._mark_timeout(job)
+
+    def _check_timeout(self, job):
+        if job.status == 'running' and time.time() - job.started > job.timeout:
+            self._mark_timeout(job)
+
+    def _mark_timeout(self, job):
+        job.status = 'timeout'
+        job.error = f"Job exceeded {job.timeout} second timeout"
+        job.finished = time.time()
+
+    def _expire(self):
+        cutoff = time.time() - self.result_ttl
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished and job.finished < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def get(self, job_id):
+        """Return the job with the given id, or None"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job:
+                self._check_timeout(job)
+            return job
+
+    def cancel(self, job_id):
+        """Cancel a queued or running job; returns the job, or None if unknown"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job and job.status in self.ACTIVE:
+                job.future.cancel()
+                job.status = 'cancelled'
+                job.finished = time.time()
+            return job
+
+    def get_stats(self):
+        """Job counts by status"""
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                self._check_timeout(job)
+                counts[job.status] = counts.get(job.status, 0) + 1
+            return {'max_depth': self.max_depth, 'jobs': counts}
@@ -0,0 +1,197 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+# Seconds; spans cache hits (milliseconds) to long map-reduce analyses (minutes)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+
+def _format_labels(labelnames, values):
+    if not labelnames:
+        return ""
+    pairs = []
+    for name, value in zip(labelnames, values):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels"""
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket counts (last slot is +Inf), sum, count
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        labelnames = self.labelnames + ('le',)
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip((*self.buckets, '+Inf'), counts):
+                    cumulative += bucket_count
+                    lines.append(f"{self.name}_bucket{_format_labels(labelnames, (*key, bound))} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Holds metrics and renders them in the Prometheus text exposition format"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, help_text, labelnames=()):
+        metric = Counter(name, help_text, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help_text, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+REQUESTS = REGISTRY.counter(
+    'legal_assistant_requests_total', 'Requests handled', ('route', 'type'))
+ERRORS = REGISTRY.counter(
+    'legal_assistant_errors_total', 'Requests that ended in an error', ('route', 'type'))
+INPUT_CHARS = REGISTRY.counter(
+    'legal_assistant_input_chars_total', 'Characters of document text or requirements received', ('route', 'type'))
+OUTPUT_CHARS = REGISTRY.counter(
+    'legal_assistant_output_chars_total', 'Characters of generated output returned', ('route', 'type'))
+REQUEST_SECONDS = REGISTRY.histogram(
+    'legal_assistant_request_seconds', 'End-to-end request latency', ('route', 'type'))
+STAGE_SECONDS = REGISTRY.histogram(
+    'legal_assistant_stage_seconds', 'Latency of each request stage', ('route', 'stage'))
+COMPACTION_TOKENS_SAVED = REGISTRY.counter(
+    'legal_assistant_compaction_tokens_saved_total', 'Estimated input tokens removed by compaction')
+MODEL_SECONDS = REGISTRY.histogram(
+    'legal_assistant_model_seconds', 'Latency of successful model calls', ('model',))
+MODEL_ERRORS = REGISTRY.counter(
+    'legal_assistant_model_errors_total', 'Model calls that failed after retries', ('model',))
+MODEL_FALLBACKS = REGISTRY.counter(
+    'legal_assistant_model_fallbacks_total', 'Calls handed to the next model of a route after an error', ('model',))
+MODEL_HEDGES = REGISTRY.counter(
+    'legal_assistant_model_hedges_total', 'Hedge requests started after the latency deadline', ('model', 'winner'))
+NEAR_DUPLICATE_REUSES = REGISTRY.counter(
+    'legal_assistant_near_duplicate_reuses_total', 'Analyses answered from an earlier near-identical document', ('mode',))
+
+_current_timer = contextvars.ContextVar('request_timer', default=None)
+
+
+class RequestTimer:
+    """Collects per-stage timings and counters for one request"""
+
+    def __init__(self, route):
+        self.route = route
+        self.type = ''
+        self.input_chars = 0
+        self.output_chars = 0
+        self.failed = False
+        self.stages = {}
+        self.started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - started
+
+    def fail(self):
+        self.failed = True
+
+    def finish(self):
+        """Record everything collected into the registry; returns total seconds"""
+        elapsed = time.perf_counter() - self.started
+        labels = {'route': self.route, 'type': self.type}
+        REQUESTS.inc(**labels)
+        if self.failed:
+            ERRORS.inc(**labels)
+        INPUT_CHARS.inc(self.input_chars, **labels)
+        OUTPUT_CHARS.inc(self.output_chars, **labels)
+        REQUEST_SECONDS.observe(elapsed, **labels)
+        for name, seconds in self.stages.items():
+            STAGE_SECONDS.observe(seconds, route=self.route, stage=name)
+        return elapsed
+
+    def server_timing(self, total):
+        """Server-Timing header value with each stage and the total in milliseconds"""
+        parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.stages.items()]
+        parts.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(parts)
+
+
+@contextmanager
+def track_request(route):
+    """Make a RequestTimer current for the duration of a request"""
+    timer = RequestTimer(route)
+    token = _current_timer.set(timer)
+    try:
+        yield timer
+    finally:
+        _current_timer.reset(token)
+
+
+def current_timer():
+    """The RequestTimer of the request being handled on this thread, or None"""
+    return _current_timer.get()
+
+
+def stage(name):
+    """Time a stage of the current request; a no-op outside tracked requests"""
+    timer = _current_timer.get()
+    return timer.stage(name) if timer else nullcontext()
@@ -0,0 +1,358 @@
+import asyncio
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from compaction import prompt_token_budget
+from gemini_client import gemini_client_from_env
+from metrics import MODEL_ERRORS, MODEL_FALLBACKS, MODEL_HEDGES, MODEL_SECONDS
+from prompts import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+SIZE_TIERS = ('small', 'medium', 'large')
+
+
+def parse_routes(spec):
+    """Parse 'task[:tier]=model[|fallback...]' entries separated by ';' or ','.
+
+    task is an analysis or document type, or '*' for any; tier is small,
+    medium or large. Returns {key: [models]}.
+    """
+    routes = {}
+    for entry in spec.replace(',', ';').split(';'):
+        if not entry.strip():
+            continue
+        key, _, models = entry.partition('=')
+        key = key.strip()
+        names = [name.strip() for name in models.split('|') if name.strip()]
+        tier = key.partition(':')[2]
+        if not key or not names or (tier and tier not in SIZE_TIERS):
+            raise ValueError(f"Invalid model route: {entry.strip()!r}")
+        routes[key] = names
+    return routes
+
+
+class LatencyWindow:
+    """Latencies of the most recent successful calls, for percentiles"""
+
+    def __init__(self, size=512):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def quantile(self, q):
+        """Latency below which a fraction q of recent calls finished; None with no samples"""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+class ModelRouter:
+    """Sends each prompt to the model configured for its task and size, with fallback and hedging.
+
+    - routes map a task (analysis or document type) and size tier to a chain
+      of models; later models in the chain are tried in turn when a call fails
+    - with hedging on, a call still running after the model's recent
+      hedge_quantile latency gets a duplicate request, and whichever answers
+      first wins; at most hedge_max_share of a model's requests are hedges, so
+      a slow-down across the board does not double the upstream load
+    - latency and error statistics are kept per model
+
+    client_factory(model_name) returns a GeminiClient (or anything with the
+    same generate methods) and is called once per model, on first use, so
+    local fake backends can be plugged in for tests and benchmarks.
+    """
+
+    def __init__(self, client_factory, default_model, routes=None, fallback_model=None,
+                 small_max_tokens=2000, medium_max_tokens=8000, hedge=False, hedge_quantile=0.95,
+                 hedge_min_samples=20, hedge_min_delay=0.5, hedge_max_share=0.1, hedge_workers=32):
+        self.client_factory = client_factory
+        self.default_model = default_model
+        self.routes = routes or {}
+        self.fallback_model = fallback_model
+        self.small_max_tokens = small_max_tokens
+        self.medium_max_tokens = medium_max_tokens
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_max_share = hedge_max_share
+        self._clients = {}
+        self._latency = {}
+        self._lock = threading.Lock()
+        self.stats = {}
+        # Hedged calls run here so the caller can wait on both requests at once;
+        # hedge_workers should cover every concurrent call the clients allow,
+        # or calls queue here instead of upstream
+        self._executor = ThreadPoolExecutor(max_workers=hedge_workers) if hedge else None
+
+    def tier(self, tokens):
+        if tokens <= self.small_max_tokens:
+            return 'small'
+        return 'medium' if tokens <= self.medium_max_tokens else 'large'
+
+    def route(self, task, tokens):
+        """Models to try, in order, for a prompt of about tokens for task"""
+        tier = self.tier(tokens)
+        for key in (f"{task}:{tier}", task, f"*:{tier}", '*'):
+            if key in self.routes:
+                models = list(self.routes[key])
+                break
+        else:
+            models = [self.default_model]
+        if self.fallback_model and self.fallback_model not in models:
+            models.append(self.fallback_model)
+        return models
+
+    def signature(self, task):
+        """Routing settings that can change the model answering task, for cache keys"""
+        entries = [self.default_model]
+        entries.extend(
+            f"{key}={'|'.join(models)}" for key, models in sorted(self.routes.items())
+            if key.partition(':')[0] in (task, '*')
+        )
+        return ';'.join(entries)
+
+    def prompt_budget(self, task, tokens):
+        """Largest prompt, in tokens, that every model a prompt of this size may go to accepts"""
+        return min(prompt_token_budget(name) for name in self.route(task, tokens))
+
+    def client(self, name):
+        with self._lock:
+            client = self._clients.get(name)
+            if client is None:
+                client = self._clients[name] = self.client_factory(name)
+                self._latency[name] = LatencyWindow()
+                self.stats[name] = {'requests': 0, 'errors': 0, 'fallbacks': 0, 'hedges': 0, 'hedge_wins': 0}
+            return client
+
+    def _count(self, name, counter):
+        with self._lock:
+            self.stats[name][counter] += 1
+
+    def _record(self, name, started):
+        elapsed = time.perf_counter() - started
+        self._latency[name].record(elapsed)
+        MODEL_SECONDS.observe(elapsed, model=name)
+
+    def _failed(self, name):
+        self._count(name, 'errors')
+        MODEL_ERRORS.inc(model=name)
+
+    def _hedge_delay(self, name):
+        """Seconds to wait before hedging a call to name, or None when not hedging"""
+        latency = self._latency.get(name)
+        if not self.hedge or latency is None or len(latency) < self.hedge_min_samples:
+            return None
+        return max(self.hedge_min_delay, latency.quantile(self.hedge_quantile))
+
+    def _start_hedge(self, name):
+        """Count a hedge for name unless that would exceed hedge_max_share of its requests"""
+        with self._lock:
+            stats = self.stats[name]
+            if stats['hedges'] + 1 > self.hedge_max_share * stats['requests']:
+                return False
+            stats['hedges'] += 1
+            return True
+
+    def _fall_back(self, name, position, models, error):
+        """Raise error if models has nothing after position, otherwise log the hand-over"""
+        if position == len(models) - 1:
+            raise error
+        self._count(name, 'fallbacks')
+        MODEL_FALLBACKS.inc(model=name)
+        logger.warning(f"Model {name} failed ({error}), falling back to {models[position + 1]}")
+
+    def _observe(self, name, coalesce, prompt):
+        client = self.client(name)
+        self._count(name, 'requests')
+        started = time.perf_counter()
+        try:
+            text = client.generate(prompt, coalesce=coalesce)
+        except Exception:
+            self._failed(name)
+            raise
+        self._record(name, started)
+        return text
+
+    def _generate_hedged(self, name, prompt):
+        delay = self._hedge_delay(name)
+        if delay is None:
+            return self._observe(name, True, prompt)
+
+        primary = self._executor.submit(self._observe, name, True, prompt)
+        try:
+            return primary.result(timeout=delay)
+        except FutureTimeoutError:
+            if not self._start_hedge(name):
+                return primary.result()
+        backup = self._executor.submit(self._observe, name, False, prompt)
+        pending = {primary, backup}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    winner = 'hedge' if future is backup else 'primary'
+                    if future is backup:
+                        self._count(name, 'hedge_wins')
+                    MODEL_HEDGES.inc(model=name, winner=winner)
+                    # The slower request cannot be interrupted; its answer is discarded
+                    return future.result()
+                error = future.exception()
+        MODEL_HEDGES.inc(model=name, winner='none')
+        raise error
+
+    def generate(self, prompt, task=None):
+        """Response text for prompt from the models routed for task, falling back on errors"""
+        models = self.route(task, estimate_tokens(prompt))
+        for position, name in enumerate(models):
+            try:
+                return self._generate_hedged(name, prompt)
+            except Exception as e:
+                self._fall_back(name, position, models, e)
+
+    async def _observe_async(self, name, coalesce, prompt):
+        client = self.client(name)
+        self._count(name, 'requests')
+        started = time.perf_counter()
+        try:
+            text = await client.generate_async(prompt, coalesce=coalesce)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self._failed(name)
+            raise
+        self._record(name, started)
+        return text
+
+    async def _generate_hedged_async(self, name, prompt):
+        delay = self._hedge_delay(name)
+        if delay is None:
+            return await self._observe_async(name, True, prompt)
+
+        primary = asyncio.ensure_future(self._observe_async(name, True, prompt))
+        pending = {primary}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if done or not self._start_hedge(name):
+                return await primary
+            backup = asyncio.ensure_future(self._observe_async(name, False, prompt))
+            pending.add(backup)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is backup:
+                            self._count(name, 'hedge_wins')
+                        MODEL_HEDGES.inc(model=name, winner='hedge' if task is backup else 'primary')
+                        return task.result()
+                    error = task.exception()
+            MODEL_HEDGES.inc(model=name, winner='none')
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def generate_async(self, prompt, task=None):
+        """Async generate(); hedge requests are awaited on the event loop"""
+        models = self.route(task, estimate_tokens(prompt))
+        for position, name in enumerate(models):
+            try:
+                return await self._generate_hedged_async(name, prompt)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._fall_back(name, position, models, e)
+
+    def generate_stream(self, prompt, task=None):
+        """Yield response text chunks; falls back to the next model only before the first chunk.
+
+        Streams are not hedged, and their latency is left out of the
+        percentiles, which cover complete non-streaming calls.
+        """
+        models = self.route(task, estimate_tokens(prompt))
+        for position, name in enumerate(models):
+            client = self.client(name)
+            self._count(name, 'requests')
+            started = False
+            try:
+                for chunk in client.generate_stream(prompt):
+                    started = True
+                    yield chunk
+                return
+            except Exception as e:
+                self._failed(name)
+                if started:
+                    raise
+                self._fall_back(name, position, models, e)
+
+    def get_stats(self):
+        """Per-model request, error, fallback and hedge counts with latency percentiles"""
+        models = {}
+        with self._lock:
+            names = list(self._clients)
+        for name in names:
+            latency = self._latency[name]
+            with self._lock:
+                stats = dict(self.stats[name])
+            for label, q in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99)):
+                value = latency.quantile(q)
+                stats[f"{label}_seconds"] = None if value is None else round(value, 4)
+            get_client_stats = getattr(self._clients[name], 'get_stats', None)
+            if get_client_stats:
+                stats['client'] = get_client_stats()
+            models[name] = stats
+        return {
+            'default_model': self.default_model,
+            'fallback_model': self.fallback_model,
+            'routes': {key: '|'.join(names) for key, names in self.routes.items()},
+            'hedging': self.hedge,
+            'models': models,
+        }
+
+
+def model_router_from_env(make_model, default_model, make_client=gemini_client_from_env):
+    """Router configured from GEMINI_* and ROUTING_* environment variables.
+
+    make_model(name) builds the GenerativeModel for a model name; every model
+    gets its own client (make_client(model)), rate limits and retry policy.
+    """
+    routes = parse_routes(os.getenv('GEMINI_MODEL_ROUTES', ''))
+    fallback_model = os.getenv('GEMINI_FALLBACK_MODEL') or None
+    hedge_max_share = float(os.getenv('GEMINI_HEDGE_MAX_SHARE', '0.1'))
+    # By default every model's client can be busy at GEMINI_MAX_CONCURRENCY
+    # calls with hedges on top of them, all without waiting for a hedge thread
+    models = {default_model, *(name for names in routes.values() for name in names)} | ({fallback_model} - {None})
+    client_concurrency = int(os.getenv('GEMINI_MAX_CONCURRENCY', '8'))
+    hedge_workers = int(os.getenv('GEMINI_HEDGE_WORKERS', '0')) or math.ceil(
+        len(models) * client_concurrency * (1 + hedge_max_share))
+    return ModelRouter(
+        lambda name: make_client(make_model(name)),
+        default_model,
+        routes=routes,
+        fallback_model=fallback_model,
+        small_max_tokens=int(os.getenv('ROUTING_SMALL_MAX_TOKENS', '2000')),
+        medium_max_tokens=int(os.getenv('ROUTING_MEDIUM_MAX_TOKENS', '8000')),
+        hedge=os.getenv('GEMINI_HEDGE', '0').lower() in ('1', 'true', 'yes'),
+        hedge_quantile=float(os.getenv('GEMINI_HEDGE_QUANTILE', '0.95')),
+        hedge_min_samples=int(os.getenv('GEMINI_HEDGE_MIN_SAMPLES', '20')),
+        hedge_min_delay=float(os.getenv('GEMINI_HEDGE_MIN_DELAY', '0.5')),
+        hedge_max_share=hedge_max_share,
+        hedge_workers=hedge_workers,
+    )
@@ -0,0 +1,241 @@
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from array import array
+
+from chunking import section_heading
+
+logger = logging.getLogger(__name__)
+
+WORD = re.compile(r'\w+')
+
+# Words per shingle; shingles are taken within clauses, never across them
+SHINGLE_WORDS = 5
+# MinHash signature length, split into BANDS bands of NUM_PERM // BANDS values
+# for LSH. With 16 bands of 8, documents at 0.85 similarity become candidates
+# with about 99% probability and documents at 0.5 with about 6%
+NUM_PERM = 128
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+MASK64 = (1 << 64) - 1
+
+
+def _hash64(data):
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little')
+
+
+def _normalize(clause):
+    return ' '.join(WORD.findall(clause.lower()))
+
+
+def clause_hashes(clauses):
+    """64-bit hash of each clause with case and punctuation ignored"""
+    return array('Q', (_hash64(_normalize(clause).encode('utf-8')) for clause in clauses))
+
+
+def clause_headings(clauses):
+    """First line of each clause, cut to 100 characters, to name clauses in notes and prompts"""
+    return [' '.join(section_heading(clause).split())[:100] for clause in clauses]
+
+
+def minhash_signature(clauses):
+    """MinHash signature of the word shingles of clauses, or None when there are no words.
+
+    Uses one-permutation hashing: every shingle is hashed once and the hash
+    picks one of NUM_PERM bins, each keeping its minimum. Empty bins borrow
+    the value of the next non-empty bin (rotation densification), so a
+    signature costs one hash per shingle rather than NUM_PERM. The share of
+    equal positions in two signatures estimates the Jaccard similarity of
+    their shingle sets.
+    """
+    hashes = set()
+    for clause in clauses:
+        words = WORD.findall(clause.lower())
+        for start in range(max(1, len(words) - SHINGLE_WORDS + 1)):
+            shingle = ' '.join(words[start:start + SHINGLE_WORDS])
+            if shingle:
+                hashes.add(_hash64(shingle.encode('utf-8')))
+    if not hashes:
+        return None
+
+    bins = [None] * NUM_PERM
+    for value in hashes:
+        position, rest = value % NUM_PERM, value // NUM_PERM
+        if bins[position] is None or rest < bins[position]:
+            bins[position] = rest
+    signature = array('Q', bytes(8 * NUM_PERM))
+    for position in range(NUM_PERM):
+        distance = 0
+        while bins[(position + distance) % NUM_PERM] is None:
+            distance += 1
+        value = bins[(position + distance) % NUM_PERM]
+        # Mix in the distance so borrowed values differ from the originals
+        signature[position] = value if distance == 0 else (value ^ (distance * 0x9E3779B97F4A7C15)) & MASK64
+    return signature
+
+
+def similarity(first, second):
+    """Estimated Jaccard similarity of two signatures"""
+    return sum(1 for a, b in zip(first, second) if a == b) / NUM_PERM
+
+
+class NearDuplicateIndex:
+    """Persistent MinHash/LSH index of analyzed documents and their results.
+
+    Every document is stored under a scope (the analysis type with everything
+    else that affects its result) with its signature, clause hashes and
+    headings, and the analysis result. Each band of the signature is hashed
+    with the scope into an indexed key, so a lookup reads only documents
+    sharing at least one band and then compares at most max_candidates
+    signatures; the cost does not grow with the number of stored documents. Beyond max_entries the oldest
+    documents are dropped.
+    """
+
+    def __init__(self, db_path, threshold=0.85, max_entries=200000, max_candidates=32):
+        self.db_path = db_path
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_candidates = max_candidates
+        self._lock = threading.Lock()
+        self.stats = {'lookups': 0, 'hits': 0, 'candidates': 0, 'stores': 0, 'lookup_seconds': 0.0}
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS documents '
+                '(id INTEGER PRIMARY KEY, signature BLOB NOT NULL, clauses BLOB NOT NULL, '
+                'headings BLOB NOT NULL, result BLOB NOT NULL, chunks INTEGER NOT NULL, created REAL NOT NULL)'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS bands (key INTEGER NOT NULL, doc INTEGER NOT NULL, '
+                'PRIMARY KEY (key, doc)) WITHOUT ROWID'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS bands_doc ON bands (doc)')
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=5)
+
+    @staticmethod
+    def _band_keys(scope, signature):
+        prefix = scope.encode('utf-8') + b'\0'
+        keys = []
+        for band in range(BANDS):
+            data = prefix + bytes([band]) + signature[band * ROWS:(band + 1) * ROWS].tobytes()
+            keys.append(int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little', signed=True))
+        return keys
+
+    def lookup(self, scope, signature):
+        """Most similar stored document in scope at or above the threshold, or None.
+
+        Returns a dict with id, similarity, result, chunks, clause_hashes,
+        clause_headings and created.
+        """
+        started = time.perf_counter()
+        keys = self._band_keys(scope, signature)
+        with self._connect() as conn:
+            # Documents sharing more bands are likelier to be similar, so they are compared first
+            candidates = conn.execute(
+                f"SELECT doc FROM bands WHERE key IN ({','.join('?' * len(keys))}) "
+                'GROUP BY doc ORDER BY COUNT(*) DESC, doc DESC LIMIT ?', (*keys, self.max_candidates)
+            ).fetchall()
+            best, best_score = None, self.threshold
+            rows = conn.execute(
+                f"SELECT id, signature FROM documents WHERE id IN ({','.join('?' * len(candidates))})",
+                [doc for (doc,) in candidates]
+            ).fetchall() if candidates else []
+            for doc, blob in rows:
+                stored = array('Q')
+                stored.frombytes(blob)
+                score = similarity(signature, stored)
+                if score >= best_score:
+                    best, best_score = doc, score
+            match = None
+            if best is not None:
+                result, chunks, clauses, headings, created = conn.execute(
+                    'SELECT result, chunks, clauses, headings, created FROM documents WHERE id = ?', (best,)
+                ).fetchone()
+                hashes = array('Q')
+                hashes.frombytes(clauses)
+                match = {
+                    'id': best,
+                    'similarity': round(best_score, 3),
+                    'result': zlib.decompress(result).decode('utf-8'),
+                    'chunks': chunks,
+                    'clause_hashes': hashes,
+                    'clause_headings': zlib.decompress(headings).decode('utf-8').split('\n'),
+                    'created': created,
+                }
+        with self._lock:
+            self.stats['lookups'] += 1
+            self.stats['candidates'] += len(candidates)
+            self.stats['lookup_seconds'] += time.perf_counter() - started
+            if match:
+                self.stats['hits'] += 1
+        return match
+
+    def add(self, scope, signature, hashes, headings, result, chunks=1):
+        """Store an analyzed document; returns its id"""
+        return self.add_many([(scope, signature, hashes, headings, result, chunks)])[0]
+
+    def add_many(self, entries):
+        """Store (scope, signature, clause_hashes, clause_headings, result, chunks) entries in one transaction"""
+        now = time.time()
+        ids = []
+        with self._connect() as conn:
+            for scope, signature, hashes, headings, result, chunks in entries:
+                cursor = conn.execute(
+                    'INSERT INTO documents (signature, clauses, headings, result, chunks, created) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (signature.tobytes(), hashes.tobytes(), zlib.compress('\n'.join(headings).encode('utf-8'), 6),
+                     zlib.compress(result.encode('utf-8'), 6), chunks, now)
+                )
+                doc = cursor.lastrowid
+                conn.executemany('INSERT OR IGNORE INTO bands (key, doc) VALUES (?, ?)',
+                                 ((key, doc) for key in self._band_keys(scope, signature)))
+                ids.append(doc)
+            # Ids only grow, so everything more than max_entries behind the newest is the oldest
+            cutoff = ids[-1] - self.max_entries
+            if cutoff > 0:
+                conn.execute('DELETE FROM bands WHERE doc <= ?', (cutoff,))
+                conn.execute('DELETE FROM documents WHERE id <= ?', (cutoff,))
+        with self._lock:
+            self.stats['stores'] += len(ids)
+        return ids
+
+    def clear(self):
+        """Remove every indexed document"""
+        with self._connect() as conn:
+            conn.execute('DELETE FROM bands')
+            conn.execute('DELETE FROM documents')
+
+    def get_stats(self):
+        """Lookup counters of this process and the size of the index"""
+        with self._connect() as conn:
+            entries = conn.execute('SELECT COUNT(*) FROM documents').fetchone()[0]
+        with self._lock:
+            stats = dict(self.stats)
+        lookups = stats['lookups']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        stats['avg_candidates'] = round(stats['candidates'] / lookups, 2) if lookups else 0.0
+        stats['avg_lookup_ms'] = round(1000 * stats.pop('lookup_seconds') / lookups, 3) if lookups else 0.0
+        stats['entries'] = entries
+        stats['threshold'] = self.threshold
+        stats['max_entries'] = self.max_entries
+        return stats
+
+
+def near_duplicate_index_from_env():
+    """Build the index from NEAR_DUPLICATE_* environment variables, or None if disabled"""
+    db_path = os.getenv('NEAR_DUPLICATE_DB', '')
+    if not db_path:
+        return None
+    return NearDuplicateIndex(
+        db_path=db_path,
+        threshold=float(os.getenv('NEAR_DUPLICATE_THRESHOLD', '0.85')),
+        max_entries=int(os.getenv('NEAR_DUPLICATE_MAX_ENTRIES', '200000')),
+        max_candidates=int(os.getenv('NEAR_DUPLICATE_MAX_CANDIDATES', '32')),
+    )
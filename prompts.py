@@ -0,0 +1,487 @@
+import hashlib
+
+LEGAL_CONTEXT = """
+        You are an AI Legal Assistant specializing in:
+        - Contract review and analysis
+        - Legal document drafting
+        - Case law research
+        - Legal advice and guidance
+        - Document summarization
+        - Compliance checking
+        
+        Always provide accurate, clear, and professional legal information.
+        Note: This is for informational purposes only and not a substitute for professional legal advice.
+        
+        Provide responses in well-structured format with clear headings and bullet points.
+        """
+
+# Prompt bodies; {text} / {requirements} marks where the user's input goes
+ANALYSIS_TEMPLATES = {
+    'contract_review': """
+            ACT AS AN EXPERT LEGAL ANALYST. Review this contract and provide a comprehensive analysis with the following sections:
+
+            ## CONTRACT REVIEW ANALYSIS
+            
+            ### 1. KEY TERMS AND CONDITIONS
+            - Identify and list all major terms
+            - Explain significant clauses
+            - Highlight financial terms and payment conditions
+            
+            ### 2. POTENTIAL RISKS AND RED FLAGS
+            - Unfavorable terms for either party
+            - Ambiguous language
+            - Missing standard clauses
+            - Potential legal conflicts
+            
+            ### 3. MISSING CLAUSES
+            - Essential clauses that should be included
+            - Industry-standard provisions
+            - Protective clauses for both parties
+            
+            ### 4. SUGGESTED IMPROVEMENTS
+            - Specific language recommendations
+            - Additional clauses to consider
+            - Negotiation points
+            
+            ### 5. OVERALL ASSESSMENT
+            - Risk level (Low/Medium/High)
+            - Recommendations for next steps
+            - Key focus areas for negotiation
+            
+            Contract text to analyze:
+            {text}
+    """,
+            
+    'document_summary': """
+            ACT AS A LEGAL PROFESSIONAL. Summarize this legal document with the following structure:
+
+            ## LEGAL DOCUMENT SUMMARY
+            
+            ### 1. MAIN PURPOSE AND PARTIES
+            - Primary objective of the document
+            - Parties involved and their roles
+            - Effective dates and duration
+            
+            ### 2. KEY OBLIGATIONS AND RIGHTS
+            - Main responsibilities of each party
+            - Rights granted to each party
+            - Key deliverables and expectations
+            
+            ### 3. IMPORTANT DEADLINES AND DATES
+            - Critical timelines
+            - Milestone dates
+            - Termination and renewal dates
+            
+            ### 4. TERMINATION CONDITIONS
+            - Grounds for termination
+            - Notice requirements
+            - Post-termination obligations
+            
+            ### 5. KEY LEGAL PROVISIONS
+            - Governing law and jurisdiction
+            - Dispute resolution mechanisms
+            - Confidentiality and intellectual property
+            
+            Document text:
+            {text}
+    """,
+            
+    'compliance_check': """
+            ACT AS A COMPLIANCE OFFICER. Analyze this document for compliance issues:
+
+            ## COMPLIANCE ANALYSIS REPORT
+            
+            ### 1. REGULATORY COMPLIANCE RISKS
+            - Potential regulatory violations
+            - Industry-specific compliance requirements
+            - Reporting and documentation obligations
+            
+            ### 2. DATA PROTECTION ISSUES
+            - GDPR/CCPA compliance assessment
+            - Data handling and storage concerns
+            - Privacy policy adequacy
+            
+            ### 3. CONTRACT LAW COMPLIANCE
+            - Contract formation validity
+            - Consideration and mutual assent
+            - Capacity and legality assessment
+            
+            ### 4. INDUSTRY-SPECIFIC REGULATIONS
+            - Relevant industry standards
+            - Licensing and certification requirements
+            - Professional standards compliance
+            
+            ### 5. RECOMMENDED COMPLIANCE MEASURES
+            - Immediate actions required
+            - Documentation improvements
+            - Monitoring and audit recommendations
+            
+            Document text:
+            {text}
+    """,
+            
+    'legal_advice': """
+            ACT AS A LEGAL ADVISOR. Provide general legal guidance on this situation:
+
+            ## LEGAL GUIDANCE ANALYSIS
+            
+            ### 1. RELEVANT LAWS AND REGULATIONS
+            - Applicable statutes and regulations
+            - Legal principles involved
+            - Jurisdictional considerations
+            
+            ### 2. POTENTIAL LEGAL STRATEGIES
+            - Available legal approaches
+            - Pros and cons of each strategy
+            - Recommended course of action
+            
+            ### 3. RIGHTS AND OBLIGATIONS
+            - Legal rights of involved parties
+            - Corresponding obligations
+            - Potential liabilities
+            
+            ### 4. RISK ASSESSMENT
+            - Legal risks involved
+            - Probability of success
+            - Potential consequences
+            
+            ### 5. NEXT STEPS TO CONSIDER
+            - Immediate actions to take
+            - Documentation to gather
+            - When to consult a licensed attorney
+            
+            Situation to analyze:
+            {text}
+    """
+}
+
+DRAFT_TEMPLATES = {
+    'nda': """
+            ACT AS A LEGAL DRAFTING EXPERT. Draft a comprehensive Non-Disclosure Agreement based on these requirements:
+
+            REQUIREMENTS PROVIDED:
+            {requirements}
+
+            DRAFT A COMPLETE NON-DISCLOSURE AGREEMENT INCLUDING:
+
+            1. PARTIES INFORMATION
+            - Full legal names and addresses
+            - Effective date
+            - Purpose of disclosure
+
+            2. DEFINITION OF CONFIDENTIAL INFORMATION
+            - Specific categories of protected information
+            - Exclusions from confidentiality
+            - Examples of confidential materials
+
+            3. OBLIGATIONS OF RECEIVING PARTY
+            - Duty to maintain confidentiality
+            - Permitted uses of information
+            - Security measures required
+            - Return/destruction of information
+
+            4. TERM AND TERMINATION
+            - Duration of confidentiality
+            - Termination conditions
+            - Survival of obligations
+
+            5. REMEDIES AND JURISDICTION
+            - Legal remedies for breach
+            - Injunctive relief provisions
+            - Governing law and jurisdiction
+            - Dispute resolution process
+
+            6. MISCELLANEOUS PROVISIONS
+            - Entire agreement clause
+            - Severability
+            - Notices
+            - Assignment restrictions
+
+            Provide the complete agreement in proper legal format with appropriate section headings.
+    """,
+            
+    'employment_contract': """
+            ACT AS AN EMPLOYMENT LAW SPECIALIST. Draft a comprehensive Employment Contract based on these requirements:
+
+            REQUIREMENTS PROVIDED:
+            {requirements}
+
+            DRAFT A COMPLETE EMPLOYMENT CONTRACT INCLUDING:
+
+            1. POSITION AND DUTIES
+            - Job title and description
+            - Reporting structure
+            - Primary responsibilities
+            - Work location requirements
+
+            2. COMPENSATION AND BENEFITS
+            - Salary and payment schedule
+            - Bonus structure if applicable
+            - Benefits package details
+            - Expense reimbursement
+
+            3. WORKING HOURS AND LOCATION
+            - Standard working hours
+            - Overtime policies
+            - Remote work provisions
+            - Travel requirements
+
+            4. CONFIDENTIALITY AND IP
+            - Confidentiality obligations
+            - Intellectual property assignment
+            - Non-compete provisions (if applicable)
+            - Non-solicitation clauses
+
+            5. TERMINATION CONDITIONS
+            - Notice periods
+            - Grounds for termination
+            - Severance provisions
+            - Return of company property
+
+            6. GENERAL PROVISIONS
+            - At-will employment statement (if applicable)
+            - Governing law
+            - Entire agreement clause
+            - Amendment procedures
+
+            Provide the complete contract in proper legal format.
+    """,
+            
+    'lease_agreement': """
+            ACT AS A REAL ESTATE ATTORNEY. Draft a comprehensive Residential Lease Agreement based on these requirements:
+
+            REQUIREMENTS PROVIDED:
+            {requirements}
+
+            DRAFT A COMPLETE RESIDENTIAL LEASE AGREEMENT INCLUDING:
+
+            1. PROPERTY DESCRIPTION
+            - Complete address and unit details
+            - Included furnishings and appliances
+            - Common areas and exclusive use spaces
+
+            2. LEASE TERM AND RENT
+            - Lease commencement and end dates
+            - Monthly rent amount and due date
+            - Late payment penalties
+            - Security deposit details
+
+            3. MAINTENANCE RESPONSIBILITIES
+            - Tenant maintenance obligations
+            - Landlord repair responsibilities
+            - Emergency procedures
+            - Alteration restrictions
+
+            4. HOUSE RULES AND REGULATIONS
+            - Occupancy limits
+            - Pet policies (if any)
+            - Noise restrictions
+            - Smoking policies
+
+            5. DEFAULT AND TERMINATION
+            - Default conditions
+            - Eviction procedures
+            - Early termination options
+            - Renewal procedures
+
+            6. LEGAL PROVISIONS
+            - Governing state law
+            - Notice requirements
+            - Security deposit return procedures
+            - Dispute resolution
+
+            Provide the complete lease agreement in proper legal format.
+    """,
+            
+    'service_agreement': """
+            ACT AS A CONTRACT LAW EXPERT. Draft a comprehensive Service Agreement based on these requirements:
+
+            REQUIREMENTS PROVIDED:
+            {requirements}
+
+            DRAFT A COMPLETE SERVICE AGREEMENT INCLUDING:
+
+            1. SERVICES TO BE PROVIDED
+            - Detailed description of services
+            - Performance standards
+            - Deliverables timeline
+            - Acceptance criteria
+
+            2. PAYMENT TERMS
+            - Fee structure and amounts
+            - Payment schedule
+            - Expense reimbursement
+            - Tax responsibilities
+
+            3. TIMELINE AND DELIVERABLES
+            - Project milestones
+            - Delivery dates
+            - Performance metrics
+            - Reporting requirements
+
+            4. INTELLECTUAL PROPERTY RIGHTS
+            - Pre-existing IP ownership
+            - New IP creation and ownership
+            - License grants
+            - IP protection obligations
+
+            5. LIABILITY AND INDEMNIFICATION
+            - Limitation of liability
+            - Indemnification provisions
+            - Insurance requirements
+            - Warranty disclaimers
+
+            6. TERM AND TERMINATION
+            - Agreement duration
+            - Termination for cause
+            - Termination for convenience
+            - Post-termination obligations
+
+            Provide the complete service agreement in proper legal format.
+    """
+}
+
+
+# Follow-up questions in a document session; {text} receives the earlier
+# conversation, the question and the relevant excerpts
+FOLLOW_UP_TEMPLATE = """
+            ACT AS AN EXPERT LEGAL ANALYST. Answer a follow-up question about a document you have
+            already reviewed for this user.
+
+            Use the excerpts of the document, your earlier findings and the earlier conversation below.
+            Refer to clauses by their numbers. If the excerpts do not contain the answer, say so
+            instead of guessing. Answer the question directly; do not repeat the full analysis.
+
+            {text}
+    """
+
+
+# Version comparison; {text} receives only the clauses that changed between
+# the two versions, each marked modified, added, removed or moved
+REDLINE_TEMPLATE = """
+            ACT AS AN EXPERT LEGAL ANALYST reviewing a redline between two versions of a contract.
+
+            Only the clauses that changed are shown below; every other clause is identical in both
+            versions. Assess the changes, not the contract as a whole.
+
+            1. SUMMARY OF CHANGES
+            - What changed, clause by clause, in plain language
+
+            2. RISK IMPACT
+            - For each change: which party it favours and whether it raises or lowers risk
+            - Rate each change HIGH, MEDIUM or LOW impact
+
+            3. NEW OR REMOVED PROTECTIONS
+            - Obligations, liabilities, rights or remedies introduced or lost
+            - Interactions between changes
+
+            4. RECOMMENDED RESPONSE
+            - Changes to accept, reject or counter, with suggested wording where useful
+
+            Refer to clauses by their numbers in the new version.
+
+            {text}
+    """
+
+
+# Near-duplicate re-analysis; {text} receives the earlier analysis of a
+# near-identical document and the clauses of the new document that differ
+NEAR_DUPLICATE_TEMPLATE = """
+            ACT AS AN EXPERT LEGAL ANALYST. You analyzed a document earlier. The new document is a
+            near-identical version of it, typically the same template with different parties, dates,
+            amounts or a few edited clauses.
+
+            Below are your earlier analysis and only the clauses of the new document that differ from
+            the earlier one; every other clause is identical. Rewrite the analysis so it is correct for
+            the new document: update names, dates, amounts and findings that come from the changed
+            clauses, add findings for new clauses and drop findings about clauses that were removed.
+            Keep the structure of the earlier analysis and return the complete updated analysis.
+
+            {text}
+    """
+
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token for English prose)"""
+    return estimate_tokens_for_length(len(text))
+
+
+def estimate_tokens_for_length(chars):
+    """estimate_tokens() of a text with this many characters"""
+    return (chars + 3) // 4
+
+
+class PromptTemplate:
+    """A prompt body split once around its input placeholder.
+
+    Rendering is a single concatenation of the precomputed head, the input and
+    the tail, so only the selected template is ever built for a request.
+    """
+
+    def __init__(self, kind, name, body, placeholder, prefix=""):
+        head, found, tail = body.partition(placeholder)
+        if not found:
+            raise ValueError(f"Template {kind}:{name} has no {placeholder} placeholder")
+        self.kind = kind
+        self.name = name
+        self.body_head = head
+        self.head = prefix + head
+        self.tail = tail
+        # Changes whenever the template text or the shared prefix changes,
+        # so it can be part of result cache keys
+        self.version = hashlib.sha256(f"{prefix}\0{body}".encode('utf-8')).hexdigest()[:12]
+        self.static_chars = len(self.head) + len(self.tail)
+        self.static_tokens = estimate_tokens(self.head) + estimate_tokens(self.tail)
+
+    def render(self, value):
+        """Full prompt text with value inserted at the placeholder"""
+        return f"{self.head}{value}{self.tail}"
+
+    def render_instructions(self, value):
+        """Template body without the shared prefix, for embedding in another prompt"""
+        return f"{self.body_head}{value}{self.tail}"
+
+    def describe(self):
+        return {
+            'kind': self.kind,
+            'name': self.name,
+            'version': self.version,
+            'static_chars': self.static_chars,
+            'static_tokens': self.static_tokens,
+        }
+
+
+class PromptRegistry:
+    """Analysis and drafting templates, built once at startup.
+
+    prefix is prepended to every template. It is the shared legal context,
+    unless the model already receives that as a system instruction, in which
+    case it is empty.
+    """
+
+    def __init__(self, prefix=""):
+        self.prefix = prefix
+        self.analysis = {
+            name: PromptTemplate('analysis', name, body, '{text}', prefix)
+            for name, body in ANALYSIS_TEMPLATES.items()
+        }
+        self.draft = {
+            name: PromptTemplate('draft', name, body, '{requirements}', prefix)
+            for name, body in DRAFT_TEMPLATES.items()
+        }
+        self.follow_up = PromptTemplate('session', 'follow_up', FOLLOW_UP_TEMPLATE, '{text}', prefix)
+        self.redline = PromptTemplate('compare', 'redline', REDLINE_TEMPLATE, '{text}', prefix)
+        self.near_duplicate = PromptTemplate('near_duplicate', 'update', NEAR_DUPLICATE_TEMPLATE, '{text}', prefix)
+
+    def analysis_template(self, analysis_type):
+        """Template for an analysis type, defaulting to the document summary"""
+        return self.analysis.get(analysis_type, self.analysis['document_summary'])
+
+    def draft_template(self, doc_type):
+        """Template for a document type, defaulting to the service agreement"""
+        return self.draft.get(doc_type, self.draft['service_agreement'])
+
+    def describe(self):
+        """Version and static size of every template"""
+        templates = (*self.analysis.values(), *self.draft.values(), self.follow_up, self.redline, self.near_duplicate)
+        return [template.describe() for template in templates]
@@ -0,0 +1,156 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text):
+    """Collapse whitespace so trivially different submissions share a cache entry"""
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def make_cache_key(text, kind, model_name, prompt_version):
+    """Hash the normalized input together with everything that affects the output"""
+    digest = hashlib.sha256()
+    for part in (kind, model_name, str(prompt_version), normalize_text(text)):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """Two-tier cache for model results: in-memory LRU plus optional SQLite file"""
+
+    def __init__(self, max_entries=256, ttl=3600, db_path=None, disk_max_entries=10000):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.db_path = db_path
+        self.disk_max_entries = disk_max_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+        if self.db_path:
+            with self._connect() as conn:
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute(
+                    'CREATE TABLE IF NOT EXISTS results '
+                    '(key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)'
+                )
+                conn.execute('CREATE INDEX IF NOT EXISTS results_created ON results (created)')
+
+    def _connect(self):
+        # One short-lived connection per call keeps this safe across threads and processes
+        return sqlite3.connect(self.db_path, timeout=5)
+
+    def get(self, key):
+        """Return the cached value for key, or None"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, created = entry
+                if now - created < self.ttl:
+                    self._memory.move_to_end(key)
+                    self.stats['memory_hits'] += 1
+                    return value
+                del self._memory[key]
+
+        if self.db_path:
+            try:
+                with self._connect() as conn:
+                    row = conn.execute(
+                        'SELECT value, created FROM results WHERE key = ?', (key,)
+                    ).fetchone()
+                if row and now - row[1] < self.ttl:
+                    value = json.loads(row[0])
+                    with self._lock:
+                        self._store_memory(key, value, row[1])
+                        self.stats['disk_hits'] += 1
+                    return value
+            except sqlite3.Error as e:
+                logger.error(f"Result cache read error: {e}")
+
+        with self._lock:
+            self.stats['misses'] += 1
+        return None
+
+    def set(self, key, value):
+        """Store a JSON-serializable value under key"""
+        now = time.time()
+        with self._lock:
+            self._store_memory(key, value, now)
+            self.stats['stores'] += 1
+
+        if self.db_path:
+            try:
+                with self._connect() as conn:
+                    conn.execute(
+                        'INSERT OR REPLACE INTO results (key, value, created) VALUES (?, ?, ?)',
+                        (key, json.dumps(value), now)
+                    )
+                    conn.execute('DELETE FROM results WHERE created < ?', (now - self.ttl,))
+                    conn.execute(
+                        'DELETE FROM results WHERE key IN (SELECT key FROM results '
+                        'ORDER BY created DESC LIMIT -1 OFFSET ?)', (self.disk_max_entries,)
+                    )
+            except sqlite3.Error as e:
+                logger.error(f"Result cache write error: {e}")
+
+    def _store_memory(self, key, value, created):
+        self._memory[key] = (value, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    def invalidate(self, key=None):
+        """Drop one entry, or everything when key is None; returns the number of memory entries removed"""
+        with self._lock:
+            if key is None:
+                removed = len(self._memory)
+                self._memory.clear()
+            else:
+                removed = 1 if self._memory.pop(key, None) is not None else 0
+
+        if self.db_path:
+            try:
+                with self._connect() as conn:
+                    if key is None:
+                        conn.execute('DELETE FROM results')
+                    else:
+                        conn.execute('DELETE FROM results WHERE key = ?', (key,))
+            except sqlite3.Error as e:
+                logger.error(f"Result cache invalidate error: {e}")
+        return removed
+
+    def get_stats(self):
+        """Hit/miss counters and current sizes"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats['memory_entries'] = len(self._memory)
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['memory_hits'] + stats['disk_hits']) / lookups, 4) if lookups else 0.0
+        if self.db_path:
+            try:
+                with self._connect() as conn:
+                    stats['disk_entries'] = conn.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+            except sqlite3.Error:
+                stats['disk_entries'] = None
+        return stats
+
+
+def result_cache_from_env():
+    """Build the result cache from RESULT_CACHE_* environment variables"""
+    return ResultCache(
+        max_entries=int(os.getenv('RESULT_CACHE_MAX_ENTRIES', '256')),
+        ttl=int(os.getenv('RESULT_CACHE_TTL', '3600')),
+        db_path=os.getenv('RESULT_CACHE_DB') or None,
+        disk_max_entries=int(os.getenv('RESULT_CACHE_DISK_MAX_ENTRIES', '10000')),
+    )
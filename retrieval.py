@@ -0,0 +1,108 @@
+import hashlib
+import math
+import re
+import threading
+from collections import Counter, OrderedDict, defaultdict
+
+from chunking import split_into_clauses
+from prompts import estimate_tokens
+
+TOKEN = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset("""
+a an and are as at be been by for from has have if in into is it its may of on or
+such that the their there these this those to under upon was were which who will
+with without shall any all each other than then thereof herein hereto hereunder
+what when where how can could should would does do did my our your i we you me us
+""".split())
+
+
+def _stem(word):
+    """Very light suffix stripping so 'terminates', 'terminated' and 'termination' meet"""
+    for suffix in ('ations', 'ation', 'ings', 'ing', 'ies', 'ed', 'es', 's'):
+        if len(word) > len(suffix) + 3 and word.endswith(suffix):
+            return word[:-len(suffix)]
+    return word
+
+
+def tokenize(text):
+    return [_stem(word) for word in TOKEN.findall(text.lower()) if word not in STOPWORDS]
+
+
+class ClauseIndex:
+    """BM25 inverted index over the clauses (or sections) of one document"""
+
+    def __init__(self, clauses, k1=1.5, b=0.75):
+        self.clauses = clauses
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(list)
+        self.lengths = []
+        for clause_id, clause in enumerate(self.clauses):
+            terms = Counter(tokenize(clause))
+            self.lengths.append(sum(terms.values()))
+            for term, freq in terms.items():
+                self.postings[term].append((clause_id, freq))
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+        count = len(self.clauses)
+        self.idf = {
+            term: math.log(1 + (count - len(posting) + 0.5) / (len(posting) + 0.5))
+            for term, posting in self.postings.items()
+        }
+
+    def search(self, query, k=10):
+        """Return [(clause_id, score)] for the k best-matching clauses"""
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for clause_id, freq in self.postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[clause_id] / (self.avg_length or 1))
+                scores[clause_id] += idf * freq * (self.k1 + 1) / (freq + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def select(self, query, token_budget, k=10):
+        """Best-matching clauses that fit in token_budget, returned in document order"""
+        selected = []
+        used = 0
+        for clause_id, _ in self.search(query, k):
+            tokens = estimate_tokens(self.clauses[clause_id])
+            if used + tokens > token_budget:
+                continue
+            selected.append(clause_id)
+            used += tokens
+        return sorted(selected)
+
+
+class ClauseIndexCache:
+    """LRU of clause indexes keyed by document hash, so follow-up questions skip re-indexing"""
+
+    def __init__(self, max_documents=64):
+        self.max_documents = max_documents
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, text):
+        key = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is not None:
+                self._indexes.move_to_end(key)
+                return index
+        index = ClauseIndex(split_into_clauses(text))
+        with self._lock:
+            self._indexes[key] = index
+            while len(self._indexes) > self.max_documents:
+                self._indexes.popitem(last=False)
+        return index
+
+
+def build_question_context(index, question, token_budget, k=10):
+    """Relevant excerpts for a question, labelled with their clause numbers.
+
+    Returns (context, clause_ids); context is empty when nothing matches.
+    """
+    clause_ids = index.select(question, token_budget, k)
+    context = "\n\n".join(f"[Clause {clause_id + 1}]\n{index.clauses[clause_id]}" for clause_id in clause_ids)
+    return context, clause_ids
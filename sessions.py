@@ -0,0 +1,146 @@
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from prompts import estimate_tokens
+
+# Characters of each earlier answer kept in the conversation summary
+ANSWER_EXCERPT_CHARS = 300
+MARKDOWN_HEADING_LINE = re.compile(r'^\s*#{1,6}\s.*$', re.MULTILINE)
+
+
+class SessionStore:
+    """Document sessions: extracted text, analysis results and a compact question history.
+
+    Sessions expire ttl seconds after their last use. The least recently used
+    sessions are evicted beyond max_sessions, or once the text, results and
+    history held by all sessions exceed max_bytes.
+    """
+
+    def __init__(self, max_sessions=1000, max_bytes=256 * 1024 * 1024, ttl=3600, max_turns=20):
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_turns = max_turns
+        self._sessions = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    @staticmethod
+    def _size(session):
+        # Characters are a close enough proxy for memory held by mostly-ASCII text
+        return (len(session['text'])
+                + sum(len(result) for result in session['results'].values())
+                + sum(len(turn['question']) + len(turn['answer']) for turn in session['turns']))
+
+    def create(self, filename, text):
+        """Start a session for an extracted document and return its id"""
+        now = time.time()
+        session = {
+            'id': uuid.uuid4().hex,
+            'filename': filename,
+            'text': text,
+            'results': {},
+            'turns': [],
+            'created': now,
+            'updated': now,
+        }
+        session['size'] = self._size(session)
+        with self._lock:
+            self._sessions[session['id']] = session
+            self._bytes += session['size']
+            self._evict(now)
+        return session['id']
+
+    def get(self, session_id):
+        """Return a copy of the session, or None if unknown or expired"""
+        now = time.time()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            if now - session['updated'] > self.ttl:
+                self._remove(session_id)
+                return None
+            session['updated'] = now
+            self._sessions.move_to_end(session_id)
+            copy = dict(session)
+            copy['results'] = dict(session['results'])
+            copy['turns'] = list(session['turns'])
+            return copy
+
+    def _change(self, session_id, apply):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return False
+            apply(session)
+            size = self._size(session)
+            self._bytes += size - session['size']
+            session['size'] = size
+            session['updated'] = time.time()
+            self._sessions.move_to_end(session_id)
+            self._evict(session['updated'])
+            return True
+
+    def add_result(self, session_id, analysis_type, result):
+        """Keep an analysis result with the session; False if the session is gone"""
+        return self._change(session_id, lambda session: session['results'].__setitem__(analysis_type, result))
+
+    def add_turn(self, session_id, question, answer):
+        """Record a follow-up question and its answer, keeping the last max_turns"""
+        def append(session):
+            session['turns'].append({'question': question, 'answer': answer, 'time': time.time()})
+            del session['turns'][:-self.max_turns]
+        return self._change(session_id, append)
+
+    def delete(self, session_id):
+        with self._lock:
+            if session_id not in self._sessions:
+                return False
+            self._remove(session_id)
+            return True
+
+    def _remove(self, session_id):
+        self._bytes -= self._sessions.pop(session_id)['size']
+
+    def _evict(self, now):
+        while self._sessions:
+            oldest_id, oldest = next(iter(self._sessions.items()))
+            if (len(self._sessions) <= self.max_sessions and self._bytes <= self.max_bytes
+                    and now - oldest['updated'] <= self.ttl):
+                break
+            self._remove(oldest_id)
+            self.evictions += 1
+
+    def get_stats(self):
+        with self._lock:
+            return {'sessions': len(self._sessions), 'bytes': self._bytes, 'evictions': self.evictions}
+
+
+def _answer_excerpt(answer, max_chars=ANSWER_EXCERPT_CHARS):
+    """Start of an answer without markdown headings, cut at a word boundary"""
+    text = ' '.join(MARKDOWN_HEADING_LINE.sub('', answer).split())
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars].rsplit(' ', 1)[0] + ' ...'
+
+
+def summarize_history(turns, max_tokens=600):
+    """Earlier questions with the start of each answer, most recent first to fit max_tokens.
+
+    Returned oldest first; an empty string when there are no turns.
+    """
+    entries = []
+    used = 0
+    for turn in reversed(turns):
+        entry = f"Q: {turn['question']}\nA: {_answer_excerpt(turn['answer'])}"
+        tokens = estimate_tokens(entry) + 1
+        if used + tokens > max_tokens:
+            break
+        entries.append(entry)
+        used += tokens
+    return "\n\n".join(reversed(entries))
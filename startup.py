@@ -0,0 +1,137 @@
+"""Cold-start bookkeeping: timed startup steps, background pre-warming and a startup profile.
+
+    python -m startup            # import the Flask app, then load everything it defers
+    python -m startup --asgi     # same for the ASGI app
+"""
+import argparse
+import importlib
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Load the deferred libraries and the model in a background thread once the
+# server is up, so the first real request does not pay for them
+PREWARM = os.getenv('PREWARM', '1').lower() in ('1', 'true', 'yes')
+
+# (phase, name, seconds) in the order the steps finished
+_steps = []
+_steps_lock = threading.Lock()
+_started = time.perf_counter()
+_prewarm_thread = None
+_prewarm_lock = threading.Lock()
+_prewarm_tasks = []
+
+
+@contextmanager
+def timed(phase, name):
+    """Record how long a startup step takes"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        with _steps_lock:
+            _steps.append((phase, name, time.perf_counter() - started))
+
+
+def steps():
+    with _steps_lock:
+        return list(_steps)
+
+
+def register_prewarm(name, func):
+    """Add a deferred-loading function for start_prewarm() to run"""
+    _prewarm_tasks.append((name, func))
+
+
+def _prewarm():
+    for name, func in _prewarm_tasks:
+        try:
+            with timed('prewarm', name):
+                func()
+        except Exception as e:
+            logger.error(f"Pre-warming {name} failed: {e}")
+    logger.info(f"Pre-warm finished {time.perf_counter() - _started:.2f}s after start")
+
+
+def start_prewarm():
+    """Run the registered pre-warm tasks once, in a daemon thread; no-op when PREWARM is off"""
+    global _prewarm_thread
+    if not PREWARM:
+        return
+    with _prewarm_lock:
+        if _prewarm_thread is None:
+            _prewarm_thread = threading.Thread(target=_prewarm, name='prewarm', daemon=True)
+            _prewarm_thread.start()
+
+
+def prewarm_state():
+    """'disabled', 'pending', 'running' or 'done'"""
+    if not PREWARM:
+        return 'disabled'
+    if _prewarm_thread is None:
+        return 'pending'
+    return 'running' if _prewarm_thread.is_alive() else 'done'
+
+
+def format_profile(rows):
+    """Render (phase, name, seconds) rows as an aligned table with per-phase totals"""
+    lines = [f"{'phase':<8} {'step':<32} {'ms':>9}"]
+    totals = {}
+    for phase, name, seconds in rows:
+        totals[phase] = totals.get(phase, 0.0) + seconds
+        lines.append(f"{phase:<8} {name:<32} {seconds * 1000:9.1f}")
+    lines.append("")
+    for phase, seconds in totals.items():
+        lines.append(f"{phase:<8} {'total':<32} {seconds * 1000:9.1f}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Print an import-time and init-time breakdown of server startup")
+    parser.add_argument('--asgi', action='store_true', help='profile asgi.py instead of app.py')
+    args = parser.parse_args(argv)
+
+    # Nothing is deferred to a background thread here; it is timed below instead
+    os.environ['PREWARM'] = '0'
+    # Run as a script this file is __main__; the app records into the imported module
+    import startup
+
+    rows = []
+    for module in ('flask', 'dotenv', 'chunking', 'prompts', 'compaction', 'compare', 'retrieval', 'draft_store',
+                   'export', 'extraction', 'extraction_cache', 'gemini_client', 'model_router', 'job_queue',
+                   'metrics', 'near_duplicate_index', 'result_cache', 'sessions'):
+        started = time.perf_counter()
+        importlib.import_module(module)
+        rows.append(('import', module, time.perf_counter() - started))
+    if args.asgi:
+        for module in ('starlette.applications', 'a2wsgi'):
+            started = time.perf_counter()
+            importlib.import_module(module)
+            rows.append(('import', module, time.perf_counter() - started))
+
+    started = time.perf_counter()
+    importlib.import_module('asgi' if args.asgi else 'app')
+    total = time.perf_counter() - started
+    init_steps = [step for step in startup.steps() if step[0] == 'init']
+    rows.extend(init_steps)
+    rows.append(('import', 'app (excluding init)', total - sum(step[2] for step in init_steps)))
+
+    # What lazy loading takes off the cold start
+    cold_start = sum(row[2] for row in rows)
+    for name, func in startup._prewarm_tasks:
+        started = time.perf_counter()
+        func()
+        rows.append(('deferred', name, time.perf_counter() - started))
+
+    print(format_profile(rows))
+    print(f"\ncold start (ready to accept requests): {cold_start * 1000:.1f} ms")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
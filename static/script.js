@@ -33,6 +33,57 @@ function showSuccess(message) {
     console.log('Success: ' + message);
 }
 
+// POST a form and dispatch the Server-Sent Events in the response to handlers by event name
+async function streamEvents(url, formData, handlers) {
+    const response = await fetch(url, {
+        method: 'POST',
+        body: formData
+    });
+
+    // Requests rejected before streaming starts (e.g. an upload over the size limit) get a JSON error
+    if (!response.ok) {
+        const data = await response.json().catch(() => ({ error: `Request failed (${response.status})` }));
+        showError(data.error);
+        return;
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        // Events are separated by a blank line
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const rawEvent = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let eventName = 'message';
+            let dataLines = [];
+            for (const line of rawEvent.split('\n')) {
+                if (line.startsWith('event: ')) {
+                    eventName = line.slice(7);
+                } else if (line.startsWith('data: ')) {
+                    dataLines.push(line.slice(6));
+                }
+            }
+            const data = dataLines.length ? JSON.parse(dataLines.join('\n')) : {};
+
+            if (eventName === 'error') {
+                showError(data.error);
+                return;
+            }
+            if (handlers[eventName]) {
+                handlers[eventName](data);
+            }
+        }
+    }
+}
+
 async function analyzeDocument() {
     const analysisType = document.getElementById('analysis_type').value;
     const text = document.getElementById('analyze_text').value;
@@ -48,6 +99,11 @@ async function analyzeDocument() {
 
     const formData = new FormData();
     formData.append('analysis_type', analysisType);
+
+    const question = document.getElementById('question').value;
+    if (analysisType === 'legal_advice' && question.trim()) {
+        formData.append('question', question);
+    }
     
     if (file) {
         formData.append('file', file);
@@ -56,18 +112,21 @@ async function analyzeDocument() {
     }
 
     try {
-        const response = await fetch('/analyze', {
-            method: 'POST',
-            body: formData
+        let result = '';
+        await streamEvents('/analyze/stream', formData, {
+            meta(data) {
+                displayAnalyzeResult({ analysis_type: analysisType, result: '', timestamp: 'in progress...' });
+            },
+            chunk(data) {
+                hideLoading();
+                result += data.text;
+                document.getElementById('analyze_content').textContent = result;
+            },
+            done(data) {
+                document.getElementById('result_time').textContent = `Analyzed: ${data.timestamp}`;
+                currentResultId = data.result_id;
+            }
         });
-
-        const data = await response.json();
-
-        if (data.success) {
-            displayAnalyzeResult(data);
-        } else {
-            showError(data.error);
-        }
     } catch (error) {
         showError('Network error: ' + error.message);
     } finally {
@@ -75,6 +134,12 @@ async function analyzeDocument() {
     }
 }
 
+// Id of the last generated draft, kept server-side for incremental revisions and downloads
+let currentDraftId = null;
+let currentDraftType = null;
+// Id of the last analysis result, kept server-side for downloads
+let currentResultId = null;
+
 async function draftDocument() {
     const docType = document.getElementById('doc_type').value;
     const requirements = document.getElementById('requirements').value;
@@ -85,24 +150,78 @@ async function draftDocument() {
     }
 
     showLoading();
+    // The previous draft can no longer be revised once a new one is generated
+    currentDraftId = null;
+    document.getElementById('revise_btn').classList.add('hidden');
 
     const formData = new FormData();
     formData.append('doc_type', docType);
     formData.append('requirements', requirements);
 
     try {
-        const response = await fetch('/draft', {
+        let result = '';
+        await streamEvents('/draft/stream', formData, {
+            meta(data) {
+                displayDraftResult({ doc_type: docType, result: '', timestamp: 'in progress...' });
+            },
+            chunk(data) {
+                hideLoading();
+                result += data.text;
+                document.getElementById('draft_content').textContent = result;
+            },
+            done(data) {
+                document.getElementById('draft_time').textContent = `Generated: ${data.timestamp}`;
+                currentDraftId = data.draft_id;
+                currentDraftType = docType;
+                document.getElementById('revise_btn').classList.toggle('hidden', !currentDraftId);
+            }
+        });
+    } catch (error) {
+        showError('Network error: ' + error.message);
+    } finally {
+        hideLoading();
+    }
+}
+
+async function reviseDraft() {
+    const requirements = document.getElementById('requirements').value;
+
+    if (!currentDraftId) {
+        showError('Generate a document before revising it.');
+        return;
+    }
+    if (!requirements.trim()) {
+        showError('Please provide requirements for the document.');
+        return;
+    }
+
+    showLoading();
+
+    const formData = new FormData();
+    formData.append('draft_id', currentDraftId);
+    formData.append('requirements', requirements);
+
+    try {
+        const response = await fetch('/draft/revise', {
             method: 'POST',
             body: formData
         });
-
         const data = await response.json();
 
-        if (data.success) {
-            displayDraftResult(data);
-        } else {
+        if (data.error) {
             showError(data.error);
+            return;
         }
+
+        currentDraftId = data.draft_id;
+        displayDraftResult(data);
+        const changed = data.changed_sections.map(section => section.heading).join(', ');
+        const summary = {
+            'unchanged': 'No requirement changes found',
+            'full': 'Regenerated the whole document',
+            'sections': `Revised ${data.changed_sections.length} of ${data.total_sections} sections: ${changed}`
+        };
+        document.getElementById('draft_time').textContent = `${summary[data.mode]} (${data.timestamp})`;
     } catch (error) {
         showError('Network error: ' + error.message);
     } finally {
@@ -172,7 +291,33 @@ async function copyToClipboard(elementId) {
     }
 }
 
-async function downloadDraft() {
+function downloadStored(id, format) {
+    // The server sends the file as an attachment, so the page stays put
+    const a = document.createElement('a');
+    a.style.display = 'none';
+    a.href = `/download/${encodeURIComponent(id)}?format=${format}`;
+    document.body.appendChild(a);
+    a.click();
+    document.body.removeChild(a);
+}
+
+function downloadAnalysis(format) {
+    if (!currentResultId) {
+        showError('Run an analysis first.');
+        return;
+    }
+    downloadStored(currentResultId, format);
+}
+
+async function downloadDraft(format = 'txt') {
+    if (currentDraftId) {
+        downloadStored(currentDraftId, format);
+        return;
+    }
+    if (format !== 'txt') {
+        showError('Generate the document again to download it in this format.');
+        return;
+    }
     const content = document.getElementById('draft_content').textContent;
     
     try {
@@ -217,6 +362,20 @@ document.getElementById('file_upload').addEventListener('change', function(e) {
     }
 });
 
+// The question field only applies to legal advice
+function toggleQuestion() {
+    const analysisType = document.getElementById('analysis_type').value;
+    document.getElementById('question_group').classList.toggle('hidden', analysisType !== 'legal_advice');
+}
+document.getElementById('analysis_type').addEventListener('change', toggleQuestion);
+
+// A stored draft is revised as its own document type, so the revise button
+// only applies while the selected type matches it
+document.getElementById('doc_type').addEventListener('change', function(e) {
+    const reviseButton = document.getElementById('revise_btn');
+    reviseButton.classList.toggle('hidden', !currentDraftId || e.target.value !== currentDraftType);
+});
+
 // Clear file input when text area is used
 document.getElementById('analyze_text').addEventListener('focus', function() {
     document.getElementById('file_upload').value = '';
@@ -226,6 +385,9 @@ document.getElementById('analyze_text').addEventListener('focus', function() {
 // Initialize the application
 document.addEventListener('DOMContentLoaded', function() {
     console.log('AI Legal Assistant initialized');
+
+    // Browsers may restore the selected analysis type on reload
+    toggleQuestion();
     
     // Add event listeners for Enter key in textareas
     document.getElementById('analyze_text').addEventListener('keydown', function(e) {
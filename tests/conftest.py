@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Tests import the top-level modules directly and keep the on-disk caches off
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['EXTRACTION_CACHE_DB'] = ''
+os.environ['NEAR_DUPLICATE_DB'] = ''
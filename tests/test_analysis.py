@@ -0,0 +1,75 @@
+import asyncio
+import random
+
+import pytest
+
+import app
+from benchmarks.fake_model import use_fake_model
+
+WORDS = 'party shall agreement term payment notice liability warranty breach remedy'.split()
+
+
+def contract(clauses, seed=0):
+    """A numbered contract of about 900 characters per clause"""
+    rng = random.Random(seed)
+    return '\n\n'.join(
+        f"{number}. Clause {number}\n" + ' '.join(rng.choice(WORDS) for _ in range(130)) + '.'
+        for number in range(1, clauses + 1)
+    )
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    # The prompt budget of gemini-2.5-flash
+    monkeypatch.setenv('PROMPT_TOKEN_BUDGET', '15000')
+    return use_fake_model(app.legal_assistant, latency=0.01, output_chars=2000)
+
+
+def test_200_page_contract_is_analyzed_in_full(fake):
+    text = contract(880)
+    assert len(text) > 800000
+    response = app.app.test_client().post('/analyze', data={'analysis_type': 'contract_review', 'text': text})
+    assert response.status_code == 200
+    assert response.json['success']
+    assert 1 < response.json['chunks'] <= app.ANALYSIS_MAX_CHUNKS
+    # One call per chunk and one to merge them
+    assert fake.calls == response.json['chunks'] + 1
+
+
+def test_chunks_fit_the_prompt_budget(fake):
+    chunk_size = app.legal_assistant.chunk_size('contract_review')
+    chunks = app.split_analysis_chunks(contract(200, seed=1), chunk_size)
+    for chunk in chunks:
+        prompt = app.legal_assistant._map_prompt(chunk, 'contract_review')
+        assert app.estimate_tokens(prompt) <= 15000
+
+
+def test_document_over_the_chunk_limit_is_rejected(fake, monkeypatch):
+    monkeypatch.setattr(app, 'ANALYSIS_CHUNK_SIZE', 10000)
+    response = app.app.test_client().post('/analyze', data={'analysis_type': 'contract_review',
+                                                            'text': contract(400, seed=2)})
+    assert response.status_code == 413
+    assert 'pages' in response.json['error']
+    assert fake.calls == 0
+
+
+def test_async_chunks_are_limited_per_request(fake, monkeypatch):
+    monkeypatch.setattr(app, 'ANALYSIS_CHUNK_SIZE', 10000)
+    monkeypatch.setattr(app, 'ANALYSIS_MAX_WORKERS', 3)
+    in_flight = peak = 0
+    generate = fake.generate_content_async
+
+    async def counted(prompt, **kwargs):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        try:
+            return await generate(prompt, **kwargs)
+        finally:
+            in_flight -= 1
+
+    fake.generate_content_async = counted
+    result, chunks = asyncio.run(app.legal_assistant.analyze_document_chunked_async(contract(100, seed=3), 'contract_review'))
+    assert chunks > 3
+    assert not app.is_error_result(result)
+    assert peak == 3
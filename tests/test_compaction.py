@@ -0,0 +1,37 @@
+from compaction import PAGE_BREAK, strip_noise
+
+
+def pages(*bodies, header=None, footer=True):
+    """Pages joined by form feeds, with an optional running header and a page number footer"""
+    result = []
+    for number, body in enumerate(bodies, 1):
+        lines = [header.format(page=number)] if header else []
+        lines.append(body)
+        if footer:
+            lines.append(f"Page {number} of {len(bodies)}")
+        result.append('\n'.join(lines))
+    return PAGE_BREAK.join(result)
+
+
+def test_running_header_and_page_numbers_are_removed():
+    text = pages(*(f"Clause {n} body text." for n in range(1, 7)), header="ACME CORP CONFIDENTIAL - Page {page}")
+    stripped = strip_noise(text)
+    # The first copy of the header is kept, like a title
+    assert stripped.count("ACME CORP CONFIDENTIAL") == 1
+    assert "Page 3 of 6" not in stripped
+    assert all(f"Clause {n} body text." in stripped for n in range(1, 7))
+
+
+def test_edge_body_lines_differing_by_a_page_number_are_kept():
+    bodies = ["see page 4 for the fee schedule", "The supplier delivers the goods.",
+              "see page 7 for the fee schedule", "The buyer pays on delivery.",
+              "see page 9 for the fee schedule", "Either party may terminate.",
+              "The agreement ends after a year.", "Notices are given in writing."]
+    stripped = strip_noise(pages(*bodies))
+    for body in bodies:
+        assert body in stripped
+
+
+def test_text_without_page_breaks_keeps_every_line():
+    text = "1. Term\n\n\nThe term is one year.\n3\nPage 2"
+    assert strip_noise(text) == "1. Term\n\nThe term is one year.\n3\nPage 2"
@@ -0,0 +1,41 @@
+from compare import compare_versions
+
+CLAUSES = {
+    'term': "1. Term\nThis agreement runs for one year from the effective date.",
+    'fees': "2. Fees\nThe customer pays the fees within thirty days of each invoice.",
+    'notice': "3. Notices\nNotices must be given in writing to the addresses above.",
+    'law': "4. Governing Law\nThis agreement is governed by the laws of Delaware.",
+}
+
+
+def document(*names):
+    return '\n\n'.join(CLAUSES[name] for name in names)
+
+
+def test_moved_clause_is_reported_once():
+    changes, stats = compare_versions(document('term', 'fees', 'notice', 'law'),
+                                      document('fees', 'notice', 'law', 'term'))
+    assert [change['type'] for change in changes] == ['moved']
+    assert (changes[0]['old_clause'], changes[0]['new_clause']) == (1, 4)
+    assert stats['moved'] == 1
+    assert stats['unchanged'] == 3
+
+
+def test_each_added_copy_pairs_with_one_removed_copy():
+    # Two copies of the notice clause are removed and only one comes back elsewhere
+    old = document('notice', 'term', 'notice', 'fees', 'law')
+    new = document('term', 'fees', 'law', 'notice')
+    changes, stats = compare_versions(old, new)
+    moved = [change for change in changes if change['type'] == 'moved']
+    removed = [change for change in changes if change['type'] == 'removed']
+    assert len(moved) == 1
+    assert moved[0]['new_clause'] == 4
+    assert [change['old_clause'] for change in removed] == [3]
+    assert stats['changed_tokens'] == (len(removed[0]['old']) + 3) // 4
+
+
+def test_modified_clause_is_paired():
+    new = document('term', 'fees', 'notice').replace('thirty', 'forty-five')
+    changes, _ = compare_versions(document('term', 'fees', 'notice'), new)
+    assert [change['type'] for change in changes] == ['modified']
+    assert changes[0]['old_clause'] == changes[0]['new_clause'] == 2
@@ -0,0 +1,203 @@
+import asyncio
+import threading
+
+import pytest
+
+import gemini_client
+from benchmarks.fake_model import FakeGenerativeModel, FakeResponse
+from gemini_client import GeminiClient, TokenBucket, UpstreamBusyError
+
+
+class QuotaError(Exception):
+    code = 429
+
+
+class BadRequest(Exception):
+    code = 400
+
+
+class RecordingRandom:
+    """Stands in for the random module in gemini_client, returning the middle of each range"""
+
+    def __init__(self):
+        self.ranges = []
+
+    def uniform(self, low, high):
+        self.ranges.append((low, high))
+        return (low + high) / 2
+
+
+class ScriptedModel(FakeGenerativeModel):
+    """Fake model whose first calls raise the given errors, in order"""
+
+    def __init__(self, errors=(), fail_after_first_chunk=False, **options):
+        options.setdefault('latency', 0.0)
+        options.setdefault('first_token', 0.0)
+        options.setdefault('output_chars', 200)
+        super().__init__(**options)
+        self.errors = list(errors)
+        self.fail_after_first_chunk = fail_after_first_chunk
+
+    def _maybe_fail(self):
+        if self.errors:
+            raise self.errors.pop(0)
+
+    def _stream(self, prompt, total):
+        if self.fail_after_first_chunk:
+            yield FakeResponse("partial ")
+            raise QuotaError("connection reset")
+        yield from super()._stream(prompt, total)
+
+
+def make_client(model, **options):
+    sleeps = []
+    options.setdefault('max_retries', 3)
+    client = GeminiClient(model, rpm=0, tpm=0, sleep=sleeps.append, **options)
+    return client, sleeps
+
+
+def test_retryable_errors_are_retried_with_full_jitter(monkeypatch):
+    jitter = RecordingRandom()
+    monkeypatch.setattr(gemini_client, 'random', jitter)
+    model = ScriptedModel(errors=[QuotaError("quota"), QuotaError("quota"), QuotaError("quota")])
+    client, sleeps = make_client(model, base_delay=1.0, max_delay=3.0)
+
+    assert client.generate("prompt").startswith("## ANALYSIS")
+    assert model.calls == 4
+    # Each delay is drawn from zero up to the capped exponential delay
+    assert jitter.ranges == [(0, 1.0), (0, 2.0), (0, 3.0)]
+    assert sleeps == [0.5, 1.0, 1.5]
+    assert client.get_stats() == {'calls': 4, 'retries': 3, 'coalesced': 0, 'errors': 0}
+
+
+def test_exhausted_rate_limit_raises_upstream_busy():
+    model = ScriptedModel(errors=[QuotaError("quota")] * 4)
+    client, sleeps = make_client(model)
+
+    with pytest.raises(UpstreamBusyError):
+        client.generate("prompt")
+    assert model.calls == 4
+    assert len(sleeps) == 3
+    assert client.get_stats()['errors'] == 1
+
+
+def test_non_retryable_errors_are_raised_at_once():
+    model = ScriptedModel(errors=[BadRequest("invalid argument")])
+    client, sleeps = make_client(model)
+
+    with pytest.raises(BadRequest):
+        client.generate("prompt")
+    assert model.calls == 1
+    assert sleeps == []
+
+
+def run_concurrently(function, count):
+    results = [None] * count
+
+    def run(index):
+        try:
+            results[index] = function()
+        except Exception as e:
+            results[index] = e
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_identical_concurrent_prompts_share_one_call():
+    model = ScriptedModel(latency=0.2)
+    client, _ = make_client(model)
+
+    results = run_concurrently(lambda: client.generate("same prompt"), 5)
+    assert model.calls == 1
+    assert len(set(results)) == 1
+    assert client.get_stats()['coalesced'] == 4
+    # The flight is gone once it lands, so the next caller makes a new call
+    client.generate("same prompt")
+    assert model.calls == 2
+
+
+def test_coalesced_callers_get_the_leaders_error():
+    model = ScriptedModel(errors=[BadRequest("invalid argument")], latency=0.2)
+    client, _ = make_client(model)
+
+    results = run_concurrently(lambda: client.generate("same prompt"), 3)
+    assert model.calls == 1
+    assert all(isinstance(result, BadRequest) for result in results)
+
+
+def test_coalesce_false_always_calls_upstream():
+    model = ScriptedModel(latency=0.1)
+    client, _ = make_client(model)
+
+    run_concurrently(lambda: client.generate("same prompt", coalesce=False), 3)
+    assert model.calls == 3
+
+
+def test_async_prompts_coalesce_and_share_errors():
+    model = ScriptedModel(latency=0.1)
+    client, _ = make_client(model)
+
+    async def both():
+        return await asyncio.gather(client.generate_async("prompt"), client.generate_async("prompt"))
+
+    first, second = asyncio.run(both())
+    assert first == second
+    assert model.calls == 1
+
+    model.errors = [BadRequest("invalid argument")]
+
+    async def failing():
+        return await asyncio.gather(client.generate_async("other"), client.generate_async("other"),
+                                    return_exceptions=True)
+
+    assert all(isinstance(result, BadRequest) for result in asyncio.run(failing()))
+    assert model.calls == 2
+
+
+def test_async_retries_and_maps_rate_limits(monkeypatch):
+    monkeypatch.setattr(gemini_client, 'random', RecordingRandom())
+    model = ScriptedModel(errors=[QuotaError("quota")] * 4)
+    client, _ = make_client(model, base_delay=0.01)
+
+    with pytest.raises(UpstreamBusyError):
+        asyncio.run(client.generate_async("prompt"))
+    assert model.calls == 4
+
+
+def test_stream_is_retried_before_the_first_chunk():
+    model = ScriptedModel(errors=[QuotaError("quota")])
+    client, sleeps = make_client(model)
+
+    text = ''.join(client.generate_stream("prompt"))
+    assert text == model._output("prompt")
+    assert model.calls == 2
+    assert len(sleeps) == 1
+
+
+def test_stream_is_not_retried_after_the_first_chunk():
+    model = ScriptedModel(fail_after_first_chunk=True)
+    client, sleeps = make_client(model)
+
+    chunks = []
+    with pytest.raises(UpstreamBusyError):
+        for chunk in client.generate_stream("prompt"):
+            chunks.append(chunk)
+    assert chunks == ["partial "]
+    assert model.calls == 1
+    assert sleeps == []
+
+
+def test_token_bucket_waits_for_refill_and_caps_large_requests():
+    bucket = TokenBucket(60)
+    assert bucket._reserve(60) == 0
+    # One token per second refills an empty bucket
+    assert bucket._reserve(2) == pytest.approx(2.0, abs=0.05)
+    # More than a minute's worth waits for a full bucket instead of forever
+    assert bucket._reserve(1000) == pytest.approx(60.0, abs=0.1)
+    bucket.consume(30)
+    assert bucket.tokens < 0
@@ -0,0 +1,163 @@
+import asyncio
+import time
+
+import pytest
+
+from benchmarks.fake_model import FakeGenerativeModel, FakeResponse
+from gemini_client import GeminiClient, UpstreamBusyError
+from model_router import ModelRouter, parse_routes
+
+
+class SlowFirstModel(FakeGenerativeModel):
+    """Fake model taking the given latencies for its first calls, then `latency`"""
+
+    def __init__(self, latencies=(), fail_after_first_chunk=False, **options):
+        options.setdefault('latency', 0.0)
+        options.setdefault('first_token', 0.0)
+        options.setdefault('output_chars', 100)
+        super().__init__(**options)
+        self.latencies = list(latencies)
+        self.fail_after_first_chunk = fail_after_first_chunk
+
+    def _latency(self):
+        return self.latencies.pop(0) if self.latencies else self.latency
+
+    def _stream(self, prompt, total):
+        if self.fail_after_first_chunk:
+            yield FakeResponse("partial ")
+            raise RuntimeError("stream reset")
+        yield from super()._stream(prompt, total)
+
+
+def make_router(models, **options):
+    """Router over named fake models; clients neither rate limit nor retry"""
+    return ModelRouter(
+        lambda name: GeminiClient(models[name], rpm=0, tpm=0, max_retries=0, sleep=lambda _: None),
+        'default',
+        **options
+    )
+
+
+def failing():
+    return FakeGenerativeModel(latency=0.0, first_token=0.0, error_rate=1.0)
+
+
+def test_prompts_go_to_the_model_for_their_task_and_size():
+    models = {'default': SlowFirstModel(), 'pro': SlowFirstModel(), 'lite': SlowFirstModel()}
+    router = make_router(models, routes=parse_routes('contract_review:large=pro;*:small=lite'))
+
+    router.generate('x' * 40000, 'contract_review')
+    router.generate('short prompt', 'contract_review')
+    router.generate('x' * 20000, 'legal_advice')
+    assert [models[name].calls for name in ('pro', 'lite', 'default')] == [1, 1, 1]
+
+
+def test_failed_calls_fall_back_along_the_chain():
+    models = {'default': failing(), 'second': failing(), 'last': SlowFirstModel()}
+    router = make_router(models, routes=parse_routes('contract_review=default|second'), fallback_model='last')
+
+    assert router.generate('prompt', 'contract_review').startswith('## ANALYSIS')
+    assert [models[name].calls for name in ('default', 'second', 'last')] == [1, 1, 1]
+    stats = router.get_stats()['models']
+    assert stats['default']['fallbacks'] == 1
+    assert stats['second']['fallbacks'] == 1
+    assert stats['last']['fallbacks'] == 0
+
+
+def test_last_error_is_raised_when_every_model_fails():
+    router = make_router({'default': failing(), 'backup': failing()}, fallback_model='backup')
+
+    with pytest.raises(UpstreamBusyError):
+        router.generate('prompt')
+    with pytest.raises(UpstreamBusyError):
+        asyncio.run(router.generate_async('prompt'))
+
+
+def test_async_calls_fall_back_too():
+    models = {'default': failing(), 'backup': SlowFirstModel()}
+    router = make_router(models, fallback_model='backup')
+
+    assert asyncio.run(router.generate_async('prompt')).startswith('## ANALYSIS')
+    assert models['backup'].calls == 1
+
+
+def test_stream_falls_back_before_its_first_chunk():
+    models = {'default': failing(), 'backup': SlowFirstModel()}
+    router = make_router(models, fallback_model='backup')
+
+    assert ''.join(router.generate_stream('prompt')) == models['backup']._output('prompt')
+    assert models['default'].calls == 1
+
+
+def test_stream_does_not_fall_back_after_its_first_chunk():
+    models = {'default': SlowFirstModel(fail_after_first_chunk=True), 'backup': SlowFirstModel()}
+    router = make_router(models, fallback_model='backup')
+
+    chunks = []
+    with pytest.raises(RuntimeError):
+        for chunk in router.generate_stream('prompt'):
+            chunks.append(chunk)
+    assert chunks == ['partial ']
+    assert models['backup'].calls == 0
+
+
+def warm_up(router, calls=10):
+    for number in range(calls):
+        router.generate(f'warm-up {number}')
+
+
+def test_call_slower_than_p95_is_hedged_and_the_hedge_wins():
+    model = SlowFirstModel(latency=0.01)
+    router = make_router({'default': model}, hedge=True, hedge_min_samples=10, hedge_min_delay=0.02,
+                         hedge_max_share=0.5, hedge_workers=4)
+    warm_up(router)
+
+    # The primary call takes 1s; the hedge sent after about 20ms answers first
+    model.latencies = [1.0]
+    started = time.perf_counter()
+    router.generate('slow prompt')
+    assert time.perf_counter() - started < 0.5
+    stats = router.get_stats()['models']['default']
+    assert stats['hedges'] == 1
+    assert stats['hedge_wins'] == 1
+
+
+def test_fast_calls_are_not_hedged():
+    model = SlowFirstModel(latency=0.01)
+    router = make_router({'default': model}, hedge=True, hedge_min_samples=10, hedge_min_delay=0.1,
+                         hedge_workers=4)
+    warm_up(router, 20)
+
+    assert router.get_stats()['models']['default']['hedges'] == 0
+    assert model.calls == 20
+
+
+def test_hedges_stay_under_the_max_share():
+    model = SlowFirstModel(latency=0.01)
+    router = make_router({'default': model}, hedge=True, hedge_min_samples=10, hedge_min_delay=0.01,
+                         hedge_max_share=0.1, hedge_workers=4)
+    warm_up(router)
+
+    # Every call is now slower than the p95 of the warm-up
+    model.latency = 0.05
+    for number in range(20):
+        router.generate(f'slow {number}')
+    stats = router.get_stats()['models']['default']
+    assert 1 <= stats['hedges'] <= 0.1 * stats['requests']
+    assert model.calls == stats['requests']
+
+
+def test_async_call_slower_than_p95_is_hedged():
+    model = SlowFirstModel(latency=0.01)
+    router = make_router({'default': model}, hedge=True, hedge_min_samples=10, hedge_min_delay=0.02,
+                         hedge_max_share=0.5)
+    warm_up(router)
+
+    async def slow_call():
+        model.latencies = [1.0]
+        started = time.perf_counter()
+        await router.generate_async('slow prompt')
+        return time.perf_counter() - started
+
+    assert asyncio.run(slow_call()) < 0.5
+    assert router.get_stats()['models']['default']['hedge_wins'] == 1
@@ -0,0 +1,22 @@
+import pytest
+
+import app
+from extraction import PageRangeError, parse_page_range
+
+
+def test_page_ranges_are_parsed():
+    assert parse_page_range('1-5, 8,10-') == [(0, 5), (7, 8), (9, None)]
+    assert parse_page_range('  ') is None
+
+
+@pytest.mark.parametrize('spec', ['abc', '1-x', '3-1', '0', '2,,y-4'])
+def test_invalid_page_ranges_are_rejected(spec):
+    with pytest.raises(PageRangeError, match='Invalid page range'):
+        parse_page_range(spec)
+
+
+@pytest.mark.parametrize('path', ['/analyze', '/analyze/stream', '/jobs/analyze', '/sessions'])
+def test_invalid_pages_field_is_a_client_error(path):
+    response = app.app.test_client().post(path, data={'text': 'The term is one year.', 'pages': 'abc'})
+    assert response.status_code == 400
+    assert response.json['error'] == 'Invalid page range: abc'
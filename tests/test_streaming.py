@@ -0,0 +1,74 @@
+import json
+
+import pytest
+
+import app
+from benchmarks.fake_model import use_fake_model
+from near_duplicate_index import NearDuplicateIndex
+from result_cache import result_cache_from_env
+
+CLAUSES = [
+    f"{number}. {title}\nThe {title.lower()} provisions of this agreement apply to both parties "
+    f"as set out in schedule {number}, including every notice, payment and remedy they describe."
+    for number, title in enumerate(
+        ['Term', 'Fees', 'Payment', 'Delivery', 'Warranty', 'Liability', 'Indemnity', 'Confidentiality',
+         'Termination', 'Notices', 'Assignment', 'Governing Law'], 1)
+]
+
+
+def events(response):
+    """(event, data) pairs of a Server-Sent Events response"""
+    result = []
+    for block in response.get_data(as_text=True).strip().split('\n\n'):
+        name, data = block.split('\n', 1)
+        result.append((name[len('event: '):], json.loads(data[len('data: '):])))
+    return result
+
+
+def stream(text, **fields):
+    response = app.app.test_client().post('/analyze/stream', data={'analysis_type': 'contract_review',
+                                                                  'text': text, **fields})
+    return dict(events(response))
+
+
+@pytest.fixture
+def fake(monkeypatch, tmp_path):
+    monkeypatch.setattr(app, 'near_duplicate_index', NearDuplicateIndex(str(tmp_path / 'near_duplicates.db')))
+    monkeypatch.setattr(app, 'result_cache', result_cache_from_env())
+    return use_fake_model(app.legal_assistant, latency=0.0, first_token=0.0, output_chars=300)
+
+
+def test_stream_reuses_the_analysis_of_a_near_duplicate(fake):
+    original = stream('\n\n'.join(CLAUSES))
+    assert original['meta']['near_duplicate'] is None
+    assert fake.calls == 1
+
+    # One clause reworded: the earlier analysis is updated for it instead of redone
+    changed = CLAUSES[:5] + [CLAUSES[5].replace('every notice', 'each written notice')] + CLAUSES[6:]
+    updated = stream('\n\n'.join(changed))
+    assert updated['meta']['near_duplicate']['mode'] == 'reanalyze'
+    assert updated['meta']['near_duplicate']['differing_clauses'] == [6]
+    assert 'done' in updated
+    assert fake.calls == 2
+
+    # The update is cached like any other result
+    again = stream('\n\n'.join(changed))
+    assert again['meta']['cached']
+    assert fake.calls == 2
+
+
+def test_stream_note_mode_returns_the_earlier_analysis(fake):
+    stream('\n\n'.join(CLAUSES))
+    changed = CLAUSES[:-1] + [CLAUSES[-1].replace('both parties', 'the parties')]
+    noted = stream('\n\n'.join(changed), near_duplicate='note')
+    assert noted['meta']['near_duplicate']['mode'] == 'note'
+    assert noted['chunk']['text'].startswith('NOTE: This analysis was reused')
+    assert fake.calls == 1
+
+
+def test_stream_off_mode_analyzes_in_full(fake):
+    stream('\n\n'.join(CLAUSES))
+    changed = CLAUSES[:-1] + [CLAUSES[-1].replace('both parties', 'the parties')]
+    full = stream('\n\n'.join(changed), near_duplicate='off')
+    assert full['meta']['near_duplicate'] is None
+    assert fake.calls == 2